@@ -2,9 +2,17 @@ import lls_resource_api as api
 
 __all__ = (
     api.CreateListPutResourceController,
+    api.ReplaceListPutResourceController,
+    api.ReloadListPutResourceController,
     api.DeleteListResourceController,
+    api.JobGetResourceController,
+    api.StatsGetResourceController,
     api.GetListByIdResourceController,
+    api.ListSnapshotGetResourceController,
     api.GetListMemberByIdResourceController,
+    api.ListMemberLookupPostResourceController,
+    api.MemberListsGetResourceController,
+    api.MembershipRulePostResourceController,
     api.ListStatusGetResourceController,
     api.ListMemberAppendPutResourceController,
     api.ListMemberDeletePutResourceController
@@ -26,6 +26,7 @@ def build_server():
     import configuration
     import flask
     import service_container
+    from app.services import clients, index_settings, workers
 
     flask_app = flask.Flask(__name__)
     container = service_container.ServiceContainer(flask_app)
@@ -34,6 +35,11 @@ def build_server():
     configuration.data = configuration.Container(**container.app.config['LIST_LOADING_SERVICE'])
     connect_lcp_context_to_app_context(flask_app)
     app_logging.install_required_root_formatter()
+    workers.ingestion_pool().start()
+    try:
+        index_settings.recover_abandoned_loads(clients.get_client())
+    except Exception:
+        logger.exception("Unable to recover abandoned bulk loads")
 
     return flask_app
 
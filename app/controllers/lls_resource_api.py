@@ -1,14 +1,15 @@
 import httplib
 import logging
-import multiprocessing
 import traceback
 
+import flask
 from restframework import controllers
 from werkzeug import exceptions as flask_errors
 
+import configuration
 from app import exceptions, models, services, operations
 from app.controllers import base
-from app.controllers.schemas import put_list, post_empty, append_list, delete_list
+from app.controllers.schemas import put_list, append_list, delete_list, callback, evaluate_membership, lookup_members
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +19,8 @@ class CreateListPutResourceController(base.BaseListResourceController, controlle
     __resource__ = '/lists/<service>/<list_id>'
 
     def __init__(self):
-        super(CreateListPutResourceController, self).__init__(schema=put_list.REQUEST)
+        super(CreateListPutResourceController, self).__init__(
+            schema=put_list.REQUEST, exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
         self.http_successful_response_status = httplib.ACCEPTED
 
     @property
@@ -29,7 +31,45 @@ class CreateListPutResourceController(base.BaseListResourceController, controlle
         request = models.Request(
             action=operations.ElasticSearchPermittedOperations.INDEX, url=self.request_url,
             **dict(request_model, **kwargs))
-        multiprocessing.Process(target=services.ElasticSearch().create_list, args=(request,)).start()
+        services.ElasticSearch().schedule_create_list(request)
+        return {}
+
+
+class ReplaceListPutResourceController(base.BaseListResourceController, controllers.PutResourceController):
+
+    __resource__ = '/lists/<service>/<list_id>/contents'
+
+    def __init__(self):
+        super(ReplaceListPutResourceController, self).__init__(
+            schema=put_list.REQUEST, exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
+        self.http_successful_response_status = httplib.ACCEPTED
+
+    @property
+    def resource_by_id_resource_controller(self):
+        return ReplaceListPutResourceController
+
+    def process_request_model(self, request_model, **kwargs):
+        request = models.Request(url=self.request_url, **dict(request_model, **kwargs))
+        services.ElasticSearch().schedule_replace_list(request)
+        return {}
+
+
+class ReloadListPutResourceController(base.BaseListResourceController, controllers.PutResourceController):
+
+    __resource__ = '/lists/<service>/<list_id>/reload'
+
+    def __init__(self):
+        super(ReloadListPutResourceController, self).__init__(
+            schema=put_list.REQUEST, exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
+        self.http_successful_response_status = httplib.ACCEPTED
+
+    @property
+    def resource_by_id_resource_controller(self):
+        return ReloadListPutResourceController
+
+    def process_request_model(self, request_model, **kwargs):
+        request = models.Request(url=self.request_url, **dict(request_model, **kwargs))
+        services.ElasticSearch().schedule_reload_list(request)
         return {}
 
 
@@ -55,17 +95,70 @@ class DeleteListResourceController(base.BaseListResourceController, controllers.
 
     def __init__(self):
         super(DeleteListResourceController, self).__init__(
-            schema=post_empty.REQUEST, exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
+            schema=callback.REQUEST, exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
         self.http_successful_response_status = httplib.ACCEPTED
 
     @property
     def resource_by_id_resource_controller(self):
         return GetListByIdResourceController
 
+    def add_links_to_response_payload(self, response_json, **kwargs):
+        response_json = super(DeleteListResourceController, self).add_links_to_response_payload(
+            response_json, **kwargs)
+        job_url = flask.url_for(JobGetResourceController.__name__.lower(), job_id=response_json['id'], _external=True)
+        response_json['links']['job'] = {'href': self.compute_resource_url(job_url)}
+        return response_json
+
     def process_request_model(self, request_model, **kwargs):
         request = models.Request(url=self.request_url, **dict(request_model, **kwargs))
-        response = services.ElasticSearch().delete_list(request)
-        return response
+        return services.ElasticSearch().schedule_delete_list(request)
+
+
+class JobGetResourceController(base.BaseListResourceController, controllers.GetResourceController):
+
+    __resource__ = '/jobs/<job_id>'
+
+    def __init__(self):
+        super(JobGetResourceController, self).__init__(exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
+
+    @property
+    def resource_by_id_resource_controller(self):
+        return JobGetResourceController
+
+    def get(self, **kwargs):
+        try:
+            request = models.Request(url=self.request_url, **kwargs)
+            response_model = services.ElasticSearch().get_job(request)
+        except Exception as e:
+            logger.exception("An error occurred in get job {} - {}".format(
+                kwargs.get('job_id'), traceback.format_exc()))
+            return self.translate_exceptions(e)
+        response_dict = self.create_restful_response_payload(response_model, **kwargs)
+        response_headers = self.create_response_headers(response_dict)
+        return response_dict, httplib.OK, response_headers
+
+
+class StatsGetResourceController(base.BaseListResourceController, controllers.GetResourceController):
+
+    __resource__ = '/stats'
+
+    def __init__(self):
+        super(StatsGetResourceController, self).__init__(exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
+
+    @property
+    def resource_by_id_resource_controller(self):
+        return StatsGetResourceController
+
+    def get(self, **kwargs):
+        try:
+            request = models.Request(url=self.request_url, **kwargs)
+            response_model = services.ElasticSearch().get_stats(request)
+        except Exception as e:
+            logger.exception("An error occurred in get stats - {}".format(traceback.format_exc()))
+            return self.translate_exceptions(e)
+        response_dict = self.create_restful_response_payload(response_model, **kwargs)
+        response_headers = self.create_response_headers(response_dict)
+        return response_dict, httplib.OK, response_headers
 
 
 class ListStatusGetResourceController(base.BaseListResourceController, controllers.GetResourceController):
@@ -92,6 +185,35 @@ class ListStatusGetResourceController(base.BaseListResourceController, controlle
         return response_dict, httplib.OK, response_headers
 
 
+class ListSnapshotGetResourceController(base.BaseListResourceController, controllers.GetResourceController):
+
+    __resource__ = '/lists/<service>/<list_id>/snapshot'
+
+    def __init__(self):
+        super(ListSnapshotGetResourceController, self).__init__(
+            exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
+
+    @property
+    def resource_by_id_resource_controller(self):
+        return ListSnapshotGetResourceController
+
+    def get(self, **kwargs):
+        try:
+            request = models.Request(url=self.request_url, format=flask.request.args.get('format', ''), **kwargs)
+            snapshot, etag = services.ElasticSearch().get_list_snapshot(request)
+        except (exceptions.SnapshotPendingError, exceptions.WorkerPoolFullError) as e:
+            response = self.translate_exceptions(e)
+            return response[0], response[1], {'Retry-After': str(configuration.data.SNAPSHOT_RETRY_AFTER_SECONDS)}
+        except Exception as e:
+            logger.exception(u"An error occurred in get snapshot of list {} - {}".format(
+                kwargs.get('list_id'), traceback.format_exc()))
+            return self.translate_exceptions(e)
+        # Answers 304 Not Modified when the client already has this snapshot.
+        response = flask.send_file(snapshot, mimetype='application/octet-stream', add_etags=False)
+        response.set_etag(etag)
+        return response.make_conditional(flask.request)
+
+
 class GetListMemberByIdResourceController(base.BaseListResourceController, controllers.GetResourceController):
 
     NOT_FOUND_DESCRIPTION = flask_errors.NotFound.description
@@ -117,6 +239,77 @@ class GetListMemberByIdResourceController(base.BaseListResourceController, contr
         response_headers = self.create_response_headers(response_dict)
         return response_dict, httplib.OK, response_headers
 
+    def head(self, service, list_id, member_id):
+        # Only the status code matters here, so the payload, its links and the JSON encoding are skipped.
+        try:
+            found = services.ElasticSearch().is_list_member(service, list_id, member_id)
+        except Exception as e:
+            logger.exception(u"An error occurred in head member {} for the list {} - {}".format(
+                member_id, list_id, traceback.format_exc()))
+            return self.translate_exceptions(e)
+        return '', httplib.OK if found else httplib.NOT_FOUND
+
+
+class MemberListsGetResourceController(base.BaseListResourceController, controllers.GetResourceController):
+
+    __resource__ = '/members/<service>/<member_id>/lists'
+
+    def __init__(self):
+        super(MemberListsGetResourceController, self).__init__(exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
+
+    @property
+    def resource_by_id_resource_controller(self):
+        return MemberListsGetResourceController
+
+    def get(self, **kwargs):
+        try:
+            request = models.Request(url=self.request_url, offset=flask.request.args.get('offset', 0, type=int),
+                                     limit=flask.request.args.get('limit', 0, type=int), **kwargs)
+            response_model = services.ElasticSearch().get_member_lists(request)
+        except Exception as e:
+            logger.exception(u"An error occurred in get lists of member {} - {}".format(
+                kwargs.get('member_id'), traceback.format_exc()))
+            return self.translate_exceptions(e)
+        response_dict = self.create_restful_response_payload(response_model, **kwargs)
+        response_headers = self.create_response_headers(response_dict)
+        return response_dict, httplib.OK, response_headers
+
+
+class MembershipRulePostResourceController(base.BaseListResourceController, controllers.PostResourceController):
+
+    __resource__ = '/lists/<service>/members/evaluate'
+
+    def __init__(self):
+        super(MembershipRulePostResourceController, self).__init__(
+            schema=evaluate_membership.REQUEST, exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
+        self.http_successful_response_status = httplib.OK
+
+    @property
+    def resource_by_id_resource_controller(self):
+        return MembershipRulePostResourceController
+
+    def process_request_model(self, request_model, **kwargs):
+        request = models.Request(url=self.request_url, **dict(request_model, **kwargs))
+        return services.ElasticSearch().evaluate_membership(request)
+
+
+class ListMemberLookupPostResourceController(base.BaseListResourceController, controllers.PostResourceController):
+
+    __resource__ = '/lists/<service>/<list_id>/members/lookup'
+
+    def __init__(self):
+        super(ListMemberLookupPostResourceController, self).__init__(
+            schema=lookup_members.REQUEST, exception_translations=exceptions.EXCEPTION_TRANSLATIONS)
+        self.http_successful_response_status = httplib.OK
+
+    @property
+    def resource_by_id_resource_controller(self):
+        return ListMemberLookupPostResourceController
+
+    def process_request_model(self, request_model, **kwargs):
+        request = models.Request(url=self.request_url, **dict(request_model, **kwargs))
+        return services.ElasticSearch().lookup_list_members(request)
+
 
 class ListMemberAppendPutResourceController(base.BaseListResourceController, controllers.PutResourceController):
 
@@ -0,0 +1,14 @@
+REQUEST = {
+    "id": "",
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "description": "Schema a request that only takes an optional callback URL",
+    "type": "object",
+    "properties": {
+        "callbackUrl": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 255
+        }
+    },
+    "additionalProperties": False,
+}
@@ -0,0 +1,27 @@
+REQUEST = {
+    "id": "",
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "description": "Schema a request for evaluating a membership rule over offer lists of a service",
+    "type": "object",
+    "required": ["accountNumbers"],
+    "properties": {
+        "accountNumbers": {
+            "type": "array",
+            "minItems": 1,
+            "items": {"type": "string", "minLength": 1, "maxLength": 255}
+        },
+        "allOf": {"$ref": "#/definitions/listIds"},
+        "anyOf": {"$ref": "#/definitions/listIds"},
+        "noneOf": {"$ref": "#/definitions/listIds"}
+    },
+    "anyOf": [{"required": ["allOf"]}, {"required": ["anyOf"]}, {"required": ["noneOf"]}],
+    "additionalProperties": False,
+    "definitions": {
+        "listIds": {
+            "type": "array",
+            "minItems": 1,
+            "maxItems": 50,
+            "items": {"type": "string", "minLength": 1, "maxLength": 255}
+        }
+    }
+}
@@ -0,0 +1,15 @@
+REQUEST = {
+    "id": "",
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "description": "Schema a request for looking up account numbers in an offer list",
+    "type": "object",
+    "required": ["accountNumbers"],
+    "properties": {
+        "accountNumbers": {
+            "type": "array",
+            "minItems": 1,
+            "items": {"type": "string", "minLength": 1, "maxLength": 255}
+        }
+    },
+    "additionalProperties": False,
+}
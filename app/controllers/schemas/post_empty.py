@@ -1,8 +0,0 @@
-REQUEST = {
-    "id": "",
-    "$schema": "http://json-schema.org/draft-04/schema#",
-    "description": "Schema a request that requires an empty POST body",
-    "type": "object",
-    "properties": {},
-    "additionalProperties": False,
-}
@@ -14,9 +14,33 @@ class TooManyAccountsSpecifiedError(Exception):
     pass
 
 
+class WorkerPoolFullError(Exception):
+
+    """ There are too many jobs pending on the worker pool. """
+    pass
+
+
+class UnsupportedSnapshotFormatError(Exception):
+
+    """ The requested snapshot format is not supported. """
+    pass
+
+
+class SnapshotPendingError(Exception):
+
+    """ The snapshot of the list is being built. """
+    pass
+
+
 EXCEPTION_TRANSLATIONS = {
     TooManyAccountsSpecifiedError: (httplib.BAD_REQUEST,
                                     errors.BAD_REQUEST, 'There are too many accounts specified.'),
+    WorkerPoolFullError: (httplib.SERVICE_UNAVAILABLE,
+                          'SERVICE_UNAVAILABLE', 'Too many lists are being processed, try again later.'),
+    UnsupportedSnapshotFormatError: (httplib.BAD_REQUEST,
+                                     errors.BAD_REQUEST, 'The snapshot format must be sorted or bloom.'),
+    SnapshotPendingError: (httplib.ACCEPTED,
+                           'ACCEPTED', 'The snapshot of the list is being built, try again later.'),
     Exception: (httplib.INTERNAL_SERVER_ERROR,
                 errors.INTERNAL_SERVER_ERROR, 'Internal server error.'),
     LookupError: (httplib.NOT_FOUND,
@@ -10,6 +10,14 @@ class Request(object):
         self.list_id = kwargs.get('list_id', '')
         self.member_id = kwargs.get('member_id', '')
         self.callbackUrl = kwargs.get('callbackUrl', '')
+        self.job_id = kwargs.get('job_id', '')
+        self.accountNumbers = kwargs.get('accountNumbers', [])
+        self.offset = kwargs.get('offset', 0)
+        self.limit = kwargs.get('limit', 0)
+        self.allOf = kwargs.get('allOf', [])
+        self.anyOf = kwargs.get('anyOf', [])
+        self.noneOf = kwargs.get('noneOf', [])
+        self.format = kwargs.get('format', '')
         self.action = kwargs.get('action', operations.ElasticSearchPermittedOperations.INDEX)
 
     def unwrap(self):
@@ -0,0 +1,282 @@
+import collections
+import contextlib
+import fcntl
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import struct
+import threading
+import time
+import uuid
+
+import configuration
+from app.services import bulk
+
+logger = logging.getLogger(__name__)
+
+FILTER_DIRECTORY = '.member_filters'
+LOCK_FILE = '.lock'
+PENDING_SUFFIX = '.pending'
+# Filters are sized for a quarter more members than the list had when they were built, so that members added
+# afterwards do not push the false positive rate over the configured one before the next rebuild.
+CAPACITY_HEADROOM = 1.25
+
+
+@contextlib.contextmanager
+def locked(directory):
+    """
+    Holds an exclusive lock on a directory, shared by every process using the volume, creating the directory first.
+    """
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class BloomFilter(object):
+
+    """
+    Set of member ids that may answer "maybe" for ids never added to it, but never "no" for an id that was.
+    """
+
+    def __init__(self, bit_count, hash_count, bits=None):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.bits = bits if bits is not None else bytearray((bit_count + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate):
+        capacity = max(int(math.ceil(capacity * CAPACITY_HEADROOM)), 1)
+        bit_count = max(int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)), 8)
+        hash_count = max(int(round(float(bit_count) / capacity * math.log(2))), 1)
+        return cls(bit_count, hash_count)
+
+    @property
+    def size(self):
+        return len(self.bits)
+
+    def _positions(self, member_id):
+        if isinstance(member_id, unicode):
+            member_id = member_id.encode('utf-8')
+        first, second = struct.unpack('<QQ', hashlib.md5(member_id).digest())
+        return [(first + i * second) % self.bit_count for i in xrange(self.hash_count)]
+
+    def add(self, member_id):
+        for position in self._positions(member_id):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, member_id):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(member_id))
+
+    def dumps(self):
+        return json.dumps({'bitCount': self.bit_count, 'hashCount': self.hash_count}) + '\n' + str(self.bits)
+
+    @classmethod
+    def loads(cls, data):
+        header, bits = data.split('\n', 1)
+        header = json.loads(header)
+        return cls(header['bitCount'], header['hashCount'], bytearray(bits))
+
+
+class FilterStore(object):
+
+    """
+    Bloom filters of the members of list types, kept as files on the upload volume so that the ingestion workers that
+    build them and every web process that reads them share them.
+
+    A filter is only consulted to answer "not a member" without asking Elastic Search; a type without a filter, or
+    whose filter would be bigger than `max_bytes`, is always looked up. Loaded filters are kept in memory, within
+    `max_bytes` in total, and reloaded when their file was replaced by another process. A filter only answers "not a
+    member" once its file was checked, so members added by other processes are never missed; answers that send the
+    lookup to Elastic Search anyway check the file at most every `check_interval` seconds. Members added while a filter
+    is being rebuilt are journaled to the rebuild's pending file, so the rebuilt filter includes them too.
+
+    Members are hashed by the `_id` of their document (see `bulk.document_id`), whatever type they were read as.
+    """
+
+    def __init__(self, directory, max_bytes, false_positive_rate, check_interval=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.false_positive_rate = false_positive_rate
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._filters = collections.OrderedDict()
+        self._bytes = 0
+
+    def _path(self, index, doc_type):
+        return os.path.join(self.directory, index, doc_type)
+
+    def _locked(self, index):
+        return locked(os.path.join(self.directory, index))
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'rb') as filter_file:
+                return BloomFilter.loads(filter_file.read())
+        except IOError:
+            return None
+
+    @staticmethod
+    def _write(path, bloom_filter):
+        temporary_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(temporary_path, 'wb') as filter_file:
+            filter_file.write(bloom_filter.dumps())
+        os.rename(temporary_path, path)
+
+    def _forget(self, key):
+        bloom_filter = self._filters.pop(key)[2]
+        if bloom_filter is not None:
+            self._bytes -= bloom_filter.size
+
+    def _expire(self, index, doc_type):
+        with self._lock:
+            if (index, doc_type) in self._filters:
+                self._forget((index, doc_type))
+
+    def _load(self, index, doc_type, check):
+        # Returns the filter of a type, or None when it has no usable filter, checking its file first when `check` is
+        # set or the last check is older than `check_interval`. Entries are [file id, time of the last check, filter].
+        key = (index, doc_type)
+        now = time.time()
+        with self._lock:
+            entry = self._filters.get(key)
+            if entry is not None and not check and now - entry[1] < self.check_interval:
+                self._filters[key] = self._filters.pop(key)
+                return entry[2]
+
+        path = self._path(index, doc_type)
+        try:
+            stat = os.stat(path)
+            file_id = (stat.st_ino, stat.st_mtime, stat.st_size)
+        except OSError:
+            file_id = None
+        with self._lock:
+            entry = self._filters.get(key)
+            if entry is not None and entry[0] == file_id:
+                entry[1] = now
+                self._filters[key] = self._filters.pop(key)
+                return entry[2]
+
+        bloom_filter = None
+        if file_id is not None and file_id[2] <= self.max_bytes:
+            bloom_filter = self._read(path)
+        with self._lock:
+            if key in self._filters:
+                self._forget(key)
+            self._filters[key] = [file_id, now, bloom_filter]
+            if bloom_filter is not None:
+                self._bytes += bloom_filter.size
+            while self._bytes > self.max_bytes:
+                self._forget(next(iter(self._filters)))
+        return bloom_filter
+
+    def might_contain(self, index, doc_type, member_id):
+        if not self.max_bytes:
+            return True
+        member_id = bulk.document_id(member_id)
+        bloom_filter = self._load(index, doc_type, check=False)
+        if bloom_filter is None or member_id in bloom_filter:
+            return True
+        bloom_filter = self._load(index, doc_type, check=True)
+        return bloom_filter is None or member_id in bloom_filter
+
+    def rebuild(self, index, doc_type, count, members):
+        """
+        Replaces the filter of a type with one holding `members`, an iterable of the `count` current members of the
+        type which must be read after this method is called.
+        """
+        if not self.max_bytes:
+            return
+        bloom_filter = BloomFilter.for_capacity(count, self.false_positive_rate)
+        if bloom_filter.size > self.max_bytes:
+            logger.info("Filter of /{}/{} would take {} bytes, not building it".format(
+                index, doc_type, bloom_filter.size))
+            self.discard(index, doc_type)
+            return
+
+        path = self._path(index, doc_type)
+        pending_path = '{}.{}{}'.format(path, uuid.uuid4().hex, PENDING_SUFFIX)
+        with self._locked(index):
+            open(pending_path, 'a').close()
+        try:
+            for member_id in members:
+                bloom_filter.add(member_id)
+            with self._locked(index):
+                with open(pending_path) as pending:
+                    for line in pending:
+                        bloom_filter.add(line.rstrip('\n'))
+                self._write(path, bloom_filter)
+        finally:
+            with self._locked(index):
+                os.remove(pending_path)
+            self._expire(index, doc_type)
+        logger.info("Built filter of /{}/{}: {} members in {} bytes".format(index, doc_type, count, bloom_filter.size))
+
+    def add(self, index, doc_type, member_ids):
+        if not self.max_bytes:
+            return
+        member_ids = [bulk.document_id(member_id) for member_id in member_ids]
+        path = self._path(index, doc_type)
+        with self._locked(index):
+            for pending_path in glob.glob('{}.*{}'.format(path, PENDING_SUFFIX)):
+                with open(pending_path, 'a') as pending:
+                    pending.writelines(u'{}\n'.format(member_id).encode('utf-8') for member_id in member_ids)
+            bloom_filter = self._read(path)
+            if bloom_filter is not None:
+                for member_id in member_ids:
+                    bloom_filter.add(member_id)
+                self._write(path, bloom_filter)
+        self._expire(index, doc_type)
+
+    def discard(self, index, doc_type):
+        """
+        Removes the filter of a type, so its members are looked up in Elastic Search until it is rebuilt.
+        """
+        if not self.max_bytes:
+            return
+        with self._locked(index):
+            try:
+                os.remove(self._path(index, doc_type))
+            except OSError:
+                pass
+        self._expire(index, doc_type)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'filters': sum(1 for entry in self._filters.itervalues() if entry[2] is not None),
+                'bytes': self._bytes
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FilterStore(
+                directory=os.path.join(configuration.data.VOLUME_MAPPINGS_FILE_UPLOAD_TARGET, FILTER_DIRECTORY),
+                max_bytes=configuration.data.MEMBERSHIP_BLOOM_FILTER_MAX_BYTES,
+                false_positive_rate=configuration.data.MEMBERSHIP_BLOOM_FILTER_FALSE_POSITIVE_RATE,
+                check_interval=configuration.data.MEMBERSHIP_BLOOM_FILTER_CHECK_INTERVAL_SECONDS)
+        return _store
+
+
+def reset():
+    global _store
+    with _store_lock:
+        _store = None
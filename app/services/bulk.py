@@ -0,0 +1,317 @@
+import collections
+import json
+import logging
+import random
+import threading
+import time
+from json import encoder as json_encoder
+from multiprocessing import pool as thread_pool
+
+from elasticsearch import exceptions, helpers, serializer
+
+import configuration
+from app import operations
+
+logger = logging.getLogger(__name__)
+
+TOO_MANY_REQUESTS = 429
+
+_serializer = serializer.JSONSerializer()
+
+
+def encode_value(value):
+    """
+    JSON encodes a single account number. Strings, the common case, skip the generic serializer and go straight to the
+    (C accelerated) string escaping routine; anything else (numbers, and the dates and decimals of spreadsheet cells)
+    goes through the Elastic Search JSON serializer.
+    """
+    if isinstance(value, basestring):
+        return json_encoder.encode_basestring_ascii(value)
+    return _serializer.dumps(value)
+
+
+def document_id(value):
+    """
+    Returns the `_id` of the document indexed for an account number: the account number itself for strings, otherwise
+    the text of its JSON value (e.g. `1234` for the number 1234, or the ISO format of a date).
+    """
+    if isinstance(value, basestring):
+        return value
+    encoded = _serializer.dumps(value)
+    return json.loads(encoded) if encoded.startswith('"') else encoded
+
+
+class BulkBodyEncoder(object):
+
+    """
+    Turns account numbers straight into NDJSON bulk request lines.
+
+    The action and source lines of a list document are fixed templates in which only the account number changes, so
+    each document is produced by string concatenation instead of building and serializing nested dictionaries.
+    """
+
+    def __init__(self, action, index, doc_type):
+        if action not in operations.ElasticSearchPermittedOperations.__all__:
+            raise ValueError("Incorrect action '{}' specified when executing a Elastic Bulk operation. Permitted "
+                             "actions : {}".format(action, operations.ElasticSearchPermittedOperations.__all__))
+        self._action_prefix = '{{"{}":{{"_index":{},"_type":{},"_id":'.format(
+            action, encode_value(index), encode_value(doc_type))
+        self._with_source = action != operations.ElasticSearchPermittedOperations.DELETE
+
+    def encode(self, account_number):
+        value = encode_value(account_number)
+        if self._with_source:
+            return self._action_prefix + value + '}}\n{"accountNumber":' + value + '}\n'
+        return self._action_prefix + value + '}}\n'
+
+    def chunks(self, account_numbers, sizer):
+        """
+        Yields lists of encoded documents holding at most `sizer.chunk_size` documents and `sizer.max_chunk_bytes`
+        bytes. The limits are read again for every chunk, so an adaptive sizer takes effect on the next request.
+        """
+        documents = []
+        size = 0
+        chunk_size, max_chunk_bytes = sizer.chunk_size, sizer.max_chunk_bytes
+        for account_number in account_numbers:
+            document = self.encode(account_number)
+            if documents and (len(documents) >= chunk_size or size + len(document) > max_chunk_bytes):
+                yield documents
+                documents = []
+                size = 0
+                chunk_size, max_chunk_bytes = sizer.chunk_size, sizer.max_chunk_bytes
+            documents.append(document)
+            size += len(document)
+
+        if documents:
+            yield documents
+
+
+class ChunkSizer(object):
+
+    """
+    Fixed bulk chunk limits: a number of documents and a byte budget per request.
+    """
+
+    def __init__(self, chunk_size, max_chunk_bytes):
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+
+    def record(self, documents, latency, rejected):
+        pass
+
+
+class AdaptiveChunkSizer(ChunkSizer):
+
+    """
+    Bulk chunk limits that follow the cluster's response.
+
+    Rejections halve the chunk size and responses slower than `target_latency` shrink it proportionally, while fast
+    responses to full chunks grow it by a quarter. The chunk size always stays between `min_chunk_size` and
+    `max_chunk_size`, and chunks never exceed the byte budget.
+    """
+
+    GROWTH_FACTOR = 1.25
+
+    def __init__(self, chunk_size, max_chunk_bytes, min_chunk_size, max_chunk_size, target_latency):
+        super(AdaptiveChunkSizer, self).__init__(
+            max(min_chunk_size, min(chunk_size, max_chunk_size)), max_chunk_bytes)
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_latency = target_latency
+        self._lock = threading.Lock()
+
+    def record(self, documents, latency, rejected):
+        with self._lock:
+            previous = self.chunk_size
+            if rejected:
+                self.chunk_size = previous // 2
+            elif latency > self.target_latency:
+                self.chunk_size = int(previous * self.target_latency / latency)
+            elif latency < self.target_latency / 2 and documents >= previous:
+                self.chunk_size = int(previous * self.GROWTH_FACTOR) + 1
+            self.chunk_size = max(self.min_chunk_size, min(self.chunk_size, self.max_chunk_size))
+
+        if self.chunk_size != previous:
+            logger.info("Bulk chunk size changed from {} to {} (latency: {:.3f}s, rejected: {})".format(
+                previous, self.chunk_size, latency, rejected))
+
+
+def chunk_sizer():
+    if not configuration.data.BULK_PROCESSING_ADAPTIVE_CHUNKING_ENABLED:
+        return ChunkSizer(configuration.data.BULK_PROCESSING_CHUNK_SIZE,
+                          configuration.data.BULK_PROCESSING_MAX_CHUNK_BYTES)
+    return AdaptiveChunkSizer(
+        configuration.data.BULK_PROCESSING_CHUNK_SIZE, configuration.data.BULK_PROCESSING_MAX_CHUNK_BYTES,
+        min_chunk_size=configuration.data.BULK_PROCESSING_MIN_CHUNK_SIZE,
+        max_chunk_size=configuration.data.BULK_PROCESSING_MAX_CHUNK_SIZE,
+        target_latency=configuration.data.BULK_PROCESSING_TARGET_LATENCY_SECONDS)
+
+
+def is_rejection(item):
+    details = item.values()[0]
+    return details.get('status') == TOO_MANY_REQUESTS or 'EsRejectedExecutionException' in str(details.get('error'))
+
+
+def _rejected_item(document, status, error):
+    # Builds the item of a document whose whole request was rejected, as found in a bulk response: keyed by the action
+    # of the document and holding its `_id`, decoded from its action line.
+    action, metadata = json.loads(document[:document.index('\n')]).items()[0]
+    return {action: {'_index': metadata['_index'], '_type': metadata['_type'], '_id': document_id(metadata['_id']),
+                     'status': status, 'error': error}}
+
+
+def _send(client, documents, index, doc_type, sizer):
+    # Returns the number of successful documents and (document, failed item) pairs, in request order.
+    start = time.time()
+    try:
+        response = client.bulk(''.join(documents), index=index, doc_type=doc_type)
+    except exceptions.TransportError as e:
+        if e.status_code != TOO_MANY_REQUESTS:
+            raise
+        if sizer:
+            sizer.record(len(documents), time.time() - start, len(documents))
+        return 0, [(document, _rejected_item(document, e.status_code, str(e.error))) for document in documents]
+
+    if not response.get('errors'):
+        failures = []
+    else:
+        failures = [(document, item) for document, item in zip(documents, response['items'])
+                    if not 200 <= item.values()[0].get('status', 500) < 300]
+    if sizer:
+        sizer.record(len(documents), time.time() - start, sum(1 for _, item in failures if is_rejection(item)))
+    return len(documents) - len(failures), failures
+
+
+def send(client, documents, index, doc_type, sizer=None, retry_policy=None):
+    """
+    Sends one chunk of encoded documents and returns the number of successful documents and the failed items. The
+    response time and rejections are reported to the sizer, when given.
+
+    With a retry policy, documents rejected by an overloaded cluster (429) are sent again, on their own, after a
+    jittered exponential backoff; other failures are returned straight away.
+    """
+    success, failures = _send(client, documents, index, doc_type, sizer)
+    errors = [item for _, item in failures if not is_rejection(item)]
+    retries = retry_policy.max_retries if retry_policy else 0
+
+    for attempt in xrange(retries):
+        rejected = [document for document, item in failures if is_rejection(item)]
+        if not rejected:
+            break
+        delay = retry_policy.delay(attempt)
+        logger.warning("{} document(s) rejected, retrying in {:.2f}s (attempt {} of {})".format(
+            len(rejected), delay, attempt + 1, retries))
+        time.sleep(delay)
+        retry_success, failures = _send(client, rejected, index, doc_type, sizer)
+        success += retry_success
+        errors.extend(item for _, item in failures if not is_rejection(item))
+
+    errors.extend(item for _, item in failures if is_rejection(item))
+    return success, errors
+
+
+class RetryPolicy(object):
+
+    """
+    Full jitter exponential backoff: the n-th retry waits a random time of up to `backoff * 2 ** n` seconds, capped
+    at `max_backoff`.
+    """
+
+    def __init__(self, max_retries, backoff, max_backoff):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def retry_policy():
+    return RetryPolicy(
+        max_retries=configuration.data.BULK_PROCESSING_MAX_RETRIES,
+        backoff=configuration.data.BULK_PROCESSING_RETRY_BACKOFF_SECONDS,
+        max_backoff=configuration.data.BULK_PROCESSING_RETRY_MAX_BACKOFF_SECONDS)
+
+
+class DeadLetterFile(object):
+
+    """
+    Streams the items that could not be indexed to a file, one JSON object per line holding the account number
+    (`_id`), the status and the error. The file is only created once the first failure is written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._descriptor = None
+
+    def write(self, items):
+        for item in items:
+            if self._descriptor is None:
+                logger.warning("Writing documents that failed to index to {}".format(self.path))
+                self._descriptor = open(self.path, 'w')
+            self._descriptor.write(json.dumps(item.values()[0]) + '\n')
+            self.count += 1
+
+    def close(self):
+        if self._descriptor is not None:
+            self._descriptor.close()
+            self._descriptor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _send_in_parallel(client, chunks, index, doc_type, thread_count, sizer, retry_policy):
+    # At most two chunks per thread are in flight, so a large file is never read ahead into memory.
+    pool = thread_pool.ThreadPool(thread_count)
+    pending = collections.deque()
+    try:
+        for documents in chunks:
+            pending.append(pool.apply_async(send, (client, documents, index, doc_type, sizer, retry_policy)))
+            if len(pending) >= 2 * thread_count:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def execute(client, chunks, index, doc_type, thread_count=None, sizer=None, retry_policy=None, dead_letter=None):
+    """
+    Sends every chunk, on `thread_count` threads when given, and returns the number of successful and failed documents.
+
+    Failed documents are written to the dead letter file when one is given; otherwise a `BulkIndexError` is raised as
+    soon as the chunk holding them has been processed.
+    """
+    if thread_count:
+        results = _send_in_parallel(client, chunks, index, doc_type, thread_count, sizer, retry_policy)
+    else:
+        results = (send(client, documents, index, doc_type, sizer, retry_policy) for documents in chunks)
+
+    success = 0
+    failed = 0
+    for chunk_success, errors in results:
+        if errors and dead_letter is None:
+            raise helpers.BulkIndexError('%i document(s) failed to index.' % len(errors), errors)
+        if errors:
+            dead_letter.write(errors)
+        success += chunk_success
+        failed += len(errors)
+    return success, failed
+
+
+def index_rows(client, rows, action, index, doc_type, dead_letter_path, thread_count=None):
+    """
+    Encodes and indexes every account number produced by `rows`, writing the documents that fail to
+    `dead_letter_path`. Returns the number of successful and failed documents.
+    """
+    encoder = BulkBodyEncoder(action=action, index=index, doc_type=doc_type)
+    sizer = chunk_sizer()
+    with DeadLetterFile(dead_letter_path) as dead_letter:
+        return execute(client, encoder.chunks(rows, sizer), index=index, doc_type=doc_type, thread_count=thread_count,
+                       sizer=sizer, retry_policy=retry_policy(), dead_letter=dead_letter)
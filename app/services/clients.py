@@ -1,4 +1,7 @@
+import httplib
 import logging
+import os
+import threading
 import traceback
 
 import elasticsearch
@@ -27,6 +30,41 @@ class Transport(elasticsearch.Transport):
             send_get_body_as=send_get_body_as, **kwargs)
 
 
+class _MappingCache(object):
+
+    """
+    Per process record of the (index, doc_type) pairs for which the index is known to exist and the account number
+    mapping has already been applied, so bulk requests don't repeat that setup for every chunk.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known = set()
+
+    def __contains__(self, key):
+        return key in self._known
+
+    def add(self, index, doc_type):
+        with self._lock:
+            self._known.add((index, doc_type))
+
+    def invalidate(self, index, doc_type=None):
+        with self._lock:
+            self._known = {(known_index, known_doc_type) for known_index, known_doc_type in self._known
+                           if known_index != index or (doc_type is not None and known_doc_type != doc_type)}
+
+    def clear(self):
+        with self._lock:
+            self._known = set()
+
+
+mappings = _MappingCache()
+
+
+def _is_index_missing(error):
+    return error.status_code == httplib.NOT_FOUND and 'IndexMissingException' in str(error.error)
+
+
 class ElasticSearchClient(elasticsearch.Elasticsearch):
 
     def __init__(self, **kwargs):
@@ -63,6 +101,80 @@ class ElasticSearchClient(elasticsearch.Elasticsearch):
 
     @client.query_params('consistency', 'refresh', 'routing', 'replication', 'timeout')
     def bulk(self, body, index=None, doc_type=None, params=None):
+        self.ensure_es_mapping(index, doc_type)
+        try:
+            return super(ElasticSearchClient, self).bulk(body, index=index, doc_type=doc_type, params=params)
+        except exceptions.TransportError as e:
+            if not _is_index_missing(e):
+                raise
+            logger.warning("Index {} disappeared, recreating it".format(index))
+            mappings.invalidate(index)
+            self.ensure_es_mapping(index, doc_type)
+            return super(ElasticSearchClient, self).bulk(body, index=index, doc_type=doc_type, params=params)
+
+    def ensure_es_mapping(self, index, doc_type):
+        if (index, doc_type) in mappings:
+            return
         self._create_es_index_if_required(index)
         self._create_es_mapping(index, doc_type)
-        return super(ElasticSearchClient, self).bulk(body, index=index, doc_type=doc_type, params=params)
+        mappings.add(index, doc_type)
+
+
+class _ClientRegistry(object):
+
+    """
+    Process wide registry holding one pooled client per process, so requests reuse keep-alive connections instead of
+    building a new transport and connection pool every time. A client inherited through a fork shares its sockets
+    with the parent process, so it is discarded and rebuilt in the child.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+
+    @staticmethod
+    def connection_pool_size():
+        return configuration.data.BULK_PROCESSING_THREAD_COUNT + configuration.data.WSGI_THREAD_COUNT
+
+    def get(self):
+        pid = os.getpid()
+        with self._lock:
+            if self._client is None or self._pid != pid:
+                self._client = ElasticSearchClient(maxsize=self.connection_pool_size())
+                self._pid = pid
+                logger.info("Created Elastic Search client with a connection pool of {} in process {}".format(
+                    self.connection_pool_size(), pid))
+            return self._client
+
+    def reset(self):
+        with self._lock:
+            self._client = None
+            self._pid = None
+
+    def stats(self):
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                return []
+            connections = self._client.transport.connection_pool.connections
+        return [
+            {
+                'host': connection.host,
+                'maxsize': connection.pool.pool.maxsize,
+                'available': connection.pool.pool.qsize(),
+                'connections': connection.pool.num_connections,
+                'requests': connection.pool.num_requests
+            }
+            for connection in connections
+        ]
+
+
+registry = _ClientRegistry()
+
+
+def get_client():
+    return registry.get()
+
+
+def pool_stats():
+    return registry.stats()
@@ -29,8 +29,9 @@ def elastic_search_callback(f):
 
     def wrapper(request):
         errors = False
+        result = None
         try:
-            f(request)
+            result = f(request)
         except Exception as e:
             errors = True
             logger.error('An error occurred when creating a new list: {}'.format(e.message))
@@ -49,6 +50,7 @@ def elastic_search_callback(f):
                     data['links']['member'] = {
                         'href': '/{}/{}/{{member-id}}'.format(request.service, request.list_id)
                     }
+                    data.update(result or {})
 
                 requests_wrapper.post(url=request.callbackUrl, data=json.dumps(data),
                                       headers=dict(context.get_headers(), **{'Content-Type': 'application/json'}))
@@ -0,0 +1,102 @@
+import httplib
+import logging
+import threading
+import time
+from multiprocessing import pool as thread_pool
+
+from elasticsearch import helpers
+
+import configuration
+from app import operations
+from app.services import bulk
+
+logger = logging.getLogger(__name__)
+
+SCAN_PAGE_SIZE = 1000
+
+
+def should_slice(document_count):
+    return (configuration.data.LIST_DELETE_PARALLELISM > 1 and
+            document_count >= configuration.data.LIST_SLICED_DELETE_MIN_DOCUMENTS)
+
+
+def shard_count(client, index):
+    return int(client.indices.get_settings(index=index)[index]['settings']['index']['number_of_shards'])
+
+
+def _shard_ids(client, index, doc_type, shard):
+    for hit in helpers.scan(client, query={"query": {"match_all": {}}}, index=index, doc_type=doc_type,
+                            size=SCAN_PAGE_SIZE, _source=False, preference='_shards:{}'.format(shard)):
+        yield hit['_id']
+
+
+class Throttle(object):
+
+    """
+    Spaces out bulk requests so that, across every thread sharing it, no more than `documents_per_second` documents
+    are sent. A rate of 0 does not throttle.
+    """
+
+    def __init__(self, documents_per_second):
+        self.documents_per_second = documents_per_second
+        self._lock = threading.Lock()
+        self._next = time.time()
+
+    def wait(self, documents):
+        if not self.documents_per_second:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + float(documents) / self.documents_per_second
+        if start > now:
+            time.sleep(start - now)
+
+
+def _delete_slice(client, index, doc_type, shard, sizer, retry_policy, throttle):
+    # The scan reads from a snapshot taken when it starts, so deleting the documents it returns is safe.
+    encoder = bulk.BulkBodyEncoder(action=operations.ElasticSearchPermittedOperations.DELETE, index=index,
+                                   doc_type=doc_type)
+    deleted = failed = 0
+    for documents in encoder.chunks(_shard_ids(client, index, doc_type, shard), sizer):
+        throttle.wait(len(documents))
+        success, errors = bulk.send(client, documents, index, doc_type, sizer, retry_policy)
+        missing = sum(1 for item in errors if item.values()[0].get('status') == httplib.NOT_FOUND)
+        deleted += success + missing
+        failed += len(errors) - missing
+    logger.info("Deleted {} documents of /{}/{} from shard {} ({} failed)".format(
+        deleted, index, doc_type, shard, failed))
+    return deleted, failed
+
+
+def _delete_slice_star(arguments):
+    return _delete_slice(*arguments)
+
+
+def delete_in_slices(client, index, doc_type, on_progress=None):
+    """
+    Deletes every document of a type by scanning each shard of the index separately and sending bulk delete requests
+    for the ids found. Shards are processed by `LIST_DELETE_PARALLELISM` threads, throttled together to
+    `LIST_DELETE_MAX_DOCUMENTS_PER_SECOND`. `on_progress` is called with the number of deleted documents each time a
+    shard is done. Returns the number of deleted and failed documents.
+    """
+    shards = shard_count(client, index)
+    thread_count = min(configuration.data.LIST_DELETE_PARALLELISM, shards)
+    logger.info("Deleting /{}/{} in {} slices on {} threads".format(index, doc_type, shards, thread_count))
+    sizer = bulk.chunk_sizer()
+    retry_policy = bulk.retry_policy()
+    throttle = Throttle(configuration.data.LIST_DELETE_MAX_DOCUMENTS_PER_SECOND)
+
+    pool = thread_pool.ThreadPool(thread_count)
+    deleted = failed = 0
+    try:
+        slices = [(client, index, doc_type, shard, sizer, retry_policy, throttle) for shard in xrange(shards)]
+        for slice_deleted, slice_failed in pool.imap_unordered(_delete_slice_star, slices):
+            deleted += slice_deleted
+            failed += slice_failed
+            if on_progress:
+                on_progress(deleted)
+    finally:
+        pool.terminate()
+        pool.join()
+    return deleted, failed
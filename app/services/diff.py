@@ -0,0 +1,122 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from app.services import bulk
+
+logger = logging.getLogger(__name__)
+
+
+def encode_key(account_number):
+    """
+    Returns the line an account number is sorted and compared by: the JSON string of the `_id` of its document (see
+    `bulk.document_id`), as Elastic Search keeps document ids as strings (the account number 12345 of a spreadsheet is
+    stored as the id "12345").
+    """
+    return bulk.encode_value(bulk.document_id(account_number)) + '\n'
+
+
+def decode_key(line):
+    return json.loads(line)
+
+
+def _unique(lines):
+    previous = None
+    for line in lines:
+        if line != previous:
+            yield line
+            previous = line
+
+
+class ListDiff(object):
+
+    """
+    Compares the current members of a list with a new upload in bounded memory, using an external merge sort.
+
+    Each side is cut into runs of at most `run_size` account numbers which are sorted in memory and written to a
+    temporary file, then the runs are merged into a single sorted file without duplicates. Walking both sorted files
+    side by side gives the added, removed and unchanged account numbers. Temporary files are removed on exit.
+    """
+
+    def __init__(self, run_size, directory=None):
+        self.run_size = run_size
+        self.directory = directory
+        self.workspace = None
+
+    def __enter__(self):
+        self.workspace = tempfile.mkdtemp(prefix='list_diff_', dir=self.directory)
+        return self
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.workspace, ignore_errors=True)
+
+    def _path(self, name):
+        return os.path.join(self.workspace, name)
+
+    def sort(self, account_numbers, name):
+        """
+        Writes the sorted, unique keys of `account_numbers` to a file of the workspace and returns its path.
+        """
+        keys = (encode_key(account_number) for account_number in account_numbers)
+        runs = []
+        while True:
+            run_keys = sorted(set(itertools.islice(keys, self.run_size)))
+            if not run_keys:
+                break
+            runs.append(self._path('{}.run{}'.format(name, len(runs))))
+            with open(runs[-1], 'wb') as descriptor:
+                descriptor.writelines(run_keys)
+
+        path = self._path(name)
+        if not runs:
+            open(path, 'wb').close()
+            return path
+        if len(runs) == 1:
+            os.rename(runs[0], path)
+            return path
+
+        logger.info("Merging {} sorted runs of {}".format(len(runs), name))
+        descriptors = [open(run, 'rb') for run in runs]
+        try:
+            with open(path, 'wb') as descriptor:
+                descriptor.writelines(_unique(heapq.merge(*descriptors)))
+        finally:
+            for run_path, run_descriptor in zip(runs, descriptors):
+                run_descriptor.close()
+                os.remove(run_path)
+        return path
+
+    def compare(self, current_path, new_path):
+        """
+        Walks two sorted key files, writing the keys only found in the new one to the `added` file and those only
+        found in the current one to the `removed` file. Returns both paths and the number of added, removed and
+        unchanged account numbers.
+        """
+        added_path, removed_path = self._path('added'), self._path('removed')
+        added = removed = unchanged = 0
+        with open(current_path, 'rb') as current, open(new_path, 'rb') as new, \
+                open(added_path, 'wb') as added_file, open(removed_path, 'wb') as removed_file:
+            current_key, new_key = next(current, None), next(new, None)
+            while current_key is not None or new_key is not None:
+                if new_key is None or (current_key is not None and current_key < new_key):
+                    removed_file.write(current_key)
+                    removed += 1
+                    current_key = next(current, None)
+                elif current_key is None or new_key < current_key:
+                    added_file.write(new_key)
+                    added += 1
+                    new_key = next(new, None)
+                else:
+                    unchanged += 1
+                    current_key, new_key = next(current, None), next(new, None)
+        return added_path, removed_path, {'added': added, 'removed': removed, 'unchanged': unchanged}
+
+
+def read_keys(path):
+    with open(path, 'rb') as descriptor:
+        for line in descriptor:
+            yield decode_key(line)
@@ -1,86 +1,147 @@
 import collections
+import functools
 import httplib
 import logging
 import os
 
-from elasticsearch import helpers, exceptions
+from elasticsearch import exceptions, helpers
 
 import configuration
 from app import exceptions as app_exceptions, operations
-from app.services import clients, readers, decorators
+from app.services import (bloom, bulk, clients, decorators, deletion, diff, generations, index_settings, jobs,
+                          membership, readers, sharding, snapshots, workers)
 
 import backoff
 
 logger = logging.getLogger(__name__)
 
+FAILED_DOCUMENTS_FILE_SUFFIX = '.failed'
+SCAN_PAGE_SIZE = 1000
+
+
+def _create_list_job(request):
+    ElasticSearchService.create_list(request)
+
+
+def _replace_list_job(request):
+    ElasticSearchService.replace_list(request)
+
+
+def _reload_list_job(request):
+    # Retired generations (the replaced one, or the staging one of a failed reload) are deleted after the callback.
+    ElasticSearchService.reload_list(request)
+    ElasticSearchService.purge_retired_generations(request)
+
+
+def _delete_list_job(request):
+    ElasticSearchService.run_delete_list_job(request)
+
+
+def _rebuild_member_filter_job(index, doc_type):
+    _rebuild_member_filter(clients.get_client(), index, doc_type)
+
+
+def _build_snapshots_job(index, doc_type):
+    _build_snapshots(clients.get_client(), index, doc_type)
+
+
+def _invalidate_members(request, *args):
+    # Also used as the completion callback of jobs, which the worker pool runs in this process with the job's result.
+    membership.cache().invalidate(request.service, request.list_id)
+    generations.cache().invalidate(request.service, request.list_id)
 
-class _ElasticSearchDocument(object):
-
-    def __init__(self, action, index, type, account_number):
-        self.action = action
-        if self.action not in operations.ElasticSearchPermittedOperations.__all__:
-            raise ValueError("Incorrect action '{}' specified when executing a Elastic Bulk operation. Permitted "
-                             "actions : {}".format(action, operations.ElasticSearchPermittedOperations.__all__))
-        self.index = index
-        self.type = type
-        self.account_number = account_number
-
-    @property
-    def doc(self):
-        es_document = {
-            "_op_type": self.action,
-            "_index": self.index,
-            "_type": self.type,
-            "_id": self.account_number,
-            "_source": {
-                "accountNumber": self.account_number
-            }
-        }
-        if self.action == operations.ElasticSearchPermittedOperations.DELETE:
-            del es_document["_source"]
-        return es_document
+
+def _list_members(client, index, doc_type):
+    try:
+        for hit in helpers.scan(client, query={"query": {"match_all": {}}}, index=index, doc_type=doc_type,
+                                size=SCAN_PAGE_SIZE, _source=False):
+            yield hit['_id']
+    except exceptions.TransportError as e:
+        if e.status_code != httplib.NOT_FOUND:
+            raise
+
+
+def _rebuild_member_filter(client, index, doc_type):
+    # A type whose filter could not be rebuilt is left without one, so its members are looked up in Elastic Search.
+    try:
+        count = client.count(index=index, doc_type=doc_type)['count']
+        bloom.store().rebuild(index, doc_type, count, _list_members(client, index, doc_type))
+    except Exception:
+        logger.exception("Unable to build the member filter of /{}/{}".format(index, doc_type))
+        bloom.store().discard(index, doc_type)
+
+
+def _add_to_member_filter(index, doc_type, members):
+    # Runs once the members are written, so a failure must not fail the request; the filter is dropped instead, as it
+    # would otherwise answer "not a member" for them, and rebuilt in the background.
+    try:
+        bloom.store().add(index, doc_type, members)
+    except Exception:
+        logger.exception("Unable to add members to the member filter of /{}/{}, discarding it".format(index, doc_type))
+        try:
+            bloom.store().discard(index, doc_type)
+        except Exception:
+            logger.exception("Unable to discard the member filter of /{}/{}".format(index, doc_type))
+        _schedule_rebuild(_rebuild_member_filter_job, index, doc_type)
+
+
+def _build_snapshots(client, index, doc_type):
+    # Snapshots that could not be built are built by the next download instead.
+    try:
+        snapshots.store().build(index, doc_type, _list_members(client, index, doc_type))
+    except Exception:
+        logger.exception("Unable to build the snapshots of /{}/{}".format(index, doc_type))
+
+
+def _schedule_rebuild(job, index, doc_type):
+    try:
+        workers.ingestion_pool().submit(job, index, doc_type)
+    except app_exceptions.WorkerPoolFullError:
+        logger.warning("Not scheduling {} for /{}/{}".format(job.__name__, index, doc_type))
 
 
 class ElasticSearchService(object):
 
+    @staticmethod
+    def schedule_create_list(request):
+        logger.info("Scheduling creation of list /{}/{}".format(request.service, request.list_id))
+        _invalidate_members(request)
+        workers.ingestion_pool().submit(
+            _create_list_job, request, callback=functools.partial(_invalidate_members, request))
+
     @staticmethod
     @decorators.elastic_search_callback
     @decorators.upload_cleanup
-    def create_list(request, stats_only=True):
+    def create_list(request):
         logger.info("Creating a new list Params: {}".format(request.unwrap()))
         file_path = os.path.join(configuration.data.VOLUME_MAPPINGS_FILE_UPLOAD_TARGET, request.filePath)
         file_reader = readers.BulkAccountsFileReaders.get(file_path)
+        elastic_search_client = clients.get_client()
+        doc_type = generations.resolve(elastic_search_client, request.service, request.list_id)
+        bloom.store().discard(request.service, doc_type)
+        snapshots.store().invalidate(request.service, doc_type)
+        result = ElasticSearchService._index_file(elastic_search_client, file_reader, file_path, request, doc_type)
+        _rebuild_member_filter(elastic_search_client, request.service, doc_type)
+        return result
 
-        actions = (
-            _ElasticSearchDocument(
-                action=request.action, index=request.service, type=request.list_id, account_number=line).doc
-            for line in file_reader.get_rows()
-        )
-
-        logger.info("Bulk indexing file using index: {}, type: {}".format(request.service, request.list_id))
-        elastic_search_client = clients.ElasticSearchClient()
-
-        returned_results = (None, None) if stats_only else ()
-        if configuration.data.LIST_PARALLEL_BULK_PROCESSING_ENABLED:
-            # Why did we use collections.deque(..)?. helpers.parallel bulk(..) is a generator, meaning it is lazy and
-            # won't produce any results until you start consuming them. If you don't care about the results
-            # (which by default you don't have to since any error will cause an exception) you can use the consume
-            # function from itertools recipes (https://docs.python.org/2/library/itertools.html#recipes)
-            # Source
-            #   https://discuss.elastic.co/t/helpers-parallel-bulk-in-python-not-working/39498
-            collections.deque(
-                helpers.parallel_bulk(
-                    elastic_search_client, actions, thread_count=configuration.data.BULK_PROCESSING_THREAD_COUNT,
-                    chunk_size=configuration.data.BULK_PROCESSING_CHUNK_SIZE, index=request.service,
-                    doc_type=request.list_id),
-                maxlen=0)
-        else:
-            returned_results = helpers.bulk(
-                elastic_search_client, actions, stats_only=stats_only,
-                chunk_size=configuration.data.BULK_PROCESSING_CHUNK_SIZE, index=request.service,
-                doc_type=request.list_id)
+    @staticmethod
+    def _index_file(elastic_search_client, file_reader, file_path, request, doc_type):
+        logger.info("Bulk indexing file using index: {}, type: {}".format(request.service, doc_type))
+        elastic_search_client.ensure_es_mapping(request.service, doc_type)
+        dead_letter_path = file_path + FAILED_DOCUMENTS_FILE_SUFFIX
+
+        with index_settings.bulk_load(elastic_search_client, request.service, file_path):
+            if sharding.should_shard(file_path):
+                success, fail = sharding.index_shards(
+                    file_path, action=request.action, index=request.service, doc_type=doc_type,
+                    dead_letter_path=dead_letter_path)
+            else:
+                thread_count = (configuration.data.BULK_PROCESSING_THREAD_COUNT
+                                if configuration.data.LIST_PARALLEL_BULK_PROCESSING_ENABLED else None)
+                success, fail = bulk.index_rows(
+                    elastic_search_client, file_reader.get_rows(), action=request.action, index=request.service,
+                    doc_type=doc_type, dead_letter_path=dead_letter_path, thread_count=thread_count)
 
-        success, fail = returned_results if stats_only else (None, len(returned_results), )
         logger.info("Uploading for list '{}'. Stats: Success: {} , Failed: {} .Refreshing index...".format(
             request.list_id, success, fail))
         logger.info("Done! .Refreshing index...")
@@ -88,46 +149,141 @@ class ElasticSearchService(object):
         logger.info("Finished indexing documents")
         file_reader.close()
 
+        result = {'indexed': success, 'failed': fail}
+        if fail:
+            result['failedFilePath'] = request.filePath + FAILED_DOCUMENTS_FILE_SUFFIX
+        return result
+
+    @staticmethod
+    def schedule_reload_list(request):
+        logger.info("Scheduling reload of list /{}/{}".format(request.service, request.list_id))
+        _invalidate_members(request)
+        workers.ingestion_pool().submit(
+            _reload_list_job, request, callback=functools.partial(_invalidate_members, request))
+
+    @staticmethod
+    @decorators.elastic_search_callback
+    @decorators.upload_cleanup
+    def reload_list(request):
+        """
+        Loads the uploaded file into a new generation of the list. Reads keep being served by the current generation
+        until the new one is loaded and refreshed, then the list is switched over in a single write.
+        """
+        logger.info("Reloading a list Params: {}".format(request.unwrap()))
+        file_path = os.path.join(configuration.data.VOLUME_MAPPINGS_FILE_UPLOAD_TARGET, request.filePath)
+        file_reader = readers.BulkAccountsFileReaders.get(file_path)
+        elastic_search_client = clients.get_client()
+        with generations.Reload(elastic_search_client, request.service, request.list_id) as reload:
+            result = ElasticSearchService._index_file(
+                elastic_search_client, file_reader, file_path, request, reload.staging)
+            _rebuild_member_filter(elastic_search_client, request.service, reload.staging)
+            return result
+
+    @staticmethod
+    def purge_retired_generations(request):
+        try:
+            generations.purge(clients.get_client(), request.service, request.list_id)
+        except Exception:
+            logger.exception("Unable to delete the retired generations of list /{}/{}".format(
+                request.service, request.list_id))
+
+    @staticmethod
+    def schedule_replace_list(request):
+        logger.info("Scheduling replacement of list /{}/{}".format(request.service, request.list_id))
+        _invalidate_members(request)
+        workers.ingestion_pool().submit(
+            _replace_list_job, request, callback=functools.partial(_invalidate_members, request))
+
+    @staticmethod
+    @decorators.elastic_search_callback
+    @decorators.upload_cleanup
+    def replace_list(request):
+        """
+        Makes a list hold exactly the accounts of the uploaded file, indexing the accounts missing from the list and
+        deleting those no longer in the file; accounts in both are left untouched.
+        """
+        logger.info("Replacing the contents of a list Params: {}".format(request.unwrap()))
+        file_path = os.path.join(configuration.data.VOLUME_MAPPINGS_FILE_UPLOAD_TARGET, request.filePath)
+        file_reader = readers.BulkAccountsFileReaders.get(file_path)
+        elastic_search_client = clients.get_client()
+        doc_type = generations.resolve(elastic_search_client, request.service, request.list_id)
+        elastic_search_client.ensure_es_mapping(request.service, doc_type)
+        bloom.store().discard(request.service, doc_type)
+        snapshots.store().invalidate(request.service, doc_type)
+        dead_letter_path = file_path + FAILED_DOCUMENTS_FILE_SUFFIX
+
+        with diff.ListDiff(configuration.data.LIST_DIFF_SORT_RUN_SIZE) as list_diff:
+            current_path = list_diff.sort(
+                _list_members(elastic_search_client, request.service, doc_type), 'current')
+            new_path = list_diff.sort(file_reader.get_rows(), 'new')
+            file_reader.close()
+            added_path, removed_path, result = list_diff.compare(current_path, new_path)
+            logger.info("List '{}' changes: {}".format(request.list_id, result))
+
+            sizer = bulk.chunk_sizer()
+            with bulk.DeadLetterFile(dead_letter_path) as dead_letter:
+                for action, path in ((operations.ElasticSearchPermittedOperations.INDEX, added_path),
+                                     (operations.ElasticSearchPermittedOperations.DELETE, removed_path)):
+                    encoder = bulk.BulkBodyEncoder(action=action, index=request.service, doc_type=doc_type)
+                    bulk.execute(elastic_search_client, encoder.chunks(diff.read_keys(path), sizer),
+                                 index=request.service, doc_type=doc_type, sizer=sizer,
+                                 retry_policy=bulk.retry_policy(), dead_letter=dead_letter)
+                result['failed'] = dead_letter.count
+
+        elastic_search_client.indices.refresh(index=request.service)
+        _rebuild_member_filter(elastic_search_client, request.service, doc_type)
+        logger.info("Finished replacing the contents of list '{}'".format(request.list_id))
+        if result['failed']:
+            result['failedFilePath'] = request.filePath + FAILED_DOCUMENTS_FILE_SUFFIX
+        return result
+
     @staticmethod
     @decorators.upload_cleanup
-    def modify_list_members(request, stats_only=False):
+    def modify_list_members(request):
         logger.info("List Modification with action '{}' started...".format(request.action))
         file_path = os.path.join(configuration.data.VOLUME_MAPPINGS_FILE_UPLOAD_TARGET, request.filePath)
         file_reader = readers.BulkAccountsFileReaders.get(file_path)
         if file_reader.exceeds_allowed_row_count(max_limit_count=configuration.data.ACCOUNTS_UPDATE_MAX_SIZE_ALLOWED):
             raise app_exceptions.TooManyAccountsSpecifiedError()
 
-        actions = []
-        members = []
+        members = list(file_reader.get_rows())
+        elastic_search_client = clients.get_client()
+        doc_type = generations.resolve(elastic_search_client, request.service, request.list_id)
+        snapshots.store().invalidate(request.service, doc_type)
+        encoder = bulk.BulkBodyEncoder(action=request.action, index=request.service, doc_type=doc_type)
+        sizer = bulk.chunk_sizer()
 
-        for line in file_reader.get_rows():
-            actions.append(
-                _ElasticSearchDocument(
-                    action=request.action, index=request.service, type=request.list_id, account_number=line).doc)
-            members.append(line)
-
-        logger.info("Bulk indexing file using index: {}, type: {}".format(request.service, request.list_id))
-        elastic_search_client = clients.ElasticSearchClient()
-        result = helpers.bulk(
-            elastic_search_client, actions, stats_only=stats_only,
-            chunk_size=configuration.data.BULK_PROCESSING_CHUNK_SIZE, index=request.service, doc_type=request.list_id)
-        failed = result[1]
-        success = list(set(members).difference(set(failed)))
+        logger.info("Bulk indexing file using index: {}, type: {}".format(request.service, doc_type))
+        failed = []
+        for documents in encoder.chunks(members, sizer):
+            _, errors = bulk.send(
+                elastic_search_client, documents, index=request.service, doc_type=doc_type, sizer=sizer,
+                retry_policy=bulk.retry_policy())
+            failed.extend(item.values()[0].get('_id') for item in errors)
+        failed_ids = set(failed)
+        success = list(set(member for member in members if bulk.document_id(member) not in failed_ids))
 
         file_reader.close()
         logger.info("Modification completed with action '{}' ...Done! Refresh index".format(request.action))
         elastic_search_client.indices.refresh(index=request.service)
+        _invalidate_members(request)
+        if request.action == operations.ElasticSearchPermittedOperations.DELETE:
+            # The filter still holds the removed members, which only costs lookups; it is compacted in the background.
+            _schedule_rebuild(_rebuild_member_filter_job, request.service, doc_type)
+        else:
+            _add_to_member_filter(request.service, doc_type, members)
         logger.info("Finished indexing documents")
 
         return {'success': success, 'failed': failed}
 
     @staticmethod
-    @decorators.elastic_search_query_params('query', 'max_tries', 'interval', 'break_on_count')
+    @decorators.elastic_search_query_params('query', 'max_tries', 'interval', 'break_on_count', 'on_count')
     def __poll_count(index, doc_type, client, **kwargs):
         query = kwargs.get('query', {"match_all": {}})
         max_tries = kwargs.get('max_tries', 3)
         interval = kwargs.get('interval', 5)
         break_on_count = kwargs.get('break_on_count', 0)
+        on_count = kwargs.get('on_count') or (lambda count: None)
 
         if break_on_count is None or break_on_count < 0:
             raise app_exceptions.PollCountException("break_on_count value '{}' invalid".format(break_on_count))
@@ -140,33 +296,88 @@ class ElasticSearchService(object):
             backoff.constant, lambda count: count != break_on_count, max_tries=max_tries, interval=interval)
         def call_count():
             try:
-                result = client.count(index=index, doc_type=doc_type, body={"query": query})
-                return result.get("count")
+                count = client.count(index=index, doc_type=doc_type, body={"query": query}).get("count")
             except exceptions.TransportError as e:
-                if e.status_code == httplib.NOT_FOUND:
-                    return 0  # If the index was not found, we know the count is 0
-                raise
+                if e.status_code != httplib.NOT_FOUND:
+                    raise
+                count = 0  # If the index was not found, we know the count is 0
+            on_count(count)
+            return count
 
         logger.info("Polling list count...")
         return call_count()
 
     @staticmethod
-    def delete_list(request):
+    def schedule_delete_list(request):
+        """
+        Checks that the list exists and schedules its deletion on the ingestion pool. Returns the record of the job
+        tracking the deletion.
+        """
+        logger.info("Scheduling deletion of list /{}/{}".format(request.service, request.list_id))
+        client = clients.get_client()
+        doc_type = generations.resolve(client, request.service, request.list_id)
+        if not client.indices.exists_type(index=request.service, doc_type=doc_type):
+            logger.warning("Elastic search (index:{}, Type:{}) not found!".format(request.service, doc_type))
+            raise LookupError
+
+        job = jobs.Job.create(client, jobs.DELETE_LIST, request)
+        request.job_id = job.id
+        _invalidate_members(request)
+        try:
+            workers.ingestion_pool().submit(
+                _delete_list_job, request, callback=functools.partial(_invalidate_members, request))
+        except Exception:
+            job.discard()
+            raise
+        return job.record
+
+    @staticmethod
+    @decorators.elastic_search_callback
+    def run_delete_list_job(request):
+        job = jobs.load(clients.get_client(), request.job_id)
+        job.start()
+        try:
+            result = ElasticSearchService.delete_list(request, job)
+        except Exception as e:
+            job.fail(str(e) or e.__class__.__name__)
+            raise
+        job.succeed(result)
+        return result
+
+    @staticmethod
+    def delete_list(request, job=None):
         try:
             logger.info("Elastic Search is deleting /{}/{}".format(request.service, request.list_id))
 
-            client = clients.ElasticSearchClient()
-            result = client.delete_by_query(request.service, request.list_id, body={"query": {"match_all": {}}})
+            client = clients.get_client()
+            doc_type = generations.resolve(client, request.service, request.list_id)
+            report_progress = job.report_progress if job is not None else lambda **progress: None
+            total = client.count(index=request.service, doc_type=doc_type).get("count")
+            report_progress(total=total)
+
+            clients.mappings.invalidate(request.service, doc_type)
+            bloom.store().discard(request.service, doc_type)
+            snapshots.store().invalidate(request.service, doc_type)
+            if deletion.should_slice(total):
+                deleted, failed = deletion.delete_in_slices(
+                    client, request.service, doc_type,
+                    on_progress=lambda deleted: report_progress(total=total, deleted=deleted))
+                result = {'deleted': deleted, 'failed': failed}
+                client.indices.refresh(index=request.service)
+            else:
+                result = client.delete_by_query(request.service, doc_type, body={"query": {"match_all": {}}})
             logger.info("Elastic search delete response: {}".format(result))
 
-            count = ElasticSearchService.__poll_count(request.service, request.list_id, client)
+            count = ElasticSearchService.__poll_count(
+                request.service, doc_type, client, on_count=lambda count: report_progress(total=total, remaining=count))
             if count:
                 raise app_exceptions.PollCountException(
                     "There are '{}' account numbers present in the given index '{}' and type '{}'".format(
-                        count, request.service, request.list_id))
+                        count, request.service, doc_type))
         except exceptions.TransportError as e:
             if e.status_code == httplib.NOT_FOUND:
                 logger.warning("Elastic search delete request not found")
+                clients.mappings.invalidate(request.service)
                 raise LookupError
             logger.warning("Elastic search delete request exception: {}".format(e.info))
             raise e
@@ -174,19 +385,204 @@ class ElasticSearchService(object):
         result["acknowledged"] = True
         return result
 
+    @staticmethod
+    def get_job(request):
+        return jobs.load(clients.get_client(), request.job_id).record
+
+    @staticmethod
+    def get_stats(request):
+        """
+        Returns the counters of the process serving the request: its Elastic Search connection pools, the member
+        lookup cache, coalescing and batching (None when batching is disabled) and the loaded member filters.
+        """
+        batcher = membership.batcher()
+        return {
+            'pid': os.getpid(),
+            'connectionPools': clients.pool_stats(),
+            'membershipCache': membership.cache().stats(),
+            'coalescedLookups': membership.flights().stats(),
+            'batchedLookups': batcher.stats() if batcher is not None else None,
+            'memberFilters': bloom.store().stats()
+        }
+
     @staticmethod
     def get_list_status(request):
-        elastic_search_client = clients.ElasticSearchClient()
-        result = elastic_search_client.search(index=request.service, doc_type=request.list_id, search_type="count")
+        elastic_search_client = clients.get_client()
+        doc_type = generations.resolve(elastic_search_client, request.service, request.list_id)
+        result = elastic_search_client.search(index=request.service, doc_type=doc_type, search_type="count")
         logger.info("elastic search response {}".format(result))
         if result['hits']['total'] == 0:
             logger.warning("Elastic search (index:{}, Type:{}) not found!".format(request.service, request.list_id))
             raise LookupError
         return result
 
+    @staticmethod
+    def get_member_lists(request):
+        """
+        Returns a page of the ids of the lists of a service that contain an account, sorted by id. The types holding
+        the account are found with one ids query over every type of the service index, aggregated by type; types
+        holding staging or replaced generations of a list are left out before paginating and counting.
+        """
+        page_size = configuration.data.MEMBER_LISTS_PAGE_SIZE
+        offset, limit = max(request.offset, 0), min(request.limit or page_size, page_size)
+        elastic_search_client = clients.get_client()
+        try:
+            query = {"filtered": {"filter": {"ids": {"values": [request.member_id]}}}}
+            response = elastic_search_client.search(
+                index=request.service, search_type="count",
+                body={"query": query, "aggs": {"types": {"terms": {"field": "_type", "size": 0}}}})
+        except exceptions.TransportError as e:
+            if e.status_code == httplib.NOT_FOUND:
+                raise LookupError
+            raise
+
+        doc_types = set(bucket['key'] for bucket in response['aggregations']['types']['buckets'])
+        list_ids = sorted(set(generations.list_id_of(doc_type) for doc_type in doc_types))
+        current = generations.resolve_many(elastic_search_client, request.service, list_ids)
+        lists = [list_id for list_id in list_ids if current[list_id] in doc_types]
+        return {
+            'lists': lists[offset:offset + limit],
+            'total': len(lists),
+            'offset': offset,
+            'limit': limit
+        }
+
+    @staticmethod
+    def evaluate_membership(request):
+        """
+        Evaluates a rule over lists of a service for each requested account: the account must be a member of all the
+        `allOf` lists, of at least one of the `anyOf` lists (when given) and of none of the `noneOf` lists.
+
+        Memberships missing from the cache are read with one search over the current types of the lists involved.
+        """
+        account_numbers = list(collections.OrderedDict.fromkeys(request.accountNumbers))
+        if len(account_numbers) > configuration.data.MEMBERSHIP_LOOKUP_MAX_ACCOUNTS:
+            raise app_exceptions.TooManyAccountsSpecifiedError()
+        list_ids = list(collections.OrderedDict.fromkeys(request.allOf + request.anyOf + request.noneOf))
+
+        cache = membership.cache()
+        members = collections.OrderedDict()
+        for list_id in list_ids:
+            for account_number in account_numbers:
+                members[(list_id, account_number)] = cache.get(request.service, list_id, account_number)
+        missing = [key for key, found in members.iteritems() if found is None]
+
+        if missing:
+            versions = dict((list_id, cache.version(request.service, list_id)) for list_id in list_ids)
+            missing_lists = list(collections.OrderedDict.fromkeys(list_id for list_id, _ in missing))
+            missing_accounts = list(collections.OrderedDict.fromkeys(account_number for _, account_number in missing))
+            elastic_search_client = clients.get_client()
+            doc_types = generations.resolve_many(elastic_search_client, request.service, missing_lists)
+            list_ids_by_type = dict((doc_type, list_id) for list_id, doc_type in doc_types.iteritems())
+            query = {"filtered": {"filter": {"ids": {"values": missing_accounts}}}}
+            try:
+                response = elastic_search_client.search(
+                    index=request.service, doc_type=','.join(doc_types[list_id] for list_id in missing_lists),
+                    body={"query": query}, size=len(missing_lists) * len(missing_accounts), _source=False)
+            except exceptions.TransportError as e:
+                if e.status_code == httplib.NOT_FOUND:
+                    raise LookupError
+                raise
+
+            found = set((list_ids_by_type[hit['_type']], hit['_id']) for hit in response['hits']['hits'])
+            for list_id, account_number in missing:
+                members[(list_id, account_number)] = (list_id, account_number) in found
+                cache.put(request.service, list_id, account_number, members[(list_id, account_number)],
+                          versions[list_id])
+
+        def matches(account_number):
+            return (all(members[(list_id, account_number)] for list_id in request.allOf) and
+                    (not request.anyOf or any(members[(list_id, account_number)] for list_id in request.anyOf)) and
+                    not any(members[(list_id, account_number)] for list_id in request.noneOf))
+
+        return {
+            'matched': [account_number for account_number in account_numbers if matches(account_number)],
+            'notMatched': [account_number for account_number in account_numbers if not matches(account_number)]
+        }
+
+    @staticmethod
+    def lookup_list_members(request):
+        """
+        Checks which of the requested account numbers are members of the list, answering from the membership cache
+        where possible and with a single multi get for the rest.
+        """
+        account_numbers = list(collections.OrderedDict.fromkeys(request.accountNumbers))
+        if len(account_numbers) > configuration.data.MEMBERSHIP_LOOKUP_MAX_ACCOUNTS:
+            raise app_exceptions.TooManyAccountsSpecifiedError()
+
+        cache = membership.cache()
+        found = {}
+        for account_number in account_numbers:
+            found[account_number] = cache.get(request.service, request.list_id, account_number)
+        missing = [account_number for account_number in account_numbers if found[account_number] is None]
+
+        if missing:
+            version = cache.version(request.service, request.list_id)
+            elastic_search_client = clients.get_client()
+            doc_type = generations.resolve(elastic_search_client, request.service, request.list_id)
+            response = elastic_search_client.mget(
+                index=request.service, doc_type=doc_type, body={'ids': missing}, _source=False)
+            for account_number, document in zip(missing, response['docs']):
+                found[account_number] = document.get('found', False)
+                cache.put(request.service, request.list_id, account_number, found[account_number], version)
+
+        return {
+            'found': [account_number for account_number in account_numbers if found[account_number]],
+            'notFound': [account_number for account_number in account_numbers if not found[account_number]]
+        }
+
+    @staticmethod
+    def _exists_list_member(service, list_id, member_id, version):
+        elastic_search_client = clients.get_client()
+        doc_type = generations.resolve(elastic_search_client, service, list_id)
+        batcher = membership.batcher()
+        if not bloom.store().might_contain(service, doc_type, member_id):
+            found = False
+        elif batcher:
+            found = batcher.submit((service, doc_type, member_id))
+        else:
+            found = elastic_search_client.exists(index=service, doc_type=doc_type, id=member_id)
+        membership.cache().put(service, list_id, member_id, found, version)
+        return found
+
+    @staticmethod
+    def is_list_member(service, list_id, member_id):
+        cache = membership.cache()
+        found = cache.get(service, list_id, member_id)
+        if found is None:
+            # The version is part of the key so that a lookup never joins one started before the list changed.
+            version = cache.version(service, list_id)
+            found = membership.flights().do((service, list_id, member_id, version),
+                                            ElasticSearchService._exists_list_member,
+                                            service, list_id, member_id, version)
+        return found
+
+    @staticmethod
+    def get_list_snapshot(request):
+        """
+        Returns the open snapshot of a list in the requested format and its ETag. When the list has none, its build is
+        scheduled on the ingestion pool, unless another download already did, and `SnapshotPendingError` is raised.
+        """
+        snapshot_format = request.format or snapshots.SORTED
+        if snapshot_format not in snapshots.FORMATS:
+            raise app_exceptions.UnsupportedSnapshotFormatError()
+        elastic_search_client = clients.get_client()
+        doc_type = generations.resolve(elastic_search_client, request.service, request.list_id)
+        snapshot = snapshots.store().get(request.service, doc_type, snapshot_format)
+        if snapshot is None:
+            if not elastic_search_client.indices.exists_type(index=request.service, doc_type=doc_type):
+                raise LookupError
+            if snapshots.store().claim_build(request.service, doc_type):
+                try:
+                    workers.ingestion_pool().submit(_build_snapshots_job, request.service, doc_type)
+                except Exception:
+                    snapshots.store().release_build(request.service, doc_type)
+                    raise
+            raise app_exceptions.SnapshotPendingError()
+        return snapshot
+
     @staticmethod
     def get_list_member(request):
-        elastic_search_client = clients.ElasticSearchClient()
-        if not elastic_search_client.exists(index=request.service, doc_type=request.list_id, id=request.member_id):
+        if not ElasticSearchService.is_list_member(request.service, request.list_id, request.member_id):
             raise LookupError
         return {}
@@ -0,0 +1,245 @@
+import logging
+import re
+import threading
+import time
+import uuid
+
+from elasticsearch import exceptions
+
+import configuration
+from app.services import bloom, clients, snapshots
+
+logger = logging.getLogger(__name__)
+
+GENERATION_DOC_TYPE = 'list_generation'
+GENERATION_SEPARATOR = '__'
+GENERATION_RE = re.compile(r'^(.+)' + GENERATION_SEPARATOR + r'[0-9a-f]{32}$')
+
+
+def _record_id(index, list_id):
+    return '{}:{}'.format(index, list_id)
+
+
+class ResolveCache(object):
+
+    """
+    Per process cache of the types lists resolve to, so that reads do not fetch the indirection record of a list every
+    time. Entries are kept for `ttl` seconds: the process that flips a list and the one that scheduled its reload
+    invalidate it straight away, other processes pick up the flip once the entry expires. As in
+    `membership.MembershipCache`, a resolve started before an invalidation is not cached. A `ttl` of 0 disables caching.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._versions = {}
+
+    def version(self, index, list_id):
+        with self._lock:
+            return self._versions.get((index, list_id), 0)
+
+    def get(self, index, list_id):
+        """
+        Returns the cached type of a list, or None when it is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get((index, list_id))
+            if entry is None or entry[0] < time.time():
+                return None
+            return entry[1]
+
+    def put(self, index, list_id, doc_type, version):
+        if not self.ttl:
+            return
+        with self._lock:
+            if self._versions.get((index, list_id), 0) == version:
+                self._entries[(index, list_id)] = (time.time() + self.ttl, doc_type)
+
+    def invalidate(self, index, list_id):
+        with self._lock:
+            self._versions[(index, list_id)] = self._versions.get((index, list_id), 0) + 1
+            self._entries.pop((index, list_id), None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResolveCache(ttl=configuration.data.GENERATION_CACHE_TTL_SECONDS)
+        return _cache
+
+
+def reset():
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def _read(client, index, list_id):
+    try:
+        response = client.get(index=configuration.data.LIST_METADATA_INDEX, doc_type=GENERATION_DOC_TYPE,
+                              id=_record_id(index, list_id))
+        return response['_source'], response['_version']
+    except exceptions.NotFoundError:
+        return None, None
+
+
+def resolve(client, index, list_id):
+    """
+    Returns the type holding the members of a list: the generation the list's indirection record points to, or the
+    list id itself for lists that were never reloaded.
+    """
+    resolved = cache()
+    doc_type = resolved.get(index, list_id)
+    if doc_type is None:
+        version = resolved.version(index, list_id)
+        record, _ = _read(client, index, list_id)
+        doc_type = record['doc_type'] if record else list_id
+        resolved.put(index, list_id, doc_type, version)
+    return doc_type
+
+
+def resolve_many(client, index, list_ids):
+    """
+    Like `resolve`, for several lists of an index at once. Returns a dict of list id to type.
+    """
+    resolved = cache()
+    doc_types = {}
+    for list_id in list_ids:
+        doc_type = resolved.get(index, list_id)
+        if doc_type is not None:
+            doc_types[list_id] = doc_type
+    missing = [list_id for list_id in list_ids if list_id not in doc_types]
+    if not missing:
+        return doc_types
+    versions = [resolved.version(index, list_id) for list_id in missing]
+    response = client.mget(index=configuration.data.LIST_METADATA_INDEX, doc_type=GENERATION_DOC_TYPE,
+                           body={'ids': [_record_id(index, list_id) for list_id in missing]})
+    for list_id, version, document in zip(missing, versions, response['docs']):
+        doc_types[list_id] = document['_source']['doc_type'] if document.get('found') else list_id
+        resolved.put(index, list_id, doc_types[list_id], version)
+    return doc_types
+
+
+def list_id_of(doc_type):
+    """
+    Returns the id of the list a type holds a generation of.
+    """
+    match = GENERATION_RE.match(doc_type)
+    return match.group(1) if match else doc_type
+
+
+def new_generation(list_id):
+    return '{}{}{}'.format(list_id, GENERATION_SEPARATOR, uuid.uuid4().hex)
+
+
+class Reload(object):
+
+    """
+    Loads the new contents of a list into a staging generation (a type of its own) while reads keep resolving to the
+    current one, then flips the list's indirection record to the staging generation.
+
+    The flip is a single versioned write, so it either fully happens or, when another reload flipped the list in the
+    meantime, fails with a `ConflictError`. Writes that only changed the retired generations of the list (`purge`, or
+    another reload retiring its staging generation) are merged and the flip retried. The replaced generation is only
+    marked as retired; `purge` deletes it.
+    A reload that fails before flipping retires its own staging generation instead.
+    """
+
+    def __init__(self, client, index, list_id):
+        self.client = client
+        self.index = index
+        self.list_id = list_id
+        self.record, self.version = _read(client, index, list_id)
+        self.current = self.record['doc_type'] if self.record else list_id
+        self.staging = new_generation(list_id)
+
+    def __enter__(self):
+        logger.info("Loading list /{}/{} into staging generation {}".format(self.index, self.list_id, self.staging))
+        return self
+
+    def __exit__(self, error_type, *args):
+        if error_type is None:
+            self._flip()
+        else:
+            logger.warning("Reload of list /{}/{} failed, retiring {}".format(self.index, self.list_id, self.staging))
+            self._retire(self.staging)
+
+    def _flip(self):
+        while True:
+            try:
+                self._write_flip()
+                return
+            except exceptions.ConflictError:
+                record, version = _read(self.client, self.index, self.list_id)
+                if (record['doc_type'] if record else self.list_id) != self.current:
+                    logger.warning("List /{}/{} was reloaded concurrently, retiring {}".format(
+                        self.index, self.list_id, self.staging))
+                    self._retire(self.staging)
+                    raise
+                self.record, self.version = record, version
+
+    def _write_flip(self):
+        record = {
+            'service': self.index,
+            'list_id': self.list_id,
+            'doc_type': self.staging,
+            'retired': (self.record or {}).get('retired', []) + [self.current],
+        }
+        if self.version is None:
+            self.client.create(index=configuration.data.LIST_METADATA_INDEX, doc_type=GENERATION_DOC_TYPE,
+                               id=_record_id(self.index, self.list_id), body=record)
+        else:
+            self.client.index(index=configuration.data.LIST_METADATA_INDEX, doc_type=GENERATION_DOC_TYPE,
+                              id=_record_id(self.index, self.list_id), body=record, version=self.version)
+        cache().invalidate(self.index, self.list_id)
+        logger.info("List /{}/{} now served from {}".format(self.index, self.list_id, self.staging))
+
+    def _retire(self, doc_type):
+        while True:
+            record, version = _read(self.client, self.index, self.list_id)
+            if record is None:
+                record = {'service': self.index, 'list_id': self.list_id, 'doc_type': self.list_id, 'retired': []}
+            record['retired'] = record['retired'] + [doc_type]
+            try:
+                if version is None:
+                    self.client.create(index=configuration.data.LIST_METADATA_INDEX, doc_type=GENERATION_DOC_TYPE,
+                                       id=_record_id(self.index, self.list_id), body=record)
+                else:
+                    self.client.index(index=configuration.data.LIST_METADATA_INDEX, doc_type=GENERATION_DOC_TYPE,
+                                      id=_record_id(self.index, self.list_id), body=record, version=version)
+                return
+            except exceptions.ConflictError:
+                continue
+
+
+def purge(client, index, list_id):
+    """
+    Deletes the retired generations of a list. Each type is deleted with its mapping, which drops its documents
+    without the per-document cost of a delete by query.
+    """
+    while True:
+        record, version = _read(client, index, list_id)
+        if not record or not record['retired']:
+            return
+        for doc_type in record['retired']:
+            logger.info("Deleting retired generation /{}/{}".format(index, doc_type))
+            try:
+                client.indices.delete_mapping(index=index, doc_type=doc_type)
+            except exceptions.NotFoundError:
+                pass
+            clients.mappings.invalidate(index, doc_type)
+            bloom.store().discard(index, doc_type)
+            snapshots.store().discard(index, doc_type)
+        record['retired'] = []
+        try:
+            client.index(index=configuration.data.LIST_METADATA_INDEX, doc_type=GENERATION_DOC_TYPE,
+                         id=_record_id(index, list_id), body=record, version=version)
+            return
+        except exceptions.ConflictError:
+            continue
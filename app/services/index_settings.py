@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+import time
+import uuid
+
+from elasticsearch import exceptions
+
+import configuration
+
+logger = logging.getLogger(__name__)
+
+BULK_LOAD_DOC_TYPE = 'bulk_load'
+DEFAULT_REFRESH_INTERVAL = '1s'
+DISABLED_REFRESH_INTERVAL = '-1'
+
+
+def _tuned_settings():
+    settings = {'refresh_interval': DISABLED_REFRESH_INTERVAL}
+    if configuration.data.BULK_LOAD_NUMBER_OF_REPLICAS is not None:
+        settings['number_of_replicas'] = configuration.data.BULK_LOAD_NUMBER_OF_REPLICAS
+    return settings
+
+
+def _current_settings(client, index):
+    settings = client.indices.get_settings(index=index)[index]['settings']['index']
+    return {
+        'refresh_interval': settings.get('refresh_interval', DEFAULT_REFRESH_INTERVAL),
+        'number_of_replicas': settings['number_of_replicas']
+    }
+
+
+def _live_leases(record):
+    expiry = time.time() - configuration.data.BULK_LOAD_LEASE_SECONDS
+    return [lease for lease in record['leases'] if lease['heartbeat'] >= expiry]
+
+
+def _read(client, index):
+    try:
+        response = client.get(index=configuration.data.LIST_METADATA_INDEX, doc_type=BULK_LOAD_DOC_TYPE, id=index)
+        return response['_source'], response['_version']
+    except exceptions.NotFoundError:
+        return None, None
+
+
+def _join(client, index, lease_id):
+    """
+    Registers (or renews) a load against the index. The first load records the original settings and tunes the index.
+    Records are updated with optimistic concurrency, so loads running in other processes or hosts are never lost.
+    """
+    while True:
+        record, version = _read(client, index)
+        lease = {'id': lease_id, 'heartbeat': time.time()}
+        try:
+            if record is None:
+                record = {'original': _current_settings(client, index), 'leases': [lease]}
+                client.create(
+                    index=configuration.data.LIST_METADATA_INDEX, doc_type=BULK_LOAD_DOC_TYPE, id=index, body=record)
+                logger.info("Tuning index {} for bulk loading: {}".format(index, _tuned_settings()))
+                client.indices.put_settings(index=index, body={'index': _tuned_settings()})
+            else:
+                record['leases'] = [live for live in _live_leases(record) if live['id'] != lease_id] + [lease]
+                client.index(index=configuration.data.LIST_METADATA_INDEX, doc_type=BULK_LOAD_DOC_TYPE, id=index,
+                             body=record, version=version)
+            return
+        except exceptions.ConflictError:
+            continue
+
+
+def _leave(client, index, lease_id):
+    """
+    Removes a load (and any expired ones) from the index. The last load to leave restores the original settings.
+    """
+    restored = False
+    while True:
+        record, version = _read(client, index)
+        if record is None:
+            return
+        record['leases'] = [lease for lease in _live_leases(record) if lease['id'] != lease_id]
+        try:
+            if record['leases']:
+                if restored:
+                    client.indices.put_settings(index=index, body={'index': _tuned_settings()})
+                client.index(index=configuration.data.LIST_METADATA_INDEX, doc_type=BULK_LOAD_DOC_TYPE, id=index,
+                             body=record, version=version)
+            else:
+                logger.info("Restoring index {} settings: {}".format(index, record['original']))
+                client.indices.put_settings(index=index, body={'index': record['original']})
+                restored = True
+                client.delete(
+                    index=configuration.data.LIST_METADATA_INDEX, doc_type=BULK_LOAD_DOC_TYPE, id=index,
+                    version=version)
+            return
+        except exceptions.ConflictError:
+            continue
+
+
+def recover_abandoned_loads(client):
+    """
+    Restores the settings of indices whose loads all stopped renewing their lease, e.g. because the worker crashed.
+    """
+    try:
+        response = client.search(
+            index=configuration.data.LIST_METADATA_INDEX, doc_type=BULK_LOAD_DOC_TYPE, size=1000, version=True)
+    except exceptions.NotFoundError:
+        return
+    for hit in response['hits']['hits']:
+        if not _live_leases(hit['_source']):
+            logger.warning("Found abandoned bulk load on index {}".format(hit['_id']))
+            _leave(client, hit['_id'], lease_id=None)
+
+
+class BulkLoad(object):
+
+    """
+    Context manager that suspends refreshes (and, when configured, reduces replicas) of an index while a list loads.
+
+    Loads renew their lease from a background thread. The original settings are restored when the last running load
+    against the index finishes, fails, or stops renewing its lease for `BULK_LOAD_LEASE_SECONDS`.
+    """
+
+    def __init__(self, client, index):
+        self.client = client
+        self.index = index
+        self.lease_id = uuid.uuid4().hex
+        self._stopped = threading.Event()
+        self._heartbeat = threading.Thread(target=self._renew_lease, name='bulk-load-{}'.format(index))
+        self._heartbeat.daemon = True
+
+    def __enter__(self):
+        recover_abandoned_loads(self.client)
+        _join(self.client, self.index, self.lease_id)
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        self._heartbeat.join()
+        try:
+            _leave(self.client, self.index, self.lease_id)
+        except Exception:
+            logger.exception("Unable to restore index {} settings, they will be restored once the lease expires".format(
+                self.index))
+
+    def _renew_lease(self):
+        while not self._stopped.wait(configuration.data.BULK_LOAD_LEASE_SECONDS / 3.0):
+            try:
+                _join(self.client, self.index, self.lease_id)
+            except Exception:
+                logger.exception("Unable to renew bulk load lease on index {}".format(self.index))
+
+
+class _NoTuning(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def bulk_load(client, index, file_path):
+    """
+    Returns the context manager to load the given upload with: a tuned `BulkLoad` for large uploads when enabled, a
+    no-op otherwise.
+    """
+    try:
+        large = os.path.getsize(file_path) >= configuration.data.BULK_LOAD_TUNING_MIN_FILE_BYTES
+    except OSError:
+        large = False
+    if configuration.data.BULK_LOAD_TUNING_ENABLED and large:
+        return BulkLoad(client, index)
+    return _NoTuning()
@@ -0,0 +1,85 @@
+import datetime
+import logging
+import uuid
+
+from elasticsearch import exceptions
+
+import configuration
+
+logger = logging.getLogger(__name__)
+
+JOB_DOC_TYPE = 'job'
+
+DELETE_LIST = 'delete_list'
+
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def _now():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class Job(object):
+
+    """
+    Status record of a background job, kept in the list metadata index so that any instance of the service can report
+    it. A job is `pending` until a worker picks it up, `running` (with an optional `progress`) while it executes, and
+    ends up `succeeded` with the job's result or `failed` with the error that stopped it.
+    """
+
+    def __init__(self, client, record):
+        self.client = client
+        self.record = record
+
+    @property
+    def id(self):
+        return self.record['id']
+
+    @classmethod
+    def create(cls, client, job_type, request):
+        now = _now()
+        job = cls(client, {
+            'id': str(uuid.uuid4()),
+            'type': job_type,
+            'service': request.service,
+            'listId': request.list_id,
+            'status': PENDING,
+            'created': now,
+            'updated': now,
+        })
+        client.create(index=configuration.data.LIST_METADATA_INDEX, doc_type=JOB_DOC_TYPE, id=job.id, body=job.record)
+        logger.info("Created {} job {}".format(job_type, job.id))
+        return job
+
+    def _save(self, **fields):
+        self.record.update(fields, updated=_now())
+        self.client.index(index=configuration.data.LIST_METADATA_INDEX, doc_type=JOB_DOC_TYPE, id=self.id,
+                          body=self.record)
+
+    def start(self):
+        self._save(status=RUNNING)
+
+    def report_progress(self, **progress):
+        self._save(progress=progress)
+
+    def succeed(self, result):
+        self._save(status=SUCCEEDED, result=result)
+        logger.info("Job {} succeeded".format(self.id))
+
+    def fail(self, error):
+        self._save(status=FAILED, error=error)
+        logger.warning("Job {} failed: {}".format(self.id, error))
+
+    def discard(self):
+        self.client.delete(index=configuration.data.LIST_METADATA_INDEX, doc_type=JOB_DOC_TYPE, id=self.id)
+
+
+def load(client, job_id):
+    try:
+        response = client.get(index=configuration.data.LIST_METADATA_INDEX, doc_type=JOB_DOC_TYPE, id=job_id)
+    except exceptions.NotFoundError:
+        raise LookupError
+    return Job(client, response['_source'])
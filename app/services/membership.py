@@ -0,0 +1,305 @@
+import collections
+import logging
+import threading
+import time
+
+import configuration
+from app.services import clients
+
+logger = logging.getLogger(__name__)
+
+# Rough per entry cost of the key tuple, the cached value and the bookkeeping of the LRU and per list indexes.
+ENTRY_OVERHEAD_BYTES = 256
+
+
+class MembershipCache(object):
+
+    """
+    Per process LRU cache of member lookups, holding both found and not found results for `ttl` seconds.
+
+    Once the estimated size of the entries exceeds `max_bytes`, the least recently used ones are evicted. Every list has
+    a version which is bumped when it is invalidated; a lookup started before an invalidation is not cached, so results
+    read from Elastic Search while the list was changing never outlive the change. A `max_bytes` of 0 disables caching.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._members_by_list = collections.defaultdict(set)
+        self._versions = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(key):
+        return ENTRY_OVERHEAD_BYTES + sum(len(part) for part in key)
+
+    def _remove(self, key):
+        self._entries.pop(key)
+        self._bytes -= self._size(key)
+        members = self._members_by_list[key[:2]]
+        members.discard(key[2])
+        if not members:
+            del self._members_by_list[key[:2]]
+
+    def version(self, index, list_id):
+        with self._lock:
+            return self._versions.get((index, list_id), 0)
+
+    def get(self, index, list_id, member_id):
+        """
+        Returns True or False when the membership is cached, None otherwise.
+        """
+        key = (index, list_id, member_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries[key] = self._entries.pop(key)
+            return entry[1]
+
+    def put(self, index, list_id, member_id, found, version):
+        key = (index, list_id, member_id)
+        size = self._size(key)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self._versions.get((index, list_id), 0) != version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, found)
+            self._members_by_list[(index, list_id)].add(member_id)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, index, list_id):
+        with self._lock:
+            self._versions[(index, list_id)] = self._versions.get((index, list_id), 0) + 1
+            for member_id in list(self._members_by_list.get((index, list_id), ())):
+                self._remove((index, list_id, member_id))
+        logger.info("Invalidated cached members of list /{}/{}".format(index, list_id))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the function while the others wait for, and
+    share, its result or its exception. A caller that waits more than `timeout` seconds stops waiting and runs the
+    function itself, so one slow request cannot hold up every lookup queued behind it.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key, function, *args, **kwargs):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if flight.done.wait(self.timeout):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+            with self._lock:
+                self.timeouts += 1
+            logger.warning("Timed out after {}s waiting for in flight lookup {}".format(self.timeout, key))
+            return function(*args, **kwargs)
+
+        try:
+            flight.result = function(*args, **kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'inFlight': len(self._flights),
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts
+            }
+
+
+class _Batch(object):
+
+    def __init__(self):
+        self.keys = collections.OrderedDict()
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MicroBatcher(object):
+
+    """
+    Groups the lookups submitted within `window` seconds of each other, up to `max_size` distinct keys, into one call
+    of `fetch`, which takes the list of keys and returns a dict of key to result.
+
+    The first caller of a batch waits for the window to pass (or the batch to fill up), fetches the whole batch and
+    hands every waiting caller its result, or the error of the fetch.
+    """
+
+    def __init__(self, fetch, window, max_size):
+        self.fetch = fetch
+        self.window = window
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._batch = None
+        self.batches = 0
+        self.keys = 0
+        self.max_batch_size = 0
+        self.queue_delay = 0.0
+        self.max_queue_delay = 0.0
+
+    def submit(self, key):
+        submitted = time.time()
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            batch.keys.setdefault(key, submitted)
+            if len(batch.keys) >= self.max_size:
+                self._batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+            self._flush(batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[key]
+
+    def _flush(self, batch):
+        keys = list(batch.keys)
+        sent = time.time()
+        delays = [sent - submitted for submitted in batch.keys.itervalues()]
+        try:
+            batch.results = self.fetch(keys)
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+        with self._lock:
+            self.batches += 1
+            self.keys += len(keys)
+            self.max_batch_size = max(self.max_batch_size, len(keys))
+            self.queue_delay += sum(delays)
+            self.max_queue_delay = max([self.max_queue_delay] + delays)
+        logger.debug("Looked up a batch of {} members in {:.1f}ms, oldest queued for {:.1f}ms".format(
+            len(keys), (time.time() - sent) * 1000, max(delays) * 1000))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'averageBatchSize': float(self.keys) / self.batches if self.batches else 0.0,
+                'maxBatchSize': self.max_batch_size,
+                'averageQueueDelayMs': self.queue_delay * 1000 / self.keys if self.keys else 0.0,
+                'maxQueueDelayMs': self.max_queue_delay * 1000
+            }
+
+
+def _fetch_members(keys):
+    """
+    Looks up (index, type, member id) keys with a single mget. Members of a missing index or type are not found.
+    """
+    response = clients.get_client().mget(
+        body={'docs': [{'_index': index, '_type': doc_type, '_id': member_id} for index, doc_type, member_id in keys]},
+        _source=False)
+    return dict((key, bool(document.get('found'))) for key, document in zip(keys, response['docs']))
+
+
+_cache = None
+_flights = None
+_batcher = None
+_cache_lock = threading.Lock()
+
+
+def cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MembershipCache(max_bytes=configuration.data.MEMBERSHIP_CACHE_MAX_BYTES,
+                                     ttl=configuration.data.MEMBERSHIP_CACHE_TTL_SECONDS)
+        return _cache
+
+
+def flights():
+    global _flights
+    with _cache_lock:
+        if _flights is None:
+            _flights = SingleFlight(timeout=configuration.data.MEMBERSHIP_LOOKUP_COALESCE_TIMEOUT_SECONDS)
+        return _flights
+
+
+def batcher():
+    """
+    Returns the member lookup batcher, or None when `MEMBERSHIP_BATCH_WINDOW_MILLISECONDS` is 0.
+    """
+    global _batcher
+    with _cache_lock:
+        if _batcher is None and configuration.data.MEMBERSHIP_BATCH_WINDOW_MILLISECONDS > 0:
+            _batcher = MicroBatcher(_fetch_members,
+                                    window=configuration.data.MEMBERSHIP_BATCH_WINDOW_MILLISECONDS / 1000.0,
+                                    max_size=configuration.data.MEMBERSHIP_BATCH_MAX_SIZE)
+        return _batcher
+
+
+def reset():
+    global _cache, _flights, _batcher
+    with _cache_lock:
+        _cache = None
+        _flights = None
+        _batcher = None
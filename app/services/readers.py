@@ -1,22 +1,40 @@
-import abc
+import bz2
+import collections
 import csv
+import gzip
+import itertools
+import mmap
 import os
 
 import openpyxl
 
+from app.services import xlsx
+
+DECOMPRESSORS = {'gz': gzip.GzipFile, 'bz2': bz2.BZ2File}
+
 
 class FileReader(object):
-    __metaclass__ = abc.ABCMeta
+
+    """
+    Base of the account file readers. Readers hand the batches of account numbers they produce to `_read`, which
+    looks ahead only as far as the emptiness check and row limit need, so the rows are produced in the same pass.
+    """
 
     def __init__(self, filename):
         self.filename = filename
         if not os.path.isfile(filename):
             raise IOError("File {} does not exist!".format(filename))
         self.descriptor = None
+        self._rows = None
+
+    def _read(self, batches, allow_empty=False):
+        self._rows = LookAheadRows(itertools.chain.from_iterable(batches))
+        if not allow_empty and not self._rows.peek(1):
+            self.close()
+            raise EOFError("File {} is empty!".format(self.filename))
 
-    @abc.abstractmethod
     def get_rows(self):
-        pass
+        return iter(self._rows)
 
     @staticmethod
     def count(descriptor=None, max_limit_count=1):
@@ -31,34 +49,183 @@ class FileReader(object):
     def is_empty(self, descriptor=None):
         return self.count(descriptor=descriptor, max_limit_count=1)
 
-    @abc.abstractmethod
     def exceeds_allowed_row_count(self, descriptor=None, max_limit_count=1):
+        if descriptor is None:
+            return self._rows.peek(max_limit_count + 1) > max_limit_count
         return not self.count(descriptor=descriptor, max_limit_count=max_limit_count)
 
-    @abc.abstractmethod
     def close(self):
-        pass
+        if self.descriptor:
+            self.descriptor.close()
+            self.descriptor = None
 
 
-class CsvReader(FileReader):
+def _first_column(block):
+    # Splits a block of complete, unquoted lines; only blocks holding a comma need the csv module.
+    if ',' in block:
+        return [row[0] for row in csv.reader(block.splitlines()) if row]
+    return [line for line in block.splitlines() if line]
 
-    def __init__(self, filename):
-        super(CsvReader, self).__init__(filename)
-        self.descriptor = open(self.filename, 'rU')
-        if super(CsvReader, self).is_empty(self.descriptor):
-            raise EOFError("File {} is empty!".format(filename))
+
+def _split_lines(blocks):
+    """
+    Splits blocks of text into lines ending in '\n', whatever their terminators ('\r\n', '\r' or '\n'), as reading
+    the file with universal newlines would. A line or a '\r\n' cut in two by a block boundary is joined up again.
+    """
+    partial_line = ''
+    for block in blocks:
+        lines = (partial_line + block).splitlines(True)
+        partial_line = lines.pop() if lines and lines[-1][-1] not in '\n' else ''
+        for line in lines:
+            yield line.rstrip('\r\n') + '\n'
+    if partial_line:
+        yield partial_line.rstrip('\r\n') + '\n'
+
+
+def _csv_batches(lines, batch_size):
+    rows = (row[0] for row in csv.reader(lines) if row)
+    batch = list(itertools.islice(rows, batch_size))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(rows, batch_size))
+
+
+class LookAheadRows(object):
+
+    """
+    Iterator over rows that can look ahead a bounded number of rows without consuming them, so a reader can check
+    for emptiness and count rows against a limit in the same pass that produces them.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = collections.deque()
+
+    def peek(self, count):
+        """
+        Buffers up to `count` rows and returns how many rows are available, which is less than `count` only when the
+        rows run out.
+        """
+        while len(self._buffer) < count:
+            try:
+                self._buffer.append(next(self._rows))
+            except StopIteration:
+                break
+        return min(len(self._buffer), count)
+
+    def __iter__(self):
+        buffered, self._buffer = self._buffer, collections.deque()
+        return itertools.chain(buffered, self._rows)
+
+
+class MappedCsvReader(FileReader):
+
+    """
+    Fast reader for account files holding one account number per line.
+
+    The file is memory mapped and split into lines a block at a time with bulk string operations, each block
+    producing a batch of account numbers. Blocks holding a comma are parsed with `csv` so that only the first column
+    is kept; once a quote shows up, the rest of the file is parsed with `csv`, as quoted fields may span lines.
+
+    When given, `start` and `end` restrict the reader to the lines within that byte range, which must begin at the
+    start of a line (see `sharding.byte_ranges`). A range without any account number simply has no rows, while a
+    whole file without any is rejected as empty.
+    """
+
+    BLOCK_BYTES = 1024 * 1024
+
+    def __init__(self, filename, start=0, end=None):
+        super(MappedCsvReader, self).__init__(filename)
+        self.start = start
+        self.end = end
+        self.map = None
+        self._read(self.get_batches(), allow_empty=self.end is not None)
 
     def close(self):
-        self.descriptor.close()
+        if self.map:
+            self.map.close()
+            self.map = None
+        super(MappedCsvReader, self).close()
 
-    def exceeds_allowed_row_count(self, **kwargs):
-        return super(CsvReader, self).exceeds_allowed_row_count(
-            csv.reader(self.descriptor), kwargs.get("max_limit_count"))
+    def get_batches(self):
+        """
+        Scans the file again from the start of the range, yielding one list of account numbers per block.
+        """
+        self.close()
+        self.descriptor = open(self.filename, 'rb')
+        size = os.fstat(self.descriptor.fileno()).st_size
+        end = size if self.end is None else min(self.end, size)
+        if end <= self.start:
+            return
+        self.map = mmap.mmap(self.descriptor.fileno(), 0, access=mmap.ACCESS_READ)
 
-    def get_rows(self):
-        self.descriptor = open(self.filename, 'rU')
-        for row in csv.reader(self.descriptor):
-            yield row[0]
+        position = self.start
+        terminator = self._terminator(position, end)
+        while position < end:
+            block_end = self._line_end(min(position + self.BLOCK_BYTES, end), end, terminator)
+            block = self.map[position:block_end]
+            if '"' in block:
+                for batch in _csv_batches(self._lines(position, end), self.BLOCK_BYTES // 16):
+                    yield batch
+                return
+            yield _first_column(block)
+            position = block_end
+
+    def _terminator(self, position, end):
+        # Blocks end on the terminator of the first line: '\n' for '\n' and '\r\n' files, so that a '\r\n' is never
+        # split, and '\r' for bare '\r' files. Found once, as searching for a '\n' a bare '\r' file lacks reads it all.
+        carriage_return = self.map.find('\r', position, end)
+        if (carriage_return != -1 and self.map[carriage_return + 1:carriage_return + 2] != '\n' and
+                self.map.find('\n', position, carriage_return) == -1):
+            return '\r'
+        return '\n'
+
+    def _line_end(self, position, end, terminator):
+        found = self.map.find(terminator, position, end)
+        return found + 1 if found != -1 else end
+
+    def _lines(self, position, end):
+        return _split_lines(self.map[block_start:min(block_start + self.BLOCK_BYTES, end)]
+                            for block_start in xrange(position, end, self.BLOCK_BYTES))
+
+
+class CompressedCsvReader(FileReader):
+
+    """
+    Reads gzip or bzip2 compressed CSV/TXT uploads, decompressing them a block at a time straight into batches of
+    account numbers, so the uncompressed file never touches the disk. Lines are split as in `MappedCsvReader`.
+    """
+
+    BLOCK_BYTES = 1024 * 1024
+
+    def __init__(self, filename):
+        super(CompressedCsvReader, self).__init__(filename)
+        self.decompressor = DECOMPRESSORS[filename.split('.')[-1].lower()]
+        self._read(self.get_batches())
+
+    def get_batches(self):
+        """
+        Decompresses the file again from the start, yielding one list of account numbers per block.
+        """
+        self.close()
+        self.descriptor = self.decompressor(self.filename, 'rb')
+        partial_line = ''
+        for data in iter(lambda: self.descriptor.read(self.BLOCK_BYTES), ''):
+            block = partial_line + data
+            line_end = max(block.rfind('\n'), block.rfind('\r')) + 1
+            block, partial_line = block[:line_end], block[line_end:]
+            if '"' in block:
+                for batch in _csv_batches(self._lines(block, partial_line), self.BLOCK_BYTES // 16):
+                    yield batch
+                return
+            yield _first_column(block)
+        if partial_line:
+            for batch in _csv_batches([partial_line], 1):
+                yield batch
+
+    def _lines(self, block, partial_line):
+        return _split_lines(itertools.chain(
+            [block, partial_line], iter(lambda: self.descriptor.read(self.BLOCK_BYTES), '')))
 
 
 class ExcelReader(FileReader):
@@ -81,11 +248,35 @@ class ExcelReader(FileReader):
         pass
 
 
+class XlsxReader(FileReader):
+
+    """
+    Reads the first column of XLSX worksheets, by default only the active one, producing the same rows as
+    `ExcelReader` without building a cell object per column (see `xlsx.Workbook`).
+    """
+
+    def __init__(self, filename, sheet_names=None):
+        super(XlsxReader, self).__init__(filename)
+        self.descriptor = xlsx.workbook(self.filename)
+        self.sheet_names = sheet_names or [self.descriptor.active_sheet]
+        self._read(self.get_batches())
+
+    def get_batches(self):
+        for sheet_name in self.sheet_names:
+            for batch in self.descriptor.first_column(sheet_name):
+                yield batch
+
+
 class BulkAccountsFileReaders(object):
 
     @classmethod
     def get(cls, file_path):
-        file_type = file_path.split('.')[-1].lower()
+        extensions = file_path.lower().split('.')
+        file_type = extensions[-1]
+        if file_type in DECOMPRESSORS and extensions[-2:-1] in [['csv'], ['txt']]:
+            return CompressedCsvReader(file_path)
         if file_type in ['csv', 'txt']:
-            return CsvReader(file_path)
+            return MappedCsvReader(file_path)
+        if file_type in ['xlsx', 'xlsm', 'xltx', 'xltm']:
+            return XlsxReader(file_path)
         return ExcelReader(file_path)
@@ -0,0 +1,98 @@
+import logging
+import multiprocessing
+import os
+import shutil
+
+import configuration
+from app.services import bulk, clients, readers
+
+logger = logging.getLogger(__name__)
+
+SHARDED_EXTENSIONS = ('csv', 'txt')
+SNIFF_BYTES = 64 * 1024
+
+
+def should_shard(file_path):
+    """
+    Large CSV/TXT uploads with newline terminated rows are split into byte ranges indexed by separate processes.
+    Files using bare carriage returns as line terminators are read whole.
+    """
+    if configuration.data.INGESTION_SHARD_COUNT < 2 or file_path.split('.')[-1].lower() not in SHARDED_EXTENSIONS:
+        return False
+    try:
+        if os.path.getsize(file_path) < configuration.data.INGESTION_SHARDING_MIN_FILE_BYTES:
+            return False
+        with open(file_path, 'rb') as descriptor:
+            sample = descriptor.read(SNIFF_BYTES)
+    except (IOError, OSError):
+        return False
+    return '\n' in sample
+
+
+def byte_ranges(file_path, shard_count):
+    """
+    Splits a file into at most `shard_count` contiguous [start, end) byte ranges, each starting at the beginning of a
+    line.
+    """
+    size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, 'rb') as descriptor:
+        for shard in xrange(1, shard_count):
+            descriptor.seek(max(size * shard // shard_count - 1, boundaries[-1]))
+            descriptor.readline()
+            boundary = descriptor.tell()
+            if boundary >= size:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(size)
+    return zip(boundaries[:-1], boundaries[1:])
+
+
+def _index_shard(file_path, start, end, action, index, doc_type, dead_letter_path):
+    logger.info("Indexing bytes [{}, {}) of {}".format(start, end, file_path))
+    reader = readers.MappedCsvReader(file_path, start, end)
+    try:
+        return bulk.index_rows(clients.get_client(), reader.get_rows(), action=action, index=index,
+                               doc_type=doc_type, dead_letter_path=dead_letter_path)
+    finally:
+        reader.close()
+
+
+def _index_shard_star(arguments):
+    return _index_shard(*arguments)
+
+
+def _merge_dead_letters(shard_paths, dead_letter_path):
+    shard_paths = [path for path in shard_paths if os.path.exists(path)]
+    if not shard_paths:
+        return
+    with open(dead_letter_path, 'wb') as destination:
+        for path in shard_paths:
+            with open(path, 'rb') as source:
+                shutil.copyfileobj(source, destination)
+            os.remove(path)
+
+
+def index_shards(file_path, action, index, doc_type, dead_letter_path):
+    """
+    Indexes a file as newline aligned byte ranges, each parsed and bulk indexed by its own process. Returns the
+    number of successful and failed documents over all the shards; failed documents are merged into a single dead
+    letter file.
+    """
+    ranges = byte_ranges(file_path, configuration.data.INGESTION_SHARD_COUNT)
+    shard_dead_letter_paths = ['{}.{}'.format(dead_letter_path, shard) for shard in xrange(len(ranges))]
+    logger.info("Indexing {} in {} shards".format(file_path, len(ranges)))
+
+    pool = multiprocessing.Pool(len(ranges))
+    try:
+        results = pool.map(_index_shard_star, [
+            (file_path, start, end, action, index, doc_type, shard_dead_letter_path)
+            for (start, end), shard_dead_letter_path in zip(ranges, shard_dead_letter_paths)])
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        _merge_dead_letters(shard_dead_letter_paths, dead_letter_path)
+
+    return sum(success for success, _ in results), sum(failed for _, failed in results)
@@ -0,0 +1,228 @@
+import binascii
+import glob
+import hashlib
+import itertools
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+
+import configuration
+from app.services import bloom, diff
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIRECTORY = '.member_snapshots'
+VERSION_SUFFIX = '.version'
+BUILDING_SUFFIX = '.building'
+
+SORTED = 'sorted'
+BLOOM = 'bloom'
+FORMATS = (SORTED, BLOOM)
+
+FORMAT_VERSION = 1
+# Magic, format version, width and count of the account numbers.
+SORTED_HEADER = struct.Struct('<4sHHQ')
+SORTED_MAGIC = 'LLSS'
+# Magic, format version, hash count, bit count and count of the account numbers.
+BLOOM_HEADER = struct.Struct('<4sHHQQ')
+BLOOM_MAGIC = 'LLSB'
+
+
+def _encode(member_id):
+    if isinstance(member_id, unicode):
+        member_id = member_id.encode('utf-8')
+    return member_id
+
+
+def _sorted_members(path):
+    # Members are sorted by their hex encoding, which orders them like their bytes padded with NUL bytes.
+    with open(path, 'rb') as members:
+        for line in members:
+            yield binascii.unhexlify(diff.decode_key(line))
+
+
+def _write(path, chunks):
+    digest = hashlib.md5()
+    with open(path, 'wb') as snapshot:
+        for chunk in chunks:
+            digest.update(chunk)
+            snapshot.write(chunk)
+    return digest.hexdigest()
+
+
+class SnapshotStore(object):
+
+    """
+    Downloadable snapshots of the members of list types, for clients that check membership in process. Each type has
+    a snapshot in every format, named after the MD5 of its contents (used as its ETag):
+
+    - `sorted`: a `SORTED_HEADER` followed by the UTF-8 account numbers, right padded with NUL bytes to the header's
+      width and sorted by their bytes, ready for a binary search.
+    - `bloom`: a `BLOOM_HEADER` followed by the bits of a Bloom filter. The positions of an account number are
+      `(h1 + i * h2) % bit count` for `i` below the hash count, where `h1` and `h2` are the two little endian unsigned
+      64 bit halves of the MD5 of its UTF-8 bytes; position `p` is bit `p % 8` of byte `p / 8`.
+
+    Snapshots are built by streaming the members through an external sort, so their size is not bound by memory. Every
+    change to a type invalidates its snapshots, and a build that started before the last invalidation is dropped. A
+    build is claimed before it is scheduled, so that concurrent downloads of a missing snapshot build it only once; a
+    claim older than `build_timeout` seconds is assumed to belong to a build that died.
+    """
+
+    def __init__(self, directory, run_size, false_positive_rate, build_timeout=600):
+        self.directory = directory
+        self.run_size = run_size
+        self.false_positive_rate = false_positive_rate
+        self.build_timeout = build_timeout
+
+    def _index_directory(self, index):
+        return os.path.join(self.directory, index)
+
+    def _path(self, index, doc_type, etag, snapshot_format):
+        return os.path.join(self._index_directory(index), '{}.{}.{}'.format(doc_type, etag, snapshot_format))
+
+    def _version_path(self, index, doc_type):
+        return os.path.join(self._index_directory(index), doc_type + VERSION_SUFFIX)
+
+    def _building_path(self, index, doc_type):
+        return os.path.join(self._index_directory(index), doc_type + BUILDING_SUFFIX)
+
+    def _version(self, index, doc_type):
+        try:
+            with open(self._version_path(index, doc_type)) as version:
+                return int(version.read() or 0)
+        except IOError:
+            return 0
+
+    def _remove(self, index, doc_type):
+        for snapshot_format in FORMATS:
+            for path in glob.glob(self._path(index, doc_type, '*', snapshot_format)):
+                os.remove(path)
+
+    def get(self, index, doc_type, snapshot_format):
+        """
+        Returns the open snapshot of a type and its ETag, or None when the type has no snapshot.
+        """
+        for path in glob.glob(self._path(index, doc_type, '*', snapshot_format)):
+            try:
+                return open(path, 'rb'), path.rsplit('.', 2)[1]
+            except IOError:
+                continue
+        return None
+
+    def claim_build(self, index, doc_type):
+        """
+        Claims the build of the snapshots of a type. Returns False when a build of its current version is already
+        claimed.
+        """
+        with bloom.locked(self._index_directory(index)):
+            version = self._version(index, doc_type)
+            try:
+                with open(self._building_path(index, doc_type)) as building:
+                    claimed_version, claimed_at = building.read().split()
+                if int(claimed_version) == version and time.time() - float(claimed_at) < self.build_timeout:
+                    return False
+            except (IOError, ValueError):
+                pass
+            with open(self._building_path(index, doc_type), 'w') as building:
+                building.write('{} {!r}'.format(version, time.time()))
+        return True
+
+    def release_build(self, index, doc_type):
+        with bloom.locked(self._index_directory(index)):
+            try:
+                os.remove(self._building_path(index, doc_type))
+            except OSError:
+                pass
+
+    def build(self, index, doc_type, members):
+        """
+        Builds the snapshots of a type from `members`, an iterable of its current members which must be read after
+        this method is called, and releases the claim on the build.
+        """
+        index_directory = self._index_directory(index)
+        with bloom.locked(index_directory):
+            version = self._version(index, doc_type)
+
+        built = {}
+        try:
+            with diff.ListDiff(self.run_size, directory=index_directory) as list_diff:
+                sorted_path = list_diff.sort(
+                    (binascii.hexlify(_encode(member_id)) for member_id in members), 'members')
+                count = width = 0
+                for member_id in _sorted_members(sorted_path):
+                    count += 1
+                    width = max(width, len(member_id))
+
+                path = os.path.join(index_directory, '{}.{}.tmp'.format(doc_type, uuid.uuid4().hex))
+                header = SORTED_HEADER.pack(SORTED_MAGIC, FORMAT_VERSION, width, count)
+                built[SORTED] = path, _write(path, itertools.chain([header], (
+                    member_id.ljust(width, '\0') for member_id in _sorted_members(sorted_path))))
+
+                bloom_filter = bloom.BloomFilter.for_capacity(count, self.false_positive_rate)
+                for member_id in _sorted_members(sorted_path):
+                    bloom_filter.add(member_id)
+                path = os.path.join(index_directory, '{}.{}.tmp'.format(doc_type, uuid.uuid4().hex))
+                header = BLOOM_HEADER.pack(BLOOM_MAGIC, FORMAT_VERSION, bloom_filter.hash_count,
+                                           bloom_filter.bit_count, count)
+                built[BLOOM] = path, _write(path, [header, str(bloom_filter.bits)])
+
+            with bloom.locked(index_directory):
+                if self._version(index, doc_type) != version:
+                    logger.info("/{}/{} changed while its snapshots were built, dropping them".format(index, doc_type))
+                    return
+                self._remove(index, doc_type)
+                for snapshot_format, (path, etag) in built.iteritems():
+                    os.rename(path, self._path(index, doc_type, etag, snapshot_format))
+            logger.info("Built snapshots of /{}/{}: {} members of up to {} bytes".format(index, doc_type, count, width))
+        finally:
+            for path, _ in built.itervalues():
+                if os.path.exists(path):
+                    os.remove(path)
+            self.release_build(index, doc_type)
+
+    def invalidate(self, index, doc_type):
+        """
+        Removes the snapshots of a type and drops the ones being built, as the type is about to change.
+        """
+        with bloom.locked(self._index_directory(index)):
+            version = self._version(index, doc_type) + 1
+            with open(self._version_path(index, doc_type), 'w') as version_file:
+                version_file.write(str(version))
+            self._remove(index, doc_type)
+
+    def discard(self, index, doc_type):
+        """
+        Removes the snapshots of a type that was deleted, with its version.
+        """
+        with bloom.locked(self._index_directory(index)):
+            self._remove(index, doc_type)
+            for path in (self._version_path(index, doc_type), self._building_path(index, doc_type)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SnapshotStore(
+                directory=os.path.join(configuration.data.VOLUME_MAPPINGS_FILE_UPLOAD_TARGET, SNAPSHOT_DIRECTORY),
+                run_size=configuration.data.LIST_DIFF_SORT_RUN_SIZE,
+                false_positive_rate=configuration.data.MEMBERSHIP_BLOOM_FILTER_FALSE_POSITIVE_RATE,
+                build_timeout=configuration.data.SNAPSHOT_BUILD_TIMEOUT_SECONDS)
+        return _store
+
+
+def reset():
+    global _store
+    with _store_lock:
+        _store = None
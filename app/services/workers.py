@@ -0,0 +1,116 @@
+import logging
+import multiprocessing
+import os
+import threading
+from multiprocessing import pool
+
+from liblcp import context
+
+import configuration
+from app import exceptions
+
+logger = logging.getLogger(__name__)
+
+
+def _execute(job, headers, *args):
+    """
+    Runs a job inside a pool worker. The LCP headers of the request that scheduled the job are not available in the
+    worker process, so they are carried along and installed as the context headers getter before the job runs.
+    """
+    context.set_headers_getter(lambda name: headers.get(name))
+    return job(*args)
+
+
+class _NonDaemonicProcess(multiprocessing.Process):
+
+    # Pool workers are daemonic by default, and daemonic processes may not start processes of their own.
+    def _get_daemon(self):
+        return False
+
+    def _set_daemon(self, value):
+        pass
+
+    daemon = property(_get_daemon, _set_daemon)
+
+
+class _NonDaemonicPool(pool.Pool):
+    Process = _NonDaemonicProcess
+
+
+class WorkerPool(object):
+
+    """
+    Long-lived pool of pre-forked worker processes with a bounded number of pending jobs.
+
+    Jobs must be module level functions (so they can be pickled) and are scheduled onto warm workers instead of
+    forking a new process per request. Workers are not daemonic, so jobs can fan out to processes of their own.
+    Finished jobs are reaped on every submission; once `max_pending` jobs are queued or running, further submissions
+    are rejected with a `WorkerPoolFullError`.
+    """
+
+    def __init__(self, processes, max_pending, max_tasks_per_child=None):
+        self.processes = processes
+        self.max_pending = max_pending
+        self.max_tasks_per_child = max_tasks_per_child
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._pending = []
+
+    @property
+    def pending_count(self):
+        with self._lock:
+            self._reap()
+            return len(self._pending)
+
+    def start(self):
+        with self._lock:
+            return self._get_pool()
+
+    def submit(self, job, *args, **kwargs):
+        with self._lock:
+            self._reap()
+            if len(self._pending) >= self.max_pending:
+                logger.warning("Worker pool is full ({} pending jobs), rejecting {}".format(
+                    len(self._pending), job.__name__))
+                raise exceptions.WorkerPoolFullError()
+            result = self._get_pool().apply_async(
+                _execute, (job, context.get_headers()) + args, callback=kwargs.get('callback'))
+            self._pending.append(result)
+            logger.info("Scheduled {} on the worker pool ({} pending jobs)".format(job.__name__, len(self._pending)))
+            return result
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.close()
+                self._pool.join()
+            self._pool = None
+            self._pending = []
+
+    def _reap(self):
+        self._pending = [result for result in self._pending if not result.ready()]
+
+    def _get_pool(self):
+        # A pool inherited through a fork belongs to the parent process; its workers can't be used from here.
+        if self._pool is None or self._pid != os.getpid():
+            logger.info("Starting worker pool with {} processes".format(self.processes))
+            self._pool = _NonDaemonicPool(self.processes, maxtasksperchild=self.max_tasks_per_child)
+            self._pid = os.getpid()
+            self._pending = []
+        return self._pool
+
+
+_ingestion_pool = None
+_ingestion_pool_lock = threading.Lock()
+
+
+def ingestion_pool():
+    global _ingestion_pool
+    with _ingestion_pool_lock:
+        if _ingestion_pool is None:
+            _ingestion_pool = WorkerPool(
+                processes=configuration.data.INGESTION_WORKER_COUNT,
+                max_pending=configuration.data.INGESTION_QUEUE_MAX_SIZE,
+                max_tasks_per_child=configuration.data.INGESTION_WORKER_MAX_TASKS_PER_CHILD)
+        return _ingestion_pool
@@ -0,0 +1,302 @@
+import collections
+import logging
+import posixpath
+import re
+import zipfile
+from multiprocessing import pool as process_pool
+from xml.etree import cElementTree
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+
+import configuration
+
+logger = logging.getLogger(__name__)
+
+SHEET_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+WORKBOOK_PATH = 'xl/workbook.xml'
+WORKBOOK_RELATIONSHIPS_PATH = 'xl/_rels/workbook.xml.rels'
+
+ROW_TAG = '{%s}row' % SHEET_MAIN_NS
+CELL_TAG = '{%s}c' % SHEET_MAIN_NS
+VALUE_TAG = '{%s}v' % SHEET_MAIN_NS
+FORMULA_TAG = '{%s}f' % SHEET_MAIN_NS
+SHARED_STRING_TAG = '{%s}si' % SHEET_MAIN_NS
+TEXT_TAG = '{%s}t' % SHEET_MAIN_NS
+RICH_TEXT_RUN_TAG = '{%s}r' % SHEET_MAIN_NS
+
+SHEET_DATA_RE = re.compile(r'<([\w.-]+:)?sheetData\b[^>]*?(/?)>')
+ROOT_RE = re.compile(r'<((?:[\w.-]+:)?worksheet)\b[^>]*>')
+DIMENSION_RE = re.compile(r'<(?:[\w.-]+:)?dimension\b[^>]*\bref="([^"]*)"')
+
+BLOCK_BYTES = 1024 * 1024
+FIRST_COLUMN = 'A'
+
+
+def _cast_number(value):
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return long(value)
+
+
+def _max_row(head):
+    # Like openpyxl, rows past the declared dimension are not read; without a dimension every row is.
+    match = DIMENSION_RE.search(head)
+    if not match:
+        return None
+    last = match.group(1).split(':')[-1].replace('$', '')
+    row = last.lstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')
+    return int(row) if row.isdigit() else None
+
+
+class CellConverter(object):
+
+    """
+    Turns the first cell of `<row>` elements into the values `openpyxl` gives for them in read only mode: shared and
+    inline strings as unicode, numbers as long or float (datetime when the cell style has a date format), booleans,
+    and formulas as their "=..." text.
+    """
+
+    def __init__(self, shared_strings, date_styles, base_date):
+        self.shared_strings = shared_strings
+        self.date_styles = date_styles
+        self.base_date = base_date
+
+    def value(self, cell):
+        formula = cell.findtext(FORMULA_TAG)
+        if formula is not None:
+            return '=' + formula
+        value = cell.findtext(VALUE_TAG) or None
+        if value is None:
+            return None
+
+        data_type = cell.get('t', 'n')
+        if data_type == 'n':
+            number = _cast_number(value)
+            if int(cell.get('s', 0)) in self.date_styles:
+                return from_excel(number, self.base_date)
+            return number
+        if data_type == 's':
+            return self.shared_strings[int(value)]
+        if data_type == 'b':
+            return value == '1'
+        if data_type in ('inlineStr', 'str'):
+            return unicode(value)
+        return value
+
+    def parse_block(self, root_start, block, root_end):
+        """
+        Returns (row number, first column value) pairs for a block of complete `<row>` elements. The block is parsed
+        inside a copy of the sheet's root element so that namespace prefixes resolve as in the original document.
+        """
+        rows = []
+        for row in cElementTree.fromstring(root_start + block + root_end):
+            if row.tag != ROW_TAG:
+                continue
+            number = row.get('r')
+            cell = row.find(CELL_TAG)
+            if cell is not None and cell.get('r', FIRST_COLUMN).rstrip('0123456789') != FIRST_COLUMN:
+                cell = None
+            rows.append((int(number) if number else None, None if cell is None else self.value(cell)))
+        return rows
+
+
+_worker_converter = None
+
+
+def _initialize_worker(converter):
+    global _worker_converter
+    _worker_converter = converter
+
+
+def _parse_block_in_worker(root_start, block, root_end):
+    return _worker_converter.parse_block(root_start, block, root_end)
+
+
+class Workbook(object):
+
+    """
+    Reads the first column of XLSX worksheets by streaming the sheet XML straight out of the archive.
+
+    Only the workbook metadata needed to interpret cells (sheet paths, shared strings and date styles) is loaded up
+    front. The sheet XML is decompressed in blocks of complete rows; with `process_count` above one, sheets of at least
+    `parallel_min_bytes` (uncompressed) have their blocks parsed by a pool of worker processes, in order.
+    """
+
+    def __init__(self, filename, process_count=1, parallel_min_bytes=0):
+        self.filename = filename
+        self.process_count = process_count
+        self.parallel_min_bytes = parallel_min_bytes
+        self.archive = zipfile.ZipFile(filename)
+        try:
+            self._read_metadata()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self.archive.close()
+
+    def _read_metadata(self):
+        relationships = {}
+        styles_path = shared_strings_path = None
+        for relationship in cElementTree.fromstring(self.archive.read(WORKBOOK_RELATIONSHIPS_PATH)):
+            target = relationship.get('Target')
+            path = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+            relationships[relationship.get('Id')] = path
+            relationship_type = relationship.get('Type', '')
+            if relationship_type.endswith('/styles'):
+                styles_path = path
+            elif relationship_type.endswith('/sharedStrings'):
+                shared_strings_path = path
+            elif not relationship_type.endswith('/worksheet'):
+                relationships.pop(relationship.get('Id'))
+
+        workbook = cElementTree.fromstring(self.archive.read(WORKBOOK_PATH))
+        self.sheets = collections.OrderedDict(
+            (sheet.get('name'), relationships[sheet.get('{%s}id' % RELATIONSHIPS_NS)])
+            for sheet in workbook.iter('{%s}sheet' % SHEET_MAIN_NS)
+            if sheet.get('{%s}id' % RELATIONSHIPS_NS) in relationships)
+
+        view = workbook.find('{%s}bookViews/{%s}workbookView' % (SHEET_MAIN_NS, SHEET_MAIN_NS))
+        active = int(view.get('activeTab', 0)) if view is not None else 0
+        self.active_sheet = self.sheets.keys()[active if active < len(self.sheets) else 0]
+
+        properties = workbook.find('{%s}workbookPr' % SHEET_MAIN_NS)
+        self.base_date = (CALENDAR_MAC_1904 if properties is not None and properties.get('date1904') in ('1', 'true')
+                          else CALENDAR_WINDOWS_1900)
+        self.shared_strings = self._read_shared_strings(shared_strings_path)
+        self.date_styles = self._read_date_styles(styles_path)
+
+    def _read_shared_strings(self, path):
+        strings = []
+        if path is None or path not in self.archive.namelist():
+            return strings
+        for _, element in cElementTree.iterparse(self.archive.open(path)):
+            if element.tag != SHARED_STRING_TAG:
+                continue
+            text = element.findtext(TEXT_TAG)
+            if text is None or len(element) > 1:
+                # Rich text: the text of every formatted run follows the plain text, phonetic hints are left out.
+                text = u''.join([text or u''] + [run.findtext(TEXT_TAG) or u''
+                                                 for run in element.findall(RICH_TEXT_RUN_TAG)])
+            if 'x005F_' in text:
+                text = text.replace('x005F_', '')
+            strings.append(unicode(text))
+            element.clear()
+        return strings
+
+    def _read_date_styles(self, path):
+        if path is None or path not in self.archive.namelist():
+            return frozenset()
+        styles = cElementTree.fromstring(self.archive.read(path))
+        custom_formats = dict(
+            (int(number_format.get('numFmtId')), number_format.get('formatCode'))
+            for number_format in styles.iter('{%s}numFmt' % SHEET_MAIN_NS))
+        cell_formats = styles.find('{%s}cellXfs' % SHEET_MAIN_NS)
+        date_styles = set()
+        for index, cell_format in enumerate(cell_formats if cell_formats is not None else []):
+            number_format_id = int(cell_format.get('numFmtId', 0))
+            if number_format_id in custom_formats:
+                format_code = custom_formats[number_format_id]
+            else:
+                format_code = BUILTIN_FORMATS.get(number_format_id, 'General')
+            if is_date_format(format_code):
+                date_styles.add(index)
+        return frozenset(date_styles)
+
+    def converter(self):
+        return CellConverter(self.shared_strings, self.date_styles, self.base_date)
+
+    def _blocks(self, path):
+        """
+        Returns the XML preceding the sheet data and an iterator over blocks of complete `<row>` elements.
+        """
+        stream = self.archive.open(path)
+        head = ''
+        match = None
+        while match is None:
+            data = stream.read(BLOCK_BYTES)
+            if not data:
+                return head, iter(())
+            head += data
+            match = SHEET_DATA_RE.search(head)
+        if match.group(2):
+            return head[:match.start()], iter(())
+        return head[:match.start()], self._row_blocks(stream, head[match.end():], match.group(1) or '')
+
+    @staticmethod
+    def _row_blocks(stream, data, prefix):
+        row_end = '</{}row>'.format(prefix)
+        sheet_data_end = '</{}sheetData>'.format(prefix)
+        buffered = ''
+        while data:
+            buffered += data
+            end = buffered.find(sheet_data_end, max(0, len(buffered) - len(data) - len(sheet_data_end)))
+            if end != -1:
+                yield buffered[:end]
+                return
+            cut = buffered.rfind(row_end)
+            if cut != -1 and len(buffered) >= BLOCK_BYTES:
+                cut += len(row_end)
+                yield buffered[:cut]
+                buffered = buffered[cut:]
+            data = stream.read(BLOCK_BYTES)
+        if buffered:
+            yield buffered
+
+    def _parsed_blocks(self, path):
+        head, blocks = self._blocks(path)
+        root = ROOT_RE.search(head)
+        root_start, root_end = root.group(0), '</{}>'.format(root.group(1))
+        converter = self.converter()
+        parallel = (self.process_count > 1 and
+                    self.archive.getinfo(path).file_size >= self.parallel_min_bytes)
+
+        if not parallel:
+            return _max_row(head), (converter.parse_block(root_start, block, root_end) for block in blocks)
+        return _max_row(head), self._parse_in_parallel(converter, root_start, blocks, root_end)
+
+    def _parse_in_parallel(self, converter, root_start, blocks, root_end):
+        # At most two blocks per process are in flight, so the decompressed sheet is never read ahead into memory.
+        logger.info("Parsing {} with {} processes".format(self.filename, self.process_count))
+        pool = process_pool.Pool(self.process_count, initializer=_initialize_worker, initargs=(converter,))
+        pending = collections.deque()
+        try:
+            for block in blocks:
+                pending.append(pool.apply_async(_parse_block_in_worker, (root_start, block, root_end)))
+                if len(pending) >= 2 * self.process_count:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def first_column(self, sheet_name=None):
+        """
+        Yields lists holding the first column value of consecutive rows of a sheet, the active sheet by default.
+        Rows missing from the sheet XML, or without a first column cell, have a value of None.
+        """
+        max_row, blocks = self._parsed_blocks(self.sheets[sheet_name or self.active_sheet])
+        row_counter = 0
+        for rows in blocks:
+            values = []
+            for number, value in rows:
+                number = number or row_counter + 1
+                if max_row is not None and number > max_row:
+                    if values:
+                        yield values
+                    return
+                values.extend([None] * (number - row_counter - 1))
+                values.append(value)
+                row_counter = number
+            if values:
+                yield values
+
+
+def workbook(filename):
+    return Workbook(filename, process_count=configuration.data.XLSX_PARSER_PROCESS_COUNT,
+                    parallel_min_bytes=configuration.data.XLSX_PARALLEL_MIN_SHEET_BYTES)
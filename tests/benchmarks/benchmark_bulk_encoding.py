@@ -0,0 +1,64 @@
+"""
+Compares the CPU time needed to turn account numbers into bulk request bodies using the generic path (one document
+dictionary per row, serialized by the Elastic Search helpers) against `bulk.BulkBodyEncoder`.
+
+    python -m tests.benchmarks.benchmark_bulk_encoding [rows]
+"""
+import sys
+import time
+
+from elasticsearch import helpers, serializer
+
+from app import operations
+from app.services import bulk
+
+CHUNK_SIZE = 8 * 1024
+MAX_CHUNK_BYTES = 10 * 1024 * 1024
+
+
+def _account_numbers(rows):
+    return ('{:016d}'.format(index) for index in xrange(rows))
+
+
+def _document(account_number):
+    return {
+        "_op_type": operations.ElasticSearchPermittedOperations.INDEX,
+        "_index": 'service',
+        "_type": 'list',
+        "_id": account_number,
+        "_source": {
+            "accountNumber": account_number
+        }
+    }
+
+
+def helpers_path(rows):
+    actions = (_document(account_number) for account_number in _account_numbers(rows))
+    for chunk in helpers._chunk_actions(
+            (helpers.expand_action(action) for action in actions), CHUNK_SIZE, MAX_CHUNK_BYTES,
+            serializer.JSONSerializer()):
+        '\n'.join(chunk) + '\n'
+
+
+def encoder_path(rows):
+    encoder = bulk.BulkBodyEncoder(
+        action=operations.ElasticSearchPermittedOperations.INDEX, index='service', doc_type='list')
+    for chunk in encoder.chunks(_account_numbers(rows), bulk.ChunkSizer(CHUNK_SIZE, MAX_CHUNK_BYTES)):
+        ''.join(chunk)
+
+
+def measure(function, rows):
+    start = time.clock()
+    function(rows)
+    return time.clock() - start
+
+
+def main(rows):
+    helpers_time = measure(helpers_path, rows)
+    encoder_time = measure(encoder_path, rows)
+    print('{} rows: helpers {:.2f}s, encoder {:.2f}s, speedup {:.1f}x'.format(
+        rows, helpers_time, encoder_time, helpers_time / encoder_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,53 @@
+"""
+Compares the CPU time needed to produce the account numbers of a single-column CSV file with the `csv` module, as
+uploads were read before, against `readers.MappedCsvReader`.
+
+    python -m tests.benchmarks.benchmark_readers [rows]
+"""
+import csv
+import os
+import sys
+import tempfile
+import time
+
+from app.services import readers
+
+
+def _write_accounts(rows):
+    descriptor, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(descriptor, 'wb') as accounts:
+        for index in xrange(rows):
+            accounts.write('{:016d}\r\n'.format(index))
+    return path
+
+
+def measure_csv(path):
+    start = time.clock()
+    with open(path, 'rU') as accounts:
+        for _ in (row[0] for row in csv.reader(accounts) if row):
+            pass
+    return time.clock() - start
+
+
+def measure(reader_class, path):
+    start = time.clock()
+    reader = reader_class(path)
+    for _ in reader.get_rows():
+        pass
+    reader.close()
+    return time.clock() - start
+
+
+def main(rows):
+    path = _write_accounts(rows)
+    try:
+        csv_time = measure_csv(path)
+        mapped_time = measure(readers.MappedCsvReader, path)
+    finally:
+        os.remove(path)
+    print('{} rows: csv {:.2f}s, mapped {:.2f}s, speedup {:.1f}x'.format(
+        rows, csv_time, mapped_time, csv_time / mapped_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
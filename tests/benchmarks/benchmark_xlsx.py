@@ -0,0 +1,53 @@
+"""
+Compares the CPU and wall clock time needed to produce the first column of a three column XLSX sheet with
+`readers.ExcelReader` (openpyxl, read only mode) against `xlsx.Workbook`, on one process and on several.
+
+    python -m tests.benchmarks.benchmark_xlsx [rows] [processes]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+from app.services import readers, xlsx
+
+
+def _write_accounts(rows):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for index in xrange(rows):
+        sheet.append(['{:016d}'.format(index), index, 'partner'])
+    descriptor, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(descriptor)
+    workbook.save(path)
+    return path
+
+
+def measure(function):
+    start, clock = time.time(), time.clock()
+    for _ in function():
+        pass
+    return time.time() - start, time.clock() - clock
+
+
+def main(rows, processes):
+    path = _write_accounts(rows)
+    try:
+        results = [
+            ('openpyxl', measure(lambda: readers.ExcelReader(path).get_rows())),
+            ('streaming', measure(lambda: xlsx.Workbook(path).first_column())),
+            ('streaming x{}'.format(processes), measure(
+                lambda: xlsx.Workbook(path, process_count=processes).first_column())),
+        ]
+    finally:
+        os.remove(path)
+    baseline = results[0][1][0]
+    for name, (wall, cpu) in results:
+        print('{} rows, {}: {:.2f}s ({:.2f}s CPU in this process), speedup {:.1f}x'.format(
+            rows, name, wall, cpu, baseline / wall))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000, int(sys.argv[2]) if len(sys.argv) > 2 else 4)
@@ -38,7 +38,7 @@ class DeleteListEndpointTest(base.BaseIntegrationLiveStubServerTestCase):
 
         tools.assert_equal(httplib.ACCEPTED, response.status_code)
         tools.assert_in(base.ListPaths.delete(relative_url=True, **PATH_PARAMS), urls.self_link(response_content))
-        tools.assert_true(response_content['acknowledged'])
+        tools.assert_in('/jobs/', response_content['links']['job']['href'])
 
     def test_delete_list_with_errors(self):
         self.queue_transport_error()
@@ -62,7 +62,7 @@ class DeleteListEndpointTest(base.BaseIntegrationLiveStubServerTestCase):
 
         tools.assert_equal(httplib.ACCEPTED, response.status_code)
         tools.assert_in(base.ListPaths.delete(relative_url=True, **PATH_PARAMS), urls.self_link(response_content))
-        tools.assert_true(response_content['acknowledged'])
+        tools.assert_in('/jobs/', response_content['links']['job']['href'])
 
     def test_delete_list_with_count_initally_one(self):
         self.queue_stub_response(builders.ESCountResponseBuilder().with_count(0).http_response())
@@ -75,4 +75,4 @@ class DeleteListEndpointTest(base.BaseIntegrationLiveStubServerTestCase):
 
         tools.assert_equal(httplib.ACCEPTED, response.status_code)
         tools.assert_in(base.ListPaths.delete(relative_url=True, **PATH_PARAMS), urls.self_link(response_content))
-        tools.assert_true(response_content['acknowledged'])
+        tools.assert_in('/jobs/', response_content['links']['job']['href'])
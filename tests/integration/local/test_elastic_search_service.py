@@ -33,7 +33,7 @@ class CreateListServiceTest(base.BaseIntegrationLiveStubServerTestCase):
     @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
     @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
     def test_create_list(self, mock_requests_wrapper_post, mock_file_readers):
-        mock_csv_reader = mock.MagicMock(autospec=readers.CsvReader)
+        mock_csv_reader = mock.MagicMock(autospec=readers.MappedCsvReader)
         mock_csv_reader.is_empty.return_value = False
         mock_csv_reader.get_rows.return_value = generator("account_no")
         mock_file_readers.get.return_value = mock_csv_reader
@@ -79,7 +79,7 @@ class CreateListServiceTest(base.BaseIntegrationLiveStubServerTestCase):
     @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
     @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
     def test_create_list_fails_on_elastic_search_error(self, mock_requests_wrapper_post, mock_file_readers):
-        mock_csv_reader = mock.MagicMock(autospec=readers.CsvReader)
+        mock_csv_reader = mock.MagicMock(autospec=readers.MappedCsvReader)
         mock_csv_reader.is_empty.return_value = False
         mock_csv_reader.get_rows.return_value = generator("account_no")
 
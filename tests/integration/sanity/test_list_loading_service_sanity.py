@@ -45,6 +45,11 @@ def delete_list(variation_id):
         urlparse.urljoin(configuration.data.list_loading_service_base_url, delete_url), data='{}', headers=headers)
 
 
+def job_status(job_url):
+    print "Testing deleted list job status ..."
+    return requests.get(job_url, headers=testing_utilities.generate_headers())
+
+
 def check_membership(account_number, variation_id):
     print "Testing if a member exists on the created list ..."
     check_membership_url = '/lists/{}/{}/members/{}'.format(
@@ -98,6 +103,12 @@ class SanityTests(base.BaseIntegrationTestCase):
         response = delete_list(self.variation_id)
         _assert(httplib.ACCEPTED, response.status_code)
 
+        @backoff.on_exception(backoff.expo, AssertionError, max_tries=5)
+        def _assert_job_succeeded(job_url):
+            tools.assert_equal('succeeded', job_status(job_url).json()['status'])
+
+        _assert_job_succeeded(response.json()['links']['job']['href'])
+
         response = list_status(self.variation_id)
         _assert(httplib.NOT_FOUND, response.status_code)
 
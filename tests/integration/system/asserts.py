@@ -68,10 +68,19 @@ def assert_list_delete(path_params, headers):
 
     tools.assert_equal(httplib.ACCEPTED, response.status_code)
     tools.assert_in(base.ListPaths.create(relative_url=True, **path_params), urls.self_link(response_content))
-    tools.assert_true(response_content['acknowledged'])
+    assert_job_succeeded(response_content['links']['job']['href'], headers)
     time.sleep(2)
 
 
+@backoff.on_exception(backoff.expo, AssertionError, max_tries=10)
+def assert_job_succeeded(job_url, headers):
+    response = requests.get(job_url, headers=headers)
+    response_content = response.json()
+
+    tools.assert_equal(httplib.OK, response.status_code)
+    tools.assert_equal('succeeded', response_content['status'])
+
+
 def assert_deleted_list_cannot_be_accessed(path_params, headers):
     response = requests.get(base.ListPaths.stats(**path_params), headers=headers)
     tools.assert_equal(httplib.NOT_FOUND, response.status_code)
@@ -1,7 +1,7 @@
 import httplib
 import json
-import multiprocessing
 import os
+import StringIO
 import unittest
 
 import flask
@@ -12,7 +12,6 @@ from werkzeug.datastructures import Headers
 import configuration
 from app import exceptions
 from app.controllers import lls_resource_api
-from tests import builders
 
 test_sandbox_headers = {
     'Content-Type': 'application/json',
@@ -36,9 +35,9 @@ class TestCreateListPutResourceController(unittest.TestCase):
             response = self.controller.put()
             tools.assert_equal(httplib.BAD_REQUEST, response[1])
 
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
     @mock.patch.object(flask, 'url_for', autospec=True)
-    @mock.patch.object(multiprocessing, 'Process', autospec=True)
-    def test_put(self, mock_multiprocessing, mock_url_for):
+    def test_put(self, mock_url_for, mock_service):
         app = flask.Flask(__name__)
         with app.test_request_context('/index/app/type/6d04bd2d-da75-420f-a52a-d2ffa0c48c42',
                                       method='PUT',
@@ -46,6 +45,69 @@ class TestCreateListPutResourceController(unittest.TestCase):
                                       data=json.dumps({'filePath': '/test/file'})):
             response = self.controller.put()
             tools.assert_equal(httplib.ACCEPTED, response[1])
+            tools.assert_equal(mock_service.return_value.schedule_create_list.call_count, 1)
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_put_when_worker_pool_is_full(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.schedule_create_list.side_effect = exceptions.WorkerPoolFullError
+        with app.test_request_context('/index/app/type/6d04bd2d-da75-420f-a52a-d2ffa0c48c42',
+                                      method='PUT',
+                                      headers=Headers(test_sandbox_headers),
+                                      data=json.dumps({'filePath': '/test/file'})):
+            response = self.controller.put()
+            tools.assert_equal(httplib.SERVICE_UNAVAILABLE, response[1])
+
+
+class TestReplaceListPutResourceController(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = lls_resource_api.ReplaceListPutResourceController()
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_put(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/contents',
+                                      method='PUT',
+                                      headers=Headers(test_sandbox_headers),
+                                      data=json.dumps({'filePath': '/test/file', 'callbackUrl': 'callback'})):
+            response = self.controller.put()
+            tools.assert_equal(httplib.ACCEPTED, response[1])
+            request = mock_service.return_value.schedule_replace_list.call_args[0][0]
+            tools.assert_equal((request.filePath, request.callbackUrl), ('/test/file', 'callback'))
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_put_when_worker_pool_is_full(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.schedule_replace_list.side_effect = exceptions.WorkerPoolFullError
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/contents',
+                                      method='PUT',
+                                      headers=Headers(test_sandbox_headers),
+                                      data=json.dumps({'filePath': '/test/file'})):
+            response = self.controller.put()
+            tools.assert_equal(httplib.SERVICE_UNAVAILABLE, response[1])
+
+
+class TestReloadListPutResourceController(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = lls_resource_api.ReloadListPutResourceController()
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_put(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/reload',
+                                      method='PUT',
+                                      headers=Headers(test_sandbox_headers),
+                                      data=json.dumps({'filePath': '/test/file', 'callbackUrl': 'callback'})):
+            response = self.controller.put()
+            tools.assert_equal(httplib.ACCEPTED, response[1])
+            request = mock_service.return_value.schedule_reload_list.call_args[0][0]
+            tools.assert_equal((request.filePath, request.callbackUrl), ('/test/file', 'callback'))
 
 
 class TestGetListByIdResourceController(unittest.TestCase):
@@ -76,42 +138,198 @@ class TestDeleteListResourceController(unittest.TestCase):
     @mock.patch.object(flask, 'url_for', autospec=True)
     def test_delete(self, mock_url_for, mock_service):
         app = flask.Flask(__name__)
-        mock_service.return_value.delete_list.return_value = (builders.ESDeleteResponseBuilder()
-                                                              .with_ok_response().http_response()['response'])
+        mock_service.return_value.schedule_delete_list.return_value = {'id': 'job', 'status': 'pending'}
         with app.test_request_context('/index/app/type/6d04bd2d-da75-420f-a52a-d2ffa0c48c42',
                                       method='DELETE',
                                       headers=Headers(test_sandbox_headers),
-                                      data=json.dumps({})):
+                                      data=json.dumps({'callbackUrl': 'callback'})):
             response = self.controller.delete()
             tools.assert_equal(httplib.ACCEPTED, response[1])
-            mock_url_for.assert_called_once_with(
-                lls_resource_api.GetListByIdResourceController.__name__.lower(), _external=True)
+            tools.assert_equal(mock_service.return_value.schedule_delete_list.call_args[0][0].callbackUrl, 'callback')
+            mock_url_for.assert_has_calls([
+                mock.call(lls_resource_api.GetListByIdResourceController.__name__.lower(), _external=True),
+                mock.call(lls_resource_api.JobGetResourceController.__name__.lower(), job_id='job', _external=True)])
 
     @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
     @mock.patch.object(flask, 'url_for', autospec=True)
     def test_delete_with_errors(self, mock_url_for, mock_service):
         app = flask.Flask(__name__)
-        mock_service.return_value.delete_list.side_effect = LookupError
+        mock_service.return_value.schedule_delete_list.side_effect = LookupError
         with app.test_request_context('/index/app/type/6d04bd2d-da75-420f-a52a-d2ffa0c48c42',
                                       method='DELETE',
                                       headers=Headers(test_sandbox_headers),
                                       data=json.dumps({})):
             response = self.controller.delete()
             tools.assert_equal(httplib.NOT_FOUND, response[1])
-            tools.assert_equal(mock_service.return_value.delete_list.call_count, 1)
+            tools.assert_equal(mock_service.return_value.schedule_delete_list.call_count, 1)
 
     @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
     @mock.patch.object(flask, 'url_for', autospec=True)
-    def test_delete_not_acknowledged(self, mock_url_for, mock_service):
+    def test_delete_when_worker_pool_is_full(self, mock_url_for, mock_service):
         app = flask.Flask(__name__)
-        mock_service.return_value.delete_list.side_effect = Exception
+        mock_service.return_value.schedule_delete_list.side_effect = exceptions.WorkerPoolFullError
         with app.test_request_context('/index/app/type/6d04bd2d-da75-420f-a52a-d2ffa0c48c42',
                                       method='DELETE',
                                       headers=Headers(test_sandbox_headers),
                                       data=json.dumps({})):
             response = self.controller.delete()
-            tools.assert_equal(httplib.INTERNAL_SERVER_ERROR, response[1])
-            tools.assert_equal(mock_service.return_value.delete_list.call_count, 1)
+            tools.assert_equal(httplib.SERVICE_UNAVAILABLE, response[1])
+
+
+class TestJobGetResourceController(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        self.controller = lls_resource_api.JobGetResourceController()
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_get(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.get_job.return_value = {'id': 'job', 'status': 'running'}
+        with app.test_request_context('/jobs/job',
+                                      method='GET',
+                                      headers=Headers(test_sandbox_headers)):
+            response = self.controller.get(job_id='job')
+            tools.assert_equal(httplib.OK, response[1])
+            tools.assert_equal(response[0]['status'], 'running')
+            tools.assert_equal(mock_service.return_value.get_job.call_args[0][0].job_id, 'job')
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_get_not_found(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.get_job.side_effect = LookupError
+        with app.test_request_context('/jobs/job',
+                                      method='GET',
+                                      headers=Headers(test_sandbox_headers)):
+            response = self.controller.get(job_id='job')
+            tools.assert_equal(httplib.NOT_FOUND, response[1])
+
+
+class TestStatsGetResourceController(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        self.controller = lls_resource_api.StatsGetResourceController()
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_get(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.get_stats.return_value = {'pid': 1, 'connectionPools': []}
+        with app.test_request_context('/stats',
+                                      method='GET',
+                                      headers=Headers(test_sandbox_headers)):
+            response = self.controller.get()
+            tools.assert_equal(httplib.OK, response[1])
+            tools.assert_equal(response[0]['connectionPools'], [])
+
+
+class TestMemberListsGetResourceController(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        self.controller = lls_resource_api.MemberListsGetResourceController()
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_get(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.get_member_lists.return_value = {'lists': ['1'], 'total': 1}
+        with app.test_request_context('/members/app/123/lists?offset=20&limit=10',
+                                      method='GET',
+                                      headers=Headers(test_sandbox_headers)):
+            response = self.controller.get(service='app', member_id='123')
+            tools.assert_equal(httplib.OK, response[1])
+            tools.assert_equal(response[0]['lists'], ['1'])
+            request = mock_service.return_value.get_member_lists.call_args[0][0]
+            tools.assert_equal((request.member_id, request.offset, request.limit), ('123', 20, 10))
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_get_not_found(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.get_member_lists.side_effect = LookupError
+        with app.test_request_context('/members/app/123/lists',
+                                      method='GET',
+                                      headers=Headers(test_sandbox_headers)):
+            response = self.controller.get(service='app', member_id='123')
+            tools.assert_equal(httplib.NOT_FOUND, response[1])
+
+
+class TestMembershipRulePostResourceController(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        self.controller = lls_resource_api.MembershipRulePostResourceController()
+
+    def test_post_without_lists(self):
+        app = flask.Flask(__name__)
+        with app.test_request_context('/lists/app/members/evaluate',
+                                      method='POST',
+                                      headers=Headers(test_sandbox_headers),
+                                      data=json.dumps({'accountNumbers': ['1']})):
+            response = self.controller.post()
+            tools.assert_equal(httplib.BAD_REQUEST, response[1])
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_post(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.evaluate_membership.return_value = {'matched': ['1'], 'notMatched': []}
+        with app.test_request_context('/lists/app/members/evaluate',
+                                      method='POST',
+                                      headers=Headers(test_sandbox_headers),
+                                      data=json.dumps({'accountNumbers': ['1'], 'allOf': ['a'], 'noneOf': ['c']})):
+            response = self.controller.post()
+            tools.assert_equal(httplib.OK, response[1])
+            tools.assert_equal(response[0]['matched'], ['1'])
+            request = mock_service.return_value.evaluate_membership.call_args[0][0]
+            tools.assert_equal((request.allOf, request.anyOf, request.noneOf), (['a'], [], ['c']))
+
+
+class TestListMemberLookupPostResourceController(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        self.controller = lls_resource_api.ListMemberLookupPostResourceController()
+
+    def test_post_empty(self):
+        app = flask.Flask(__name__)
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/members/lookup',
+                                      method='POST',
+                                      headers=Headers(test_sandbox_headers),
+                                      data=json.dumps({'accountNumbers': []})):
+            response = self.controller.post()
+            tools.assert_equal(httplib.BAD_REQUEST, response[1])
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_post(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.lookup_list_members.return_value = {'found': ['1'], 'notFound': ['2']}
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/members/lookup',
+                                      method='POST',
+                                      headers=Headers(test_sandbox_headers),
+                                      data=json.dumps({'accountNumbers': ['1', '2']})):
+            response = self.controller.post()
+            tools.assert_equal(httplib.OK, response[1])
+            tools.assert_equal((response[0]['found'], response[0]['notFound']), (['1'], ['2']))
+            request = mock_service.return_value.lookup_list_members.call_args[0][0]
+            tools.assert_equal(request.accountNumbers, ['1', '2'])
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_post_too_many_accounts(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.lookup_list_members.side_effect = exceptions.TooManyAccountsSpecifiedError
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/members/lookup',
+                                      method='POST',
+                                      headers=Headers(test_sandbox_headers),
+                                      data=json.dumps({'accountNumbers': ['1', '2']})):
+            response = self.controller.post()
+            tools.assert_equal(httplib.BAD_REQUEST, response[1])
 
 
 class TestListStatusGetResourceController(unittest.TestCase):
@@ -146,6 +364,59 @@ class TestListStatusGetResourceController(unittest.TestCase):
             tools.assert_equal(mock_service.return_value.get_list_status.call_count, 1)
 
 
+class TestListSnapshotGetResourceController(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        self.controller = lls_resource_api.ListSnapshotGetResourceController()
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    def test_get(self, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.get_list_snapshot.return_value = (StringIO.StringIO('snapshot'), 'etag')
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/snapshot?format=bloom',
+                                      method='GET',
+                                      headers=Headers(test_sandbox_headers)):
+            response = self.controller.get(service='app', list_id='6d04bd2d-da75-420f-a52a-d2ffa0c48c42')
+            tools.assert_equal(httplib.OK, response.status_code)
+            tools.assert_equal('"etag"', response.headers['ETag'])
+            tools.assert_equal('snapshot', ''.join(response.response))
+            request = mock_service.return_value.get_list_snapshot.call_args[0][0]
+            tools.assert_equal('bloom', request.format)
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    def test_get_not_modified(self, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.get_list_snapshot.return_value = (StringIO.StringIO('snapshot'), 'etag')
+        headers = dict(test_sandbox_headers, **{'If-None-Match': '"etag"'})
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/snapshot',
+                                      method='GET',
+                                      headers=Headers(headers)):
+            response = self.controller.get(service='app', list_id='6d04bd2d-da75-420f-a52a-d2ffa0c48c42')
+            tools.assert_equal(httplib.NOT_MODIFIED, response.status_code)
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    def test_get_unsupported_format(self, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.get_list_snapshot.side_effect = exceptions.UnsupportedSnapshotFormatError
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/snapshot?format=csv',
+                                      method='GET',
+                                      headers=Headers(test_sandbox_headers)):
+            response = self.controller.get(service='app', list_id='6d04bd2d-da75-420f-a52a-d2ffa0c48c42')
+            tools.assert_equal(httplib.BAD_REQUEST, response[1])
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    def test_get_pending(self, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.get_list_snapshot.side_effect = exceptions.SnapshotPendingError
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/snapshot',
+                                      method='GET',
+                                      headers=Headers(test_sandbox_headers)):
+            response = self.controller.get(service='app', list_id='6d04bd2d-da75-420f-a52a-d2ffa0c48c42')
+            tools.assert_equal(httplib.ACCEPTED, response[1])
+            tools.assert_equal(str(configuration.data.SNAPSHOT_RETRY_AFTER_SECONDS), response[2]['Retry-After'])
+
+
 class TestListMemberGetResourceController(unittest.TestCase):
 
     def setUp(self):
@@ -177,6 +448,33 @@ class TestListMemberGetResourceController(unittest.TestCase):
             tools.assert_equal(httplib.NOT_FOUND, response[1])
             tools.assert_equal(mock_service.return_value.get_list_member.call_count, 1)
 
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_head(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.is_list_member.return_value = True
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/members/123',
+                                      method='HEAD',
+                                      headers=Headers(test_sandbox_headers)):
+            response = self.controller.head(service='app', list_id='6d04bd2d-da75-420f-a52a-d2ffa0c48c42',
+                                            member_id='123')
+            tools.assert_equal(('', httplib.OK), response)
+            mock_service.return_value.is_list_member.assert_called_once_with(
+                'app', '6d04bd2d-da75-420f-a52a-d2ffa0c48c42', '123')
+            tools.assert_equal(mock_url_for.call_count, 0)
+
+    @mock.patch('app.controllers.lls_resource_api.services.ElasticSearch', autospec=True)
+    @mock.patch.object(flask, 'url_for', autospec=True)
+    def test_head_not_found(self, mock_url_for, mock_service):
+        app = flask.Flask(__name__)
+        mock_service.return_value.is_list_member.return_value = False
+        with app.test_request_context('/lists/app/6d04bd2d-da75-420f-a52a-d2ffa0c48c42/members/123',
+                                      method='HEAD',
+                                      headers=Headers(test_sandbox_headers)):
+            response = self.controller.head(service='app', list_id='6d04bd2d-da75-420f-a52a-d2ffa0c48c42',
+                                            member_id='123')
+            tools.assert_equal(('', httplib.NOT_FOUND), response)
+
 
 class TestAppendListPutResourceController(unittest.TestCase):
 
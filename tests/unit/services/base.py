@@ -11,6 +11,7 @@ from liblcp import context
 
 import configuration
 from app import services
+from app.services import bloom, clients, generations, membership, snapshots
 
 CORRELATION_ID = str(uuid.uuid4())
 PRINCIPAL = str(uuid.uuid4())
@@ -60,10 +61,26 @@ class BaseTestElasticSearchService(unittest.TestCase):
         self.member_data = copy.deepcopy(self.data)
         self.member_data['member_id'] = 'member_id'
         self.service = services.ElasticSearch()
+        clients.registry.reset()
+        membership.reset()
+        generations.reset()
         configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        # Lists that were never reloaded are served from a type named after the list.
+        resolve = mock.patch.object(generations, 'resolve', autospec=True,
+                                    side_effect=lambda client, index, list_id: list_id)
+        resolve.start()
+        self.addCleanup(resolve.stop)
+        # Without a filter every member is looked up in Elastic Search.
+        store = mock.patch.object(bloom, 'store', autospec=True)
+        self.mock_store = store.start()
+        self.mock_store.return_value.might_contain.return_value = True
+        self.addCleanup(store.stop)
+        snapshot_store = mock.patch.object(snapshots, 'store', autospec=True)
+        self.mock_snapshot_store = snapshot_store.start()
+        self.addCleanup(snapshot_store.stop)
 
     @staticmethod
-    def _assert_callback(mock_requests_wrapper_post, success, error=None):
+    def _assert_callback(mock_requests_wrapper_post, success, error=None, results=None):
         data = {
             'success': success,
             'links': {
@@ -74,6 +91,7 @@ class BaseTestElasticSearchService(unittest.TestCase):
         }
         if success:
             data['links']['member'] = {'href': '/service/id/{member-id}'}
+            data.update(results or {})
 
         mock_requests_wrapper_post.assert_has_calls([
             mock.call(url='callback',
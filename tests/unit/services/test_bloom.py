@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from nose import tools
+
+from app.services import bloom
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_added_members_are_always_found(self):
+        bloom_filter = bloom.BloomFilter.for_capacity(1000, 0.01)
+        members = ['account_{}'.format(i) for i in xrange(1000)]
+        for member_id in members:
+            bloom_filter.add(member_id)
+
+        tools.assert_true(all(member_id in bloom_filter for member_id in members))
+
+    def test_false_positive_rate(self):
+        bloom_filter = bloom.BloomFilter.for_capacity(1000, 0.01)
+        for i in xrange(1000):
+            bloom_filter.add('account_{}'.format(i))
+
+        false_positives = sum(1 for i in xrange(10000) if 'other_{}'.format(i) in bloom_filter)
+        tools.assert_less(false_positives, 200)
+
+    def test_unicode_and_encoded_members_are_the_same(self):
+        bloom_filter = bloom.BloomFilter.for_capacity(10, 0.01)
+        bloom_filter.add(u'caf\xe9')
+
+        tools.assert_in(u'caf\xe9'.encode('utf-8'), bloom_filter)
+
+    def test_dumps_and_loads(self):
+        bloom_filter = bloom.BloomFilter.for_capacity(10, 0.01)
+        bloom_filter.add('member')
+
+        loaded = bloom.BloomFilter.loads(bloom_filter.dumps())
+
+        tools.assert_equal((loaded.bit_count, loaded.hash_count, loaded.bits),
+                           (bloom_filter.bit_count, bloom_filter.hash_count, bloom_filter.bits))
+
+
+class TestFilterStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = bloom.FilterStore(self.directory, max_bytes=1024 * 1024, false_positive_rate=0.001)
+
+    def test_type_without_filter_might_contain_anything(self):
+        tools.assert_true(self.store.might_contain('service', 'list', 'member'))
+
+    def test_rebuild(self):
+        self.store.rebuild('service', 'list', 2, iter(['member', 'other']))
+
+        tools.assert_true(self.store.might_contain('service', 'list', 'member'))
+        tools.assert_false(self.store.might_contain('service', 'list', 'unknown'))
+
+    def test_members_added_during_rebuild_are_kept(self):
+        def members():
+            yield 'member'
+            bloom.FilterStore(self.directory, 1024 * 1024, 0.001).add('service', 'list', ['added'])
+
+        self.store.rebuild('service', 'list', 2, members())
+
+        tools.assert_true(self.store.might_contain('service', 'list', 'added'))
+
+    def test_add_to_existing_filter_is_seen_by_other_stores(self):
+        other = bloom.FilterStore(self.directory, 1024 * 1024, 0.001)
+        self.store.rebuild('service', 'list', 1, iter(['member']))
+        tools.assert_false(other.might_contain('service', 'list', 'added'))
+
+        self.store.add('service', 'list', ['added'])
+
+        tools.assert_true(other.might_contain('service', 'list', 'added'))
+
+    def test_members_are_hashed_by_document_id(self):
+        self.store.rebuild('service', 'list', 1, iter(['member']))
+
+        self.store.add('service', 'list', [1234L, 56.0])
+
+        tools.assert_true(self.store.might_contain('service', 'list', '1234'))
+        tools.assert_true(self.store.might_contain('service', 'list', '56.0'))
+
+    def test_members_added_by_other_stores_are_seen_straight_away(self):
+        other = bloom.FilterStore(self.directory, 1024 * 1024, 0.001, check_interval=3600)
+        self.store.rebuild('service', 'list', 1, iter(['member']))
+        tools.assert_false(other.might_contain('service', 'list', 'added'))
+
+        self.store.add('service', 'list', ['added'])
+
+        tools.assert_true(other.might_contain('service', 'list', 'added'))
+
+    @mock.patch.object(os, 'stat', wraps=os.stat)
+    def test_file_is_only_checked_for_members_found_within_check_interval(self, mock_stat):
+        store = bloom.FilterStore(self.directory, 1024 * 1024, 0.001, check_interval=3600)
+        store.rebuild('service', 'list', 1, iter(['member']))
+        store.might_contain('service', 'list', 'member')
+        mock_stat.reset_mock()
+
+        tools.assert_true(store.might_contain('service', 'list', 'member'))
+        tools.assert_equal(mock_stat.call_count, 0)
+        tools.assert_false(store.might_contain('service', 'list', 'unknown'))
+        tools.assert_equal(mock_stat.call_count, 1)
+
+    def test_own_changes_are_seen_straight_away(self):
+        store = bloom.FilterStore(self.directory, 1024 * 1024, 0.001, check_interval=3600)
+        store.rebuild('service', 'list', 1, iter(['member']))
+        tools.assert_false(store.might_contain('service', 'list', 'added'))
+
+        store.add('service', 'list', ['added'])
+
+        tools.assert_true(store.might_contain('service', 'list', 'added'))
+
+    def test_add_without_filter_does_not_create_one(self):
+        self.store.add('service', 'list', ['added'])
+
+        tools.assert_true(self.store.might_contain('service', 'list', 'unknown'))
+
+    def test_discard(self):
+        self.store.rebuild('service', 'list', 1, iter(['member']))
+
+        self.store.discard('service', 'list')
+
+        tools.assert_true(self.store.might_contain('service', 'list', 'unknown'))
+
+    def test_filter_over_budget_is_not_built(self):
+        store = bloom.FilterStore(self.directory, max_bytes=16, false_positive_rate=0.001)
+
+        store.rebuild('service', 'list', 1000, iter(['member']))
+
+        tools.assert_true(store.might_contain('service', 'list', 'unknown'))
+
+    def test_disabled_store(self):
+        store = bloom.FilterStore(self.directory, max_bytes=0, false_positive_rate=0.001)
+
+        store.rebuild('service', 'list', 1, iter(['member']))
+
+        tools.assert_true(store.might_contain('service', 'list', 'unknown'))
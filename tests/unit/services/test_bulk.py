@@ -0,0 +1,301 @@
+import datetime
+import decimal
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+from elasticsearch import exceptions, helpers
+from nose import tools
+
+import configuration
+from app import operations
+from app.services import bulk
+
+
+def _documents(count):
+    return ["account_no_{}".format(index) for index in xrange(count)]
+
+
+class TestBulkBodyEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = bulk.BulkBodyEncoder(
+            action=operations.ElasticSearchPermittedOperations.INDEX, index='service', doc_type='id')
+
+    @tools.raises(ValueError)
+    def test_rejects_unknown_actions(self):
+        bulk.BulkBodyEncoder(action='upsert', index='service', doc_type='id')
+
+    def test_encodes_action_and_source_lines(self):
+        lines = self.encoder.encode('account_no').splitlines()
+
+        tools.assert_equal(
+            {'index': {'_index': 'service', '_type': 'id', '_id': 'account_no'}}, json.loads(lines[0]))
+        tools.assert_equal({'accountNumber': 'account_no'}, json.loads(lines[1]))
+
+    def test_encodes_delete_without_source_line(self):
+        encoder = bulk.BulkBodyEncoder(
+            action=operations.ElasticSearchPermittedOperations.DELETE, index='service', doc_type='id')
+
+        tools.assert_equal('{"delete":{"_index":"service","_type":"id","_id":"account_no"}}\n',
+                           encoder.encode('account_no'))
+
+    def test_escapes_account_numbers(self):
+        for account_number in ['quo"te', 'back\\slash', 'tab\t', u'unic\xf6de', 'caf\xc3\xa9', 12345, None]:
+            lines = self.encoder.encode(account_number).splitlines()
+
+            tools.assert_equal(2, len(lines))
+            tools.assert_equal(json.loads(json.dumps(account_number)), json.loads(lines[0])['index']['_id'])
+            tools.assert_equal(json.loads(json.dumps(account_number)), json.loads(lines[1])['accountNumber'])
+
+    def test_encodes_spreadsheet_dates_and_decimals(self):
+        tools.assert_equal('"2016-10-18"', bulk.encode_value(datetime.date(2016, 10, 18)))
+        tools.assert_equal('"2016-10-18T09:30:00"', bulk.encode_value(datetime.datetime(2016, 10, 18, 9, 30)))
+        tools.assert_equal('12.5', bulk.encode_value(decimal.Decimal('12.5')))
+
+    def test_document_id(self):
+        tools.assert_equal(u'caf\xe9', bulk.document_id(u'caf\xe9'))
+        tools.assert_equal('12345678901234567890', bulk.document_id(12345678901234567890L))
+        tools.assert_equal('1234.0', bulk.document_id(1234.0))
+        tools.assert_equal(u'2016-10-18', bulk.document_id(datetime.date(2016, 10, 18)))
+
+    def test_chunks_by_document_count(self):
+        chunks = list(self.encoder.chunks(_documents(5), bulk.ChunkSizer(2, 1024)))
+
+        tools.assert_equal([2, 2, 1], [len(chunk) for chunk in chunks])
+        tools.assert_equal(self.encoder.encode('account_no_4'), chunks[-1][0])
+
+    def test_chunks_by_byte_size(self):
+        document_size = len(self.encoder.encode('account_no_0'))
+
+        chunks = list(self.encoder.chunks(_documents(5), bulk.ChunkSizer(100, 2 * document_size)))
+
+        tools.assert_equal([2, 2, 1], [len(chunk) for chunk in chunks])
+
+    def test_oversized_document_gets_its_own_chunk(self):
+        chunks = list(self.encoder.chunks(_documents(2), bulk.ChunkSizer(100, 1)))
+
+        tools.assert_equal([1, 1], [len(chunk) for chunk in chunks])
+
+    def test_chunks_follow_sizer_changes(self):
+        sizer = bulk.ChunkSizer(1, 1024)
+        chunks = self.encoder.chunks(_documents(5), sizer)
+
+        tools.assert_equal(1, len(next(chunks)))
+        sizer.chunk_size = 3
+        tools.assert_equal([3, 1], [len(chunk) for chunk in chunks])
+
+
+class TestAdaptiveChunkSizer(unittest.TestCase):
+
+    def setUp(self):
+        self.sizer = bulk.AdaptiveChunkSizer(
+            100, 1024, min_chunk_size=10, max_chunk_size=200, target_latency=1.0)
+
+    def test_initial_chunk_size_is_bounded(self):
+        tools.assert_equal(200, bulk.AdaptiveChunkSizer(
+            1000, 1024, min_chunk_size=10, max_chunk_size=200, target_latency=1.0).chunk_size)
+
+    def test_rejections_halve_the_chunk_size(self):
+        self.sizer.record(100, 0.1, rejected=3)
+        tools.assert_equal(50, self.sizer.chunk_size)
+
+        for _ in xrange(5):
+            self.sizer.record(50, 0.1, rejected=1)
+        tools.assert_equal(10, self.sizer.chunk_size)
+
+    def test_slow_responses_shrink_the_chunk_size(self):
+        self.sizer.record(100, 4.0, rejected=0)
+
+        tools.assert_equal(25, self.sizer.chunk_size)
+
+    def test_fast_responses_grow_the_chunk_size(self):
+        self.sizer.record(100, 0.1, rejected=0)
+        tools.assert_equal(126, self.sizer.chunk_size)
+
+        for _ in xrange(5):
+            self.sizer.record(self.sizer.chunk_size, 0.1, rejected=0)
+        tools.assert_equal(200, self.sizer.chunk_size)
+
+    def test_partial_chunks_do_not_grow_the_chunk_size(self):
+        self.sizer.record(40, 0.1, rejected=0)
+
+        tools.assert_equal(100, self.sizer.chunk_size)
+
+    def test_chunk_sizer_from_configuration(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+
+        sizer = bulk.chunk_sizer()
+
+        tools.assert_is_instance(sizer, bulk.AdaptiveChunkSizer)
+        tools.assert_equal(configuration.data.BULK_PROCESSING_MAX_CHUNK_BYTES, sizer.max_chunk_bytes)
+        configuration.data.BULK_PROCESSING_ADAPTIVE_CHUNKING_ENABLED = False
+        tools.assert_equal(bulk.ChunkSizer, type(bulk.chunk_sizer()))
+
+
+class TestBulkExecution(unittest.TestCase):
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.encoder = bulk.BulkBodyEncoder(
+            action=operations.ElasticSearchPermittedOperations.INDEX, index='service', doc_type='id')
+        self.chunks = list(self.encoder.chunks(_documents(5), bulk.ChunkSizer(2, 1024)))
+        self.sizer = mock.MagicMock(autospec=bulk.ChunkSizer)
+        self.retry_policy = bulk.RetryPolicy(max_retries=3, backoff=0.5, max_backoff=2)
+
+    def test_send(self):
+        self.client.bulk.return_value = {'errors': False, 'items': []}
+
+        result = bulk.send(self.client, self.chunks[0], index='service', doc_type='id')
+
+        tools.assert_equal((2, []), result)
+        self.client.bulk.assert_called_once_with(''.join(self.chunks[0]), index='service', doc_type='id')
+
+    def test_send_reports_failed_items(self):
+        failed_item = {'index': {'_id': 'account_no_1', 'status': 429, 'error': 'EsRejectedExecutionException'}}
+        self.client.bulk.return_value = {
+            'errors': True, 'items': [{'index': {'_id': 'account_no_0', 'status': 201}}, failed_item]}
+
+        result = bulk.send(self.client, self.chunks[0], index='service', doc_type='id')
+
+        tools.assert_equal((1, [failed_item]), result)
+
+    def test_send_reports_rejections_to_the_sizer(self):
+        self.client.bulk.return_value = {
+            'errors': True, 'items': [{'index': {'_id': 'account_no_0', 'status': 429}},
+                                      {'index': {'_id': 'account_no_1', 'status': 400}}]}
+
+        bulk.send(self.client, self.chunks[0], index='service', doc_type='id', sizer=self.sizer)
+
+        self.sizer.record.assert_called_once_with(2, mock.ANY, 1)
+
+    def test_send_reports_rejected_requests_to_the_sizer(self):
+        self.client.bulk.side_effect = exceptions.TransportError(429, 'EsRejectedExecutionException', {})
+
+        success, errors = bulk.send(self.client, self.chunks[0], index='service', doc_type='id', sizer=self.sizer)
+
+        tools.assert_equal(0, success)
+        tools.assert_equal(2, len(errors))
+        self.sizer.record.assert_called_once_with(2, mock.ANY, 2)
+
+    @mock.patch.object(time, 'sleep', autospec=True)
+    def test_documents_of_rejected_requests_are_dead_lettered_with_their_ids(self, mock_sleep):
+        encoder = bulk.BulkBodyEncoder(
+            action=operations.ElasticSearchPermittedOperations.DELETE, index='service', doc_type='id')
+        self.client.bulk.side_effect = exceptions.TransportError(429, 'EsRejectedExecutionException', {})
+        path = os.path.join(tempfile.mkdtemp(), 'list.csv.failed')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+
+        with bulk.DeadLetterFile(path) as dead_letter:
+            result = bulk.execute(self.client, encoder.chunks(['account_no_0', 1234], bulk.ChunkSizer(2, 1024)),
+                                  index='service', doc_type='id', retry_policy=self.retry_policy,
+                                  dead_letter=dead_letter)
+
+        tools.assert_equal((0, 2), result)
+        tools.assert_equal(4, self.client.bulk.call_count)
+        with open(path) as descriptor:
+            tools.assert_equal([json.loads(line) for line in descriptor], [
+                {'_index': 'service', '_type': 'id', '_id': account_number, 'status': 429,
+                 'error': 'EsRejectedExecutionException'} for account_number in ('account_no_0', '1234')])
+
+    @tools.raises(exceptions.TransportError)
+    def test_send_raises_transport_errors(self):
+        self.client.bulk.side_effect = exceptions.TransportError(500, 'Internal server error', {})
+
+        bulk.send(self.client, self.chunks[0], index='service', doc_type='id')
+
+    @mock.patch.object(time, 'sleep', autospec=True)
+    def test_send_retries_rejected_documents_only(self, mock_sleep):
+        rejected = {'index': {'_id': 'account_no_0', 'status': 429}}
+        invalid = {'index': {'_id': 'account_no_1', 'status': 400}}
+        self.client.bulk.side_effect = iter([
+            {'errors': True, 'items': [rejected, invalid]},
+            {'errors': True, 'items': [rejected]},
+            {'errors': False, 'items': [{'index': {'_id': 'account_no_0', 'status': 201}}]}])
+
+        result = bulk.send(self.client, self.chunks[0], index='service', doc_type='id', retry_policy=self.retry_policy)
+
+        tools.assert_equal((1, [invalid]), result)
+        self.client.bulk.assert_has_calls([
+            mock.call(''.join(self.chunks[0]), index='service', doc_type='id'),
+            mock.call(self.chunks[0][0], index='service', doc_type='id'),
+            mock.call(self.chunks[0][0], index='service', doc_type='id')])
+        tools.assert_equal(2, mock_sleep.call_count)
+
+    @mock.patch.object(time, 'sleep', autospec=True)
+    def test_send_gives_up_after_max_retries(self, mock_sleep):
+        rejected = {'index': {'_id': 'account_no_0', 'status': 429}}
+        self.client.bulk.return_value = {'errors': True, 'items': [rejected, {'index': {'status': 201}}]}
+
+        result = bulk.send(self.client, self.chunks[0], index='service', doc_type='id', retry_policy=self.retry_policy)
+
+        tools.assert_equal((1, [rejected]), result)
+        tools.assert_equal(4, self.client.bulk.call_count)
+
+    def test_retry_policy_delay_is_jittered_and_capped(self):
+        for attempt in xrange(10):
+            tools.assert_true(0 <= self.retry_policy.delay(attempt) <= min(2, 0.5 * 2 ** attempt))
+
+    def test_execute(self):
+        self.client.bulk.return_value = {'errors': False, 'items': []}
+
+        result = bulk.execute(self.client, iter(self.chunks), index='service', doc_type='id')
+
+        tools.assert_equal((5, 0), result)
+        tools.assert_equal(3, self.client.bulk.call_count)
+
+    def test_execute_in_parallel(self):
+        self.client.bulk.return_value = {'errors': False, 'items': []}
+
+        result = bulk.execute(self.client, iter(self.chunks), index='service', doc_type='id', thread_count=2)
+
+        tools.assert_equal((5, 0), result)
+        tools.assert_equal(3, self.client.bulk.call_count)
+
+    @tools.raises(helpers.BulkIndexError)
+    def test_execute_raises_on_failed_items(self):
+        self.client.bulk.return_value = {'errors': True, 'items': [{'index': {'_id': 'account_no_0', 'status': 400}}]}
+
+        bulk.execute(self.client, iter(self.chunks), index='service', doc_type='id')
+
+    def test_execute_writes_failed_items_to_the_dead_letter_file(self):
+        failed_item = {'index': {'_id': 'account_no_0', 'status': 400, 'error': 'MapperParsingException'}}
+        self.client.bulk.return_value = {'errors': True, 'items': [failed_item, {'index': {'status': 201}}]}
+        dead_letter = mock.MagicMock(autospec=bulk.DeadLetterFile)
+
+        result = bulk.execute(self.client, iter(self.chunks[:2]), index='service', doc_type='id',
+                              dead_letter=dead_letter)
+
+        tools.assert_equal((2, 2), result)
+        dead_letter.write.assert_has_calls([mock.call([failed_item]), mock.call([failed_item])])
+
+
+class TestDeadLetterFile(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'list.csv.failed')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def test_file_is_only_created_on_failures(self):
+        with bulk.DeadLetterFile(self.path) as dead_letter:
+            dead_letter.write([])
+
+        tools.assert_false(os.path.exists(self.path))
+        tools.assert_equal(0, dead_letter.count)
+
+    def test_failed_items_are_written_one_per_line(self):
+        items = [{'index': {'_id': 'account_no_{}'.format(index), 'status': 429}} for index in xrange(3)]
+
+        with bulk.DeadLetterFile(self.path) as dead_letter:
+            dead_letter.write(items[:2])
+            dead_letter.write(items[2:])
+
+        tools.assert_equal(3, dead_letter.count)
+        with open(self.path) as descriptor:
+            tools.assert_equal([item['index'] for item in items], [json.loads(line) for line in descriptor])
@@ -0,0 +1,74 @@
+import os
+import unittest
+
+import mock
+from nose import tools
+
+import configuration
+from app.services import bulk, deletion
+
+SETTINGS = {'service': {'settings': {'index': {'number_of_replicas': '1', 'number_of_shards': '3'}}}}
+
+
+class TestDeletion(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        configuration.data.LIST_DELETE_PARALLELISM = 2
+        configuration.data.LIST_SLICED_DELETE_MIN_DOCUMENTS = 100
+        self.client = mock.MagicMock()
+        self.client.indices.get_settings.return_value = SETTINGS
+
+    def test_should_slice_large_list(self):
+        tools.assert_true(deletion.should_slice(100))
+        tools.assert_false(deletion.should_slice(99))
+
+    def test_should_not_slice_without_parallelism(self):
+        configuration.data.LIST_DELETE_PARALLELISM = 1
+
+        tools.assert_false(deletion.should_slice(1000))
+
+    @mock.patch.object(bulk, 'send', autospec=True)
+    @mock.patch.object(deletion.helpers, 'scan', autospec=True)
+    def test_delete_in_slices_scans_every_shard(self, mock_scan, mock_send):
+        mock_scan.side_effect = lambda client, **kwargs: iter(
+            [{'_id': '{}-{}'.format(kwargs['preference'], number)} for number in xrange(2)])
+        mock_send.side_effect = lambda client, documents, *args: (len(documents), [])
+        progress = []
+
+        result = deletion.delete_in_slices(self.client, 'service', 'id', on_progress=progress.append)
+
+        tools.assert_equal(result, (6, 0))
+        tools.assert_equal(sorted(call[1]['preference'] for call in mock_scan.call_args_list),
+                           ['_shards:0', '_shards:1', '_shards:2'])
+        tools.assert_equal(progress[-1], 6)
+        documents = sorted(document for call in mock_send.call_args_list for document in call[0][1])
+        tools.assert_equal(documents[0], '{"delete":{"_index":"service","_type":"id","_id":"_shards:0-0"}}\n')
+
+    @mock.patch.object(bulk, 'send', autospec=True)
+    @mock.patch.object(deletion.helpers, 'scan', autospec=True)
+    def test_documents_already_deleted_are_not_failures(self, mock_scan, mock_send):
+        self.client.indices.get_settings.return_value = {
+            'service': {'settings': {'index': {'number_of_shards': '1'}}}}
+        mock_scan.return_value = iter([{'_id': '1'}, {'_id': '2'}, {'_id': '3'}])
+        mock_send.return_value = (1, [{'delete': {'_id': '2', 'status': 404}},
+                                      {'delete': {'_id': '3', 'status': 400, 'error': 'error'}}])
+
+        tools.assert_equal(deletion.delete_in_slices(self.client, 'service', 'id'), (2, 1))
+
+    @mock.patch.object(deletion.time, 'sleep', autospec=True)
+    @mock.patch.object(deletion.time, 'time', autospec=True)
+    def test_throttle_spaces_out_requests(self, mock_time, mock_sleep):
+        mock_time.return_value = 100.0
+        throttle = deletion.Throttle(documents_per_second=10)
+
+        throttle.wait(10)
+        throttle.wait(10)
+
+        mock_sleep.assert_called_once_with(1.0)
+
+    @mock.patch.object(deletion.time, 'sleep', autospec=True)
+    def test_throttle_disabled(self, mock_sleep):
+        deletion.Throttle(documents_per_second=0).wait(1000)
+
+        tools.assert_equal(mock_sleep.call_count, 0)
@@ -0,0 +1,53 @@
+import datetime
+import unittest
+
+from nose import tools
+
+from app.services import diff
+
+
+class TestListDiff(unittest.TestCase):
+
+    def _read(self, path):
+        return list(diff.read_keys(path))
+
+    def test_sort_in_memory(self):
+        with diff.ListDiff(run_size=10) as list_diff:
+            path = list_diff.sort(['3', '1', '2', '1'], 'new')
+
+            tools.assert_equal(self._read(path), ['1', '2', '3'])
+
+    def test_sort_merges_runs(self):
+        accounts = ['{:04d}'.format(account) for account in xrange(100)]
+
+        with diff.ListDiff(run_size=7) as list_diff:
+            path = list_diff.sort(reversed(accounts + accounts[:20]), 'new')
+
+            tools.assert_equal(self._read(path), accounts)
+
+    def test_sort_nothing(self):
+        with diff.ListDiff(run_size=7) as list_diff:
+            tools.assert_equal(self._read(list_diff.sort([], 'current')), [])
+
+    def test_keys_match_elastic_search_ids(self):
+        tools.assert_equal(diff.encode_key(12345L), diff.encode_key(u'12345'))
+        tools.assert_equal(diff.encode_key(datetime.date(2016, 10, 18)), diff.encode_key(u'2016-10-18'))
+        tools.assert_equal(diff.encode_key('caf\xc3\xa9'), diff.encode_key(u'caf\xe9'))
+        tools.assert_equal(diff.decode_key(diff.encode_key(u'a"b\n')), u'a"b\n')
+
+    def test_compare(self):
+        with diff.ListDiff(run_size=3) as list_diff:
+            current_path = list_diff.sort(['1', '2', '3', '4', '6'], 'current')
+            new_path = list_diff.sort(['2', '3', '5', '6', '7', 2], 'new')
+
+            added_path, removed_path, counts = list_diff.compare(current_path, new_path)
+
+            tools.assert_equal(self._read(added_path), ['5', '7'])
+            tools.assert_equal(self._read(removed_path), ['1', '4'])
+            tools.assert_equal(counts, {'added': 2, 'removed': 2, 'unchanged': 3})
+
+    def test_workspace_is_removed(self):
+        with diff.ListDiff(run_size=3) as list_diff:
+            path = list_diff.sort(['1'], 'new')
+
+        tools.assert_raises(IOError, open, path)
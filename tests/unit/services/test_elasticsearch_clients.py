@@ -16,6 +16,17 @@ INTERNAL_SERVER_ERROR_EXCEPTION = exceptions.TransportError(httplib.INTERNAL_SER
                                                                 'error': 'Server error'
                                                             })
 
+INDEX_MISSING_EXCEPTION = exceptions.TransportError(httplib.NOT_FOUND, 'IndexMissingException[[service] missing]', {})
+
+MAPPING_BODY = {
+    "properties": {
+        "accountNumber": {
+            "type": "string",
+            "index": "not_analyzed"
+        }
+    }
+}
+
 
 class TestElasticSearchClient(unittest.TestCase):
 
@@ -24,6 +35,7 @@ class TestElasticSearchClient(unittest.TestCase):
         configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
 
     def setUp(self):
+        clients.mappings.clear()
         self.client = clients.ElasticSearchClient()
 
     @tools.raises(exceptions.TransportError)
@@ -109,3 +121,95 @@ class TestElasticSearchClient(unittest.TestCase):
             params={},
             doc_type='id'
         )
+
+    @mock.patch.object(clients.elasticsearch.client.Elasticsearch, 'bulk', autospec=True)
+    def test_index_and_mapping_are_set_up_once_per_list(self, mock_elastic_search_bulk_method):
+        self.client.indices = mock.MagicMock()
+        self.client.indices.exists.return_value = True
+
+        self.client.bulk('body', index='service', doc_type='id')
+        self.client.bulk('body', index='service', doc_type='id')
+        self.client.bulk('body', index='service', doc_type='other_id')
+
+        tools.assert_equal(2, self.client.indices.exists.call_count)
+        self.client.indices.put_mapping.assert_has_calls([
+            mock.call(index='service', doc_type='id', body=MAPPING_BODY),
+            mock.call(index='service', doc_type='other_id', body=MAPPING_BODY)])
+        tools.assert_equal(2, self.client.indices.put_mapping.call_count)
+        tools.assert_equal(3, mock_elastic_search_bulk_method.call_count)
+
+    @mock.patch.object(clients.elasticsearch.client.Elasticsearch, 'bulk', autospec=True)
+    def test_mapping_is_set_up_again_when_index_is_missing(self, mock_elastic_search_bulk_method):
+        self.client.indices = mock.MagicMock()
+        self.client.indices.exists.side_effect = iter([True, False])
+        mock_elastic_search_bulk_method.side_effect = iter([INDEX_MISSING_EXCEPTION, {'items': []}])
+
+        result = self.client.bulk('body', index='service', doc_type='id')
+
+        tools.assert_equal({'items': []}, result)
+        self.client.indices.create.assert_called_once_with(index='service')
+        tools.assert_equal(2, self.client.indices.put_mapping.call_count)
+        tools.assert_true(('service', 'id') in clients.mappings)
+
+    @tools.raises(exceptions.TransportError)
+    @mock.patch.object(clients.elasticsearch.client.Elasticsearch, 'bulk', autospec=True)
+    def test_bulk_errors_are_raised(self, mock_elastic_search_bulk_method):
+        self.client.indices = mock.MagicMock()
+        mock_elastic_search_bulk_method.side_effect = INTERNAL_SERVER_ERROR_EXCEPTION
+
+        self.client.bulk('body', index='service', doc_type='id')
+
+    def test_mapping_cache_invalidation(self):
+        clients.mappings.add('service', 'id')
+        clients.mappings.add('service', 'other_id')
+        clients.mappings.add('other_service', 'id')
+
+        clients.mappings.invalidate('service', 'id')
+        tools.assert_false(('service', 'id') in clients.mappings)
+        tools.assert_true(('service', 'other_id') in clients.mappings)
+
+        clients.mappings.invalidate('service')
+        tools.assert_false(('service', 'other_id') in clients.mappings)
+        tools.assert_true(('other_service', 'id') in clients.mappings)
+
+
+class TestClientRegistry(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+
+    def setUp(self):
+        clients.registry.reset()
+
+    def tearDown(self):
+        clients.registry.reset()
+
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_client_is_shared_within_a_process(self, mock_elastic_search):
+        client = clients.get_client()
+
+        tools.assert_is(client, clients.get_client())
+        mock_elastic_search.assert_called_once_with(
+            maxsize=configuration.data.BULK_PROCESSING_THREAD_COUNT + configuration.data.WSGI_THREAD_COUNT)
+
+    @mock.patch.object(os, 'getpid', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_client_is_rebuilt_after_fork(self, mock_elastic_search, mock_getpid):
+        mock_getpid.return_value = 1
+        clients.get_client()
+        mock_getpid.return_value = 2
+        clients.get_client()
+
+        tools.assert_equal(2, mock_elastic_search.call_count)
+
+    def test_pool_stats(self):
+        tools.assert_equal([], clients.pool_stats())
+
+        clients.get_client()
+        stats = clients.pool_stats()
+
+        tools.assert_equal(1, len(stats))
+        tools.assert_equal(
+            configuration.data.BULK_PROCESSING_THREAD_COUNT + configuration.data.WSGI_THREAD_COUNT, stats[0]['maxsize'])
+        tools.assert_equal(0, stats[0]['requests'])
@@ -1,5 +1,6 @@
-import csv
 import os
+import shutil
+import tempfile
 import types
 import unittest
 
@@ -22,58 +23,17 @@ class TestElasticSearchFileReaders(unittest.TestCase):
     def test_should_always_be_a_instance_of_csv_xls_reader(self):
         readers.FileReader('/content/list_upload/id.csv')
 
-    @mock.patch.object(csv, 'reader', autospec=True)
-    @mock.patch.object(os.path, 'isfile', autospec=True)
-    @mock.patch.object(readers, 'open', create=True)
-    def test_get_correct_reader_on_extension_csv(self, mock_open, mock_is_file, mock_csv_reader):
-        mock_account_no = mock.MagicMock(return_value='account_no')
-        account_no_list = [mock_account_no]
-        mock_open.return_value = iter(account_no_list)
-        mock_csv_reader.return_value.get_rows.return_value = mocks.generator(account_no_list)
+    @mock.patch.object(readers, 'MappedCsvReader', autospec=True)
+    def test_get_correct_reader_on_extension_csv(self, mock_mapped_csv_reader):
+        tools.assert_equal(readers.BulkAccountsFileReaders.get('/content/list_upload/id.csv'),
+                           mock_mapped_csv_reader.return_value)
+        mock_mapped_csv_reader.assert_called_once_with('/content/list_upload/id.csv')
 
-        tools.assert_true(
-            isinstance(readers.BulkAccountsFileReaders.get('/content/list_upload/id.csv'), readers.CsvReader))
-
-    @mock.patch.object(csv, 'reader', autospec=True)
-    @mock.patch.object(os.path, 'isfile', autospec=True)
-    @mock.patch.object(readers, 'open', create=True)
-    def test_get_correct_reader_on_extension_txt(self, mock_open, mock_is_file, mock_csv_reader):
-        mock_account_no = mock.MagicMock(return_value='account_no')
-        account_no_list = [mock_account_no]
-        mock_open.return_value = iter(account_no_list)
-
-        mock_csv_reader.return_value = mocks.generator(account_no_list)
-        tools.assert_true(
-            isinstance(readers.BulkAccountsFileReaders.get('/content/list_upload/id.txt'), readers.CsvReader))
-
-    @mock.patch.object(os.path, 'isfile', autospec=True)
-    @mock.patch.object(csv, 'reader', autospec=True)
-    @mock.patch.object(readers, 'open', create=True)
-    def test_reads_csv_file_correctly(self, mock_open, mock_csv_reader, mock_is_file):
-        accounts = ['account_no']
-        mock_open.return_value = iter(accounts)
-        mock_csv_reader.return_value = mocks.generator(accounts)
-
-        csv_reader = readers.CsvReader('/content/list_upload/id.csv')
-        tools.assert_equals(mocks.Any(types.GeneratorType), csv_reader.get_rows())
-        tools.assert_equals("account_no", next(csv_reader.get_rows()))
-        try:
-            next(next(csv_reader.get_rows()))
-        except StopIteration as e:
-            tools.assert_is_not_none(e)
-
-    @mock.patch.object(os.path, 'isfile', autospec=True)
-    @mock.patch.object(csv, 'reader', autospec=True)
-    @mock.patch.object(readers, 'open', create=True)
-    def test_reads_csv_file_and_return_if_exceeds_allowed_count(self, mock_open, mock_csv_reader, mock_is_file):
-        configuration.data.ACCOUNTS_UPDATE_MAX_SIZE_ALLOWED = 1
-        accounts = ['account_no' for _ in xrange(2)]
-        mock_open.return_value = iter(accounts)
-        mock_csv_reader.return_value = mocks.generator(accounts)
-
-        csv_reader = readers.CsvReader('/content/list_upload/id.csv')
-        tools.assert_true(csv_reader.exceeds_allowed_row_count(
-            max_limit_count=configuration.data.ACCOUNTS_UPDATE_MAX_SIZE_ALLOWED))
+    @mock.patch.object(readers, 'MappedCsvReader', autospec=True)
+    def test_get_correct_reader_on_extension_txt(self, mock_mapped_csv_reader):
+        tools.assert_equal(readers.BulkAccountsFileReaders.get('/content/list_upload/id.TXT'),
+                           mock_mapped_csv_reader.return_value)
+        mock_mapped_csv_reader.assert_called_once_with('/content/list_upload/id.TXT')
 
     @mock.patch.object(os.path, 'isfile', autospec=True)
     @mock.patch.object(openpyxl, 'load_workbook', autospec=True)
@@ -101,13 +61,179 @@ class TestElasticSearchFileReaders(unittest.TestCase):
         tools.assert_true(excel_reader.exceeds_allowed_row_count(
             max_limit_count=configuration.data.ACCOUNTS_UPDATE_MAX_SIZE_ALLOWED))
 
+    @mock.patch.object(readers, 'CompressedCsvReader', autospec=True)
+    def test_get_correct_reader_on_compressed_csv_and_txt(self, mock_compressed_csv_reader):
+        for file_path in ('/content/list_upload/id.csv.gz', '/content/list_upload/id.TXT.bz2'):
+            tools.assert_equal(readers.BulkAccountsFileReaders.get(file_path),
+                               mock_compressed_csv_reader.return_value)
+            mock_compressed_csv_reader.assert_called_with(file_path)
+
+    @mock.patch.object(readers, 'XlsxReader', autospec=True)
+    def test_get_correct_reader_on_extension_xlsx(self, mock_xlsx_reader):
+        tools.assert_equal(readers.BulkAccountsFileReaders.get('/content/list_upload/id.xlsx'),
+                           mock_xlsx_reader.return_value)
+        mock_xlsx_reader.assert_called_once_with('/content/list_upload/id.xlsx')
+
     @mock.patch.object(os.path, 'isfile', autospec=True)
     @mock.patch.object(openpyxl, 'load_workbook', autospec=True)
-    def test_get_correct_reader_on_extension_xlsx(self, mock_load_workbook, mock_is_file):
+    def test_get_correct_reader_on_extension_xls(self, mock_load_workbook, mock_is_file):
         mock_cell = mock.MagicMock()
         mock_cell.value = 'account_no'
         account_no_list = [mock_cell]
 
         mock_load_workbook.return_value.active.rows = mocks.generator(account_no_list)
         tools.assert_true(
-            isinstance(readers.BulkAccountsFileReaders.get('/content/list_upload/id.xlsx'), readers.ExcelReader))
+            isinstance(readers.BulkAccountsFileReaders.get('/content/list_upload/id.xls'), readers.ExcelReader))
+
+
+class TestMappedCsvReader(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _reader(self, content, *args):
+        path = os.path.join(self.directory, 'id.csv')
+        with open(path, 'wb') as descriptor:
+            descriptor.write(content)
+        return readers.MappedCsvReader(path, *args)
+
+    def test_reads_one_account_number_per_line(self):
+        reader = self._reader('1234\r\n5678\r\n\r\n9012')
+
+        tools.assert_equal(list(reader.get_rows()), ['1234', '5678', '9012'])
+        reader.close()
+
+    def test_reads_universal_newlines(self):
+        reader = self._reader('1234\r5678\n9012\r\n')
+
+        tools.assert_equal(list(reader.get_rows()), ['1234', '5678', '9012'])
+
+    def test_reads_first_column_of_multi_column_file(self):
+        reader = self._reader('1234,a,b\n5678,c\n9012\n')
+
+        tools.assert_equal(list(reader.get_rows()), ['1234', '5678', '9012'])
+
+    def test_reads_quoted_account_numbers(self):
+        reader = self._reader('1234\n"56,78",x\n"90\n12"\n3456\n')
+
+        tools.assert_equal(list(reader.get_rows()), ['1234', '56,78', '90\n12', '3456'])
+
+    def test_reads_quoted_account_numbers_of_carriage_return_file(self):
+        reader = self._reader('id\r"123"\r456\r"78\r\n9"\r')
+
+        tools.assert_equal(list(reader.get_rows()), ['id', '123', '456', '78\n9'])
+
+    def test_reads_quoted_account_numbers_split_across_blocks(self):
+        reader = self._reader('1234\r\n"56"\r\n7890\r\n')
+        reader.BLOCK_BYTES = 7
+
+        tools.assert_equal(list(reader.get_rows()), ['1234', '56', '7890'])
+
+    def test_yields_a_batch_per_block(self):
+        accounts = ['{:08d}'.format(account) for account in xrange(300)]
+        reader = self._reader('\n'.join(accounts))
+        reader.BLOCK_BYTES = 1000
+
+        batches = list(reader.get_batches())
+
+        tools.assert_equal(len(batches), 3)
+        tools.assert_equal(sum(batches, []), accounts)
+
+    def test_blocks_end_on_the_terminator_of_the_file(self):
+        accounts = ['{:08d}'.format(account) for account in xrange(300)]
+        for terminator in ('\r', '\r\n'):
+            reader = self._reader(terminator.join(accounts))
+            reader.BLOCK_BYTES = 1000
+
+            batches = list(reader.get_batches())
+
+            tools.assert_equal(len(batches), 3)
+            tools.assert_equal(sum(batches, []), accounts)
+
+    def test_reads_lines_of_byte_range(self):
+        reader = self._reader('1234\n5678\n9012\n', 5, 10)
+
+        tools.assert_equal(list(reader.get_rows()), ['5678'])
+
+    def test_returns_if_exceeds_allowed_count(self):
+        reader = self._reader('1234\n5678\n')
+
+        tools.assert_true(reader.exceeds_allowed_row_count(max_limit_count=1))
+        tools.assert_false(reader.exceeds_allowed_row_count(max_limit_count=5))
+
+    def test_rows_checked_against_the_limit_are_still_produced(self):
+        reader = self._reader('1234\n5678\n9012\n')
+
+        tools.assert_false(reader.exceeds_allowed_row_count(max_limit_count=3))
+        tools.assert_equal(list(reader.get_rows()), ['1234', '5678', '9012'])
+
+    def test_byte_range_of_blank_lines_has_no_rows(self):
+        reader = self._reader('1234\n\n\n5678\n', 5, 7)
+
+        tools.assert_equal(list(reader.get_rows()), [])
+
+    @tools.raises(EOFError)
+    def test_rejects_empty_file(self):
+        self._reader('\r\n')
+
+
+class TestCompressedCsvReader(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _reader(self, content, extension='gz'):
+        path = os.path.join(self.directory, 'id.csv.' + extension)
+        descriptor = readers.DECOMPRESSORS[extension](path, 'wb')
+        descriptor.write(content)
+        descriptor.close()
+        return readers.CompressedCsvReader(path)
+
+    def test_reads_gzip_file(self):
+        reader = self._reader('1234\r\n5678\r\n\r\n9012')
+
+        tools.assert_equal(list(reader.get_rows()), ['1234', '5678', '9012'])
+        reader.close()
+
+    def test_reads_bzip2_file(self):
+        reader = self._reader('1234\r5678\n9012,x\n', extension='bz2')
+
+        tools.assert_equal(list(reader.get_rows()), ['1234', '5678', '9012'])
+
+    def test_reads_lines_split_across_blocks(self):
+        accounts = ['{:08d}'.format(account) for account in xrange(300)]
+        reader = self._reader('\n'.join(accounts))
+        reader.BLOCK_BYTES = 1000
+
+        batches = list(reader.get_batches())
+
+        tools.assert_greater(len(batches), 1)
+        tools.assert_equal(sum(batches, []), accounts)
+
+    def test_reads_quoted_account_numbers_split_across_blocks(self):
+        accounts = ['{:08d}'.format(account) for account in xrange(300)]
+        reader = self._reader('\n'.join(accounts) + '\n"90\n12",x\n3456')
+        reader.BLOCK_BYTES = 1000
+
+        tools.assert_equal(sum(reader.get_batches(), []), accounts + ['90\n12', '3456'])
+
+    def test_returns_if_exceeds_allowed_count(self):
+        reader = self._reader('1234\n5678\n')
+
+        tools.assert_true(reader.exceeds_allowed_row_count(max_limit_count=1))
+        tools.assert_equal(list(reader.get_rows()), ['1234', '5678'])
+
+    def test_reads_quoted_account_numbers_of_carriage_return_file(self):
+        reader = self._reader('id\r"123"\r456\r')
+
+        tools.assert_equal(list(reader.get_rows()), ['id', '123', '456'])
+
+    @tools.raises(EOFError)
+    def test_rejects_empty_file(self):
+        self._reader('')
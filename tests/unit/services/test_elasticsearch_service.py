@@ -3,17 +3,18 @@ import copy
 import httplib
 import json
 import os
+import time
 import types
 import unittest
 
 import mock
-from elasticsearch import helpers, exceptions
+from elasticsearch import exceptions
 from nose import tools
 
 import base
 import configuration
 from app import models, exceptions as app_exceptions
-from app.services import readers, clients, decorators
+from app.services import bulk, readers, clients, decorators, deletion, elastic, generations, jobs, membership, workers
 from tests import builders, mocks
 
 configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
@@ -32,7 +33,7 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         configuration.data.LIST_PARALLEL_BULK_PROCESSING_ENABLED is True, "Bulk parallel processing not enabled")
     @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
     @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
-    @mock.patch.object(helpers, 'bulk', autospec=True)
+    @mock.patch.object(bulk, 'execute', autospec=True)
     @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
     @mock.patch.object(os.path, 'isfile', autospec=True)
     def test_create_list_with_csv(self, mock_is_file, mock_elastic_search, mock_bulk, mock_requests_wrapper_post,
@@ -42,12 +43,12 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         mock_elastic_search.return_value.indices.exists.return_value = False
         mock_requests_wrapper_post.return_value = mocks.MockHttpResponse(httplib.OK, {})
         request = models.Request(**self.data)
-        mock_csv_reader = mock.MagicMock(autospec=readers.CsvReader)
+        mock_csv_reader = mock.MagicMock(autospec=readers.MappedCsvReader)
         mock_csv_reader.is_empty.return_value = False
         accounts_list = [["account_no_{}".format(account_number_index)] for account_number_index in xrange(10000)]
         mock_csv_reader.get_rows.return_value = accounts_list
         mock_bulk_reader_get.get.return_value = mock_csv_reader
-        mock_bulk.return_value = (accounts_list, None,)
+        mock_bulk.return_value = (len(accounts_list), 0,)
 
         self.service.create_list(request)
 
@@ -55,17 +56,21 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         tools.assert_equals(type(args[1]), types.GeneratorType)
         mock_bulk.assert_called_with(mock_elastic_search.return_value,
                                      mocks.Any(types.GeneratorType),
-                                     index='service', stats_only=True,
-                                     chunk_size=configuration.data.BULK_PROCESSING_CHUNK_SIZE,
-                                     doc_type='id')
+                                     index='service',
+                                     doc_type='id',
+                                     thread_count=None,
+                                     sizer=mock.ANY,
+                                     retry_policy=mock.ANY,
+                                     dead_letter=mock.ANY)
         mock_elastic_search.return_value.indices.refresh.assert_called_once_with(index='service')
-        self._assert_callback(mock_requests_wrapper_post, True, 'id.csv')
+        self._assert_callback(
+            mock_requests_wrapper_post, True, 'id.csv', results={'indexed': len(accounts_list), 'failed': 0})
 
     @unittest.skipIf(
         configuration.data.LIST_PARALLEL_BULK_PROCESSING_ENABLED is True, "Bulk parallel processing not enabled")
     @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
     @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
-    @mock.patch.object(helpers, 'bulk', autospec=True)
+    @mock.patch.object(bulk, 'execute', autospec=True)
     @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
     @mock.patch.object(os.path, 'isfile', autospec=True)
     def test_elastic_search_operation_excel(self, mock_is_file, mock_elastic_search, mock_bulk,
@@ -80,7 +85,7 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         accounts_list = [["account_no_{}".format(account_number_index)] for account_number_index in xrange(10000)]
         mock_xl_reader.get_rows.return_value = accounts_list
         mock_bulk_reader_get.get.return_value = mock_xl_reader
-        mock_bulk.return_value = (accounts_list, None,)
+        mock_bulk.return_value = (len(accounts_list), 0,)
 
         self.service.create_list(request)
 
@@ -88,11 +93,15 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         tools.assert_equals(type(args[1]), types.GeneratorType)
         mock_bulk.assert_called_with(mock_elastic_search.return_value,
                                      mocks.Any(types.GeneratorType),
-                                     index='service', stats_only=True,
-                                     chunk_size=configuration.data.BULK_PROCESSING_CHUNK_SIZE,
-                                     doc_type='id')
+                                     index='service',
+                                     doc_type='id',
+                                     thread_count=None,
+                                     sizer=mock.ANY,
+                                     retry_policy=mock.ANY,
+                                     dead_letter=mock.ANY)
         mock_elastic_search.return_value.indices.refresh.assert_called_with(index='service')
-        self._assert_callback(mock_requests_wrapper_post, True, 'id.xlsx')
+        self._assert_callback(
+            mock_requests_wrapper_post, True, 'id.xlsx', results={'indexed': len(accounts_list), 'failed': 0})
 
     @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
     def test_elastic_search_operation_without_callback(self, mock_requests_wrapper_post):
@@ -120,7 +129,7 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         mock_requests_wrapper_post.return_value = mocks.MockHttpResponse(httplib.OK, {})
         request = models.Request(**self.data)
 
-        mock_csv_reader = mock.MagicMock(autospec=readers.CsvReader)
+        mock_csv_reader = mock.MagicMock(autospec=readers.MappedCsvReader)
         mock_csv_reader.is_empty.return_value = False
         mock_csv_reader.get_rows.return_value = ["account_no"]
         mock_bulk_reader_get.get.return_value = mock_csv_reader
@@ -129,9 +138,7 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
 
         tools.assert_equal(0, mock_elastic_search.return_value.indices.refresh.call_count)
         mock_elastic_search.return_value.bulk.assert_called_once_with(
-            "\n".join([
-                json.dumps({'index': {'_type': 'id', '_id': 'account_no', '_index': 'service'}}),
-                json.dumps({'accountNumber': 'account_no'})]) + "\n",
+            '{"index":{"_index":"service","_type":"id","_id":"account_no"}}\n{"accountNumber":"account_no"}\n',
             index='service',
             doc_type='id')
         tools.assert_equal(1, mock_elastic_search.return_value.bulk.call_count)
@@ -154,7 +161,7 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         self._assert_callback(mock_requests_wrapper_post, False, "File /content/list_upload/file.csv does not exist!")
 
     @mock.patch.object(__builtin__, 'open', autospec=True)
-    @mock.patch.object(readers, 'CsvReader', autospec=True)
+    @mock.patch.object(readers, 'MappedCsvReader', autospec=True)
     @mock.patch.object(decorators.logger, 'error', autospec=True)
     @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
     @mock.patch.object(os.path, 'isfile', autospec=True)
@@ -171,7 +178,7 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         self._assert_callback(mock_requests_wrapper_post, False)
 
     @mock.patch.object(decorators.logger, 'error', autospec=True)
-    @mock.patch.object(readers, 'ExcelReader', autospec=True)
+    @mock.patch.object(readers, 'XlsxReader', autospec=True)
     @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
     @mock.patch.object(os.path, 'isfile', autospec=True)
     def test_create_list_logs_and_returns_error_on_empty_xlsx_file(
@@ -189,6 +196,134 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
                                                 '/content/list_upload/file.xlsx is empty!')])
         self._assert_callback(mock_requests_wrapper_post, False, "File /content/list_upload/file.xlsx is empty!")
 
+    @mock.patch.object(workers, 'ingestion_pool', autospec=True)
+    def test_schedule_create_list(self, mock_ingestion_pool):
+        request = models.Request(**self.data)
+
+        self.service.schedule_create_list(request)
+
+        mock_ingestion_pool.return_value.submit.assert_called_once_with(
+            elastic._create_list_job, request, callback=mock.ANY)
+
+    @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
+    @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
+    @mock.patch.object(bulk, 'execute', autospec=True)
+    @mock.patch.object(elastic.helpers, 'scan', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_replace_list(self, mock_elastic_search, mock_scan, mock_bulk, mock_requests_wrapper_post,
+                          mock_bulk_reader_get):
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_requests_wrapper_post.return_value = mocks.MockHttpResponse(httplib.OK, {})
+        mock_scan.return_value = iter([{'_id': u'1'}, {'_id': u'2'}, {'_id': u'3'}])
+        mock_bulk_reader_get.get.return_value.get_rows.return_value = iter(['4', '3', '2', '4'])
+        bodies = []
+
+        def execute(client, chunks, **kwargs):
+            documents = [document for chunk in chunks for document in chunk]
+            bodies.append(''.join(documents))
+            return len(documents), 0
+
+        mock_bulk.side_effect = execute
+        request = models.Request(**self.data)
+
+        self.service.replace_list(request)
+
+        mock_scan.assert_called_once_with(
+            mock_elastic_search.return_value, query={"query": {"match_all": {}}}, index='service', doc_type='id',
+            size=elastic.SCAN_PAGE_SIZE, _source=False)
+        tools.assert_equal(bodies, [
+            '{"index":{"_index":"service","_type":"id","_id":"4"}}\n{"accountNumber":"4"}\n',
+            '{"delete":{"_index":"service","_type":"id","_id":"1"}}\n'])
+        mock_elastic_search.return_value.indices.refresh.assert_called_once_with(index='service')
+        self._assert_callback(mock_requests_wrapper_post, True,
+                              results={'added': 1, 'removed': 1, 'unchanged': 2, 'failed': 0})
+
+    @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
+    @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
+    @mock.patch.object(bulk, 'execute', autospec=True)
+    @mock.patch.object(elastic.helpers, 'scan', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_replace_missing_list(self, mock_elastic_search, mock_scan, mock_bulk, mock_requests_wrapper_post,
+                                  mock_bulk_reader_get):
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_requests_wrapper_post.return_value = mocks.MockHttpResponse(httplib.OK, {})
+        mock_scan.side_effect = base.NOT_FOUND_EXCEPTION
+        mock_bulk_reader_get.get.return_value.get_rows.return_value = iter(['1', '2'])
+        mock_bulk.return_value = (0, 0)
+        request = models.Request(**self.data)
+
+        self.service.replace_list(request)
+
+        self._assert_callback(mock_requests_wrapper_post, True,
+                              results={'added': 2, 'removed': 0, 'unchanged': 0, 'failed': 0})
+
+    @mock.patch.object(workers, 'ingestion_pool', autospec=True)
+    def test_schedule_replace_list(self, mock_ingestion_pool):
+        request = models.Request(**self.data)
+
+        self.service.schedule_replace_list(request)
+
+        mock_ingestion_pool.return_value.submit.assert_called_once_with(
+            elastic._replace_list_job, request, callback=mock.ANY)
+
+    @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
+    @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
+    @mock.patch.object(bulk, 'index_rows', autospec=True)
+    @mock.patch.object(generations, 'Reload', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_reload_list(self, mock_elastic_search, mock_reload, mock_index_rows, mock_requests_wrapper_post,
+                         mock_bulk_reader_get):
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_requests_wrapper_post.return_value = mocks.MockHttpResponse(httplib.OK, {})
+        mock_reload.return_value.__enter__.return_value.staging = 'id__staging'
+        mock_index_rows.return_value = (2, 0)
+        request = models.Request(**self.data)
+
+        self.service.reload_list(request)
+
+        mock_reload.assert_called_once_with(mock_elastic_search.return_value, 'service', 'id')
+        mock_elastic_search.return_value.ensure_es_mapping.assert_called_once_with('service', 'id__staging')
+        tools.assert_equal(mock_index_rows.call_args[1]['doc_type'], 'id__staging')
+        mock_elastic_search.return_value.indices.refresh.assert_called_once_with(index='service')
+        tools.assert_equal(mock_reload.return_value.__exit__.call_args[0][0], None)
+        self._assert_callback(mock_requests_wrapper_post, True, results={'indexed': 2, 'failed': 0})
+
+    @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
+    @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
+    @mock.patch.object(bulk, 'index_rows', autospec=True)
+    @mock.patch.object(generations, 'Reload', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_reload_list_failure_is_not_flipped(self, mock_elastic_search, mock_reload, mock_index_rows,
+                                                mock_requests_wrapper_post, mock_bulk_reader_get):
+        mock_requests_wrapper_post.return_value = mocks.MockHttpResponse(httplib.OK, {})
+        mock_reload.return_value.__exit__.return_value = False
+        mock_index_rows.side_effect = base.INTERNAL_SERVER_ERROR_EXCEPTION
+        request = models.Request(**self.data)
+
+        self.service.reload_list(request)
+
+        tools.assert_equal(mock_reload.return_value.__exit__.call_args[0][0], exceptions.TransportError)
+        self._assert_callback(mock_requests_wrapper_post, False)
+
+    @mock.patch.object(generations, 'purge', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_purge_retired_generations_logs_errors(self, mock_elastic_search, mock_purge):
+        mock_purge.side_effect = base.INTERNAL_SERVER_ERROR_EXCEPTION
+        request = models.Request(**self.data)
+
+        self.service.purge_retired_generations(request)
+
+        mock_purge.assert_called_once_with(mock_elastic_search.return_value, 'service', 'id')
+
+    @mock.patch.object(workers, 'ingestion_pool', autospec=True)
+    def test_schedule_reload_list(self, mock_ingestion_pool):
+        request = models.Request(**self.data)
+
+        self.service.schedule_reload_list(request)
+
+        mock_ingestion_pool.return_value.submit.assert_called_once_with(
+            elastic._reload_list_job, request, callback=mock.ANY)
+
     @mock.patch.object(os, 'remove')
     @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
     def test_delete_list(self, mock_elastic_search, mock_remove):
@@ -233,6 +368,95 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
 
         self.service.delete_list(request)
 
+    @mock.patch.object(workers, 'ingestion_pool', autospec=True)
+    @mock.patch.object(jobs.Job, 'create')
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_schedule_delete_list(self, mock_elastic_search, mock_create_job, mock_ingestion_pool):
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_elastic_search.return_value.indices.exists_type.return_value = True
+        mock_create_job.return_value.id = 'job'
+        request = models.Request(**self.data)
+
+        response = self.service.schedule_delete_list(request)
+
+        tools.assert_equal(response, mock_create_job.return_value.record)
+        mock_create_job.assert_called_once_with(mock_elastic_search.return_value, jobs.DELETE_LIST, request)
+        tools.assert_equal(request.job_id, 'job')
+        mock_ingestion_pool.return_value.submit.assert_called_once_with(
+            elastic._delete_list_job, request, callback=mock.ANY)
+
+    @tools.raises(LookupError)
+    @mock.patch.object(jobs.Job, 'create')
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_schedule_delete_missing_list(self, mock_elastic_search, mock_create_job):
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_elastic_search.return_value.indices.exists_type.return_value = False
+        request = models.Request(**self.data)
+
+        try:
+            self.service.schedule_delete_list(request)
+        finally:
+            tools.assert_equal(mock_create_job.call_count, 0)
+
+    @tools.raises(app_exceptions.WorkerPoolFullError)
+    @mock.patch.object(workers, 'ingestion_pool', autospec=True)
+    @mock.patch.object(jobs.Job, 'create')
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_schedule_delete_list_when_worker_pool_is_full(self, mock_elastic_search, mock_create_job,
+                                                           mock_ingestion_pool):
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_elastic_search.return_value.indices.exists_type.return_value = True
+        mock_ingestion_pool.return_value.submit.side_effect = app_exceptions.WorkerPoolFullError
+        request = models.Request(**self.data)
+
+        try:
+            self.service.schedule_delete_list(request)
+        finally:
+            mock_create_job.return_value.discard.assert_called_once_with()
+
+    @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
+    @mock.patch.object(jobs, 'load', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_run_delete_list_job(self, mock_elastic_search, mock_load_job, mock_requests_wrapper_post):
+        mock_requests_wrapper_post.return_value = mocks.MockHttpResponse(httplib.OK, {})
+        mock_elastic_search.return_value.delete_by_query.return_value = {}
+        mock_elastic_search.return_value.count.side_effect = iter([{"count": 5}, {"count": 0}])
+        job = mock_load_job.return_value
+        request = models.Request(job_id='job', **self.data)
+
+        self.service.run_delete_list_job(request)
+
+        mock_load_job.assert_called_once_with(mock_elastic_search.return_value, 'job')
+        job.start.assert_called_once_with()
+        job.report_progress.assert_has_calls([mock.call(total=5), mock.call(total=5, remaining=0)])
+        job.succeed.assert_called_once_with({'acknowledged': True})
+        self._assert_callback(mock_requests_wrapper_post, True, results={'acknowledged': True})
+
+    @mock.patch.object(decorators.requests_wrapper, 'post', autospec=True)
+    @mock.patch.object(jobs, 'load', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_run_delete_list_job_failure(self, mock_elastic_search, mock_load_job, mock_requests_wrapper_post):
+        mock_requests_wrapper_post.return_value = mocks.MockHttpResponse(httplib.OK, {})
+        mock_elastic_search.return_value.count.return_value = {"count": 5}
+        mock_elastic_search.return_value.delete_by_query.side_effect = base.INTERNAL_SERVER_ERROR_EXCEPTION
+        request = models.Request(job_id='job', **self.data)
+
+        self.service.run_delete_list_job(request)
+
+        mock_load_job.return_value.fail.assert_called_once_with(mock.ANY)
+        tools.assert_equal(mock_load_job.return_value.succeed.call_count, 0)
+        self._assert_callback(mock_requests_wrapper_post, False)
+
+    @mock.patch.object(jobs, 'load', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_get_job(self, mock_elastic_search, mock_load_job):
+        request = models.Request(job_id='job')
+
+        response = self.service.get_job(request)
+
+        tools.assert_equal(response, mock_load_job.return_value.record)
+        mock_load_job.assert_called_once_with(mock_elastic_search.return_value, 'job')
+
     @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
     def test_list_status(self, mock_elastic_search):
         request = models.Request(**self.data)
@@ -261,6 +485,144 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         tools.assert_equal({}, response)
         mock_elastic_search.return_value.exists.assert_called_once_with(doc_type='id', index='service', id='member_id')
 
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_list_member_is_cached(self, mock_elastic_search):
+        mock_elastic_search.return_value.exists.side_effect = iter([True, False])
+        request = models.Request(**self.member_data)
+
+        self.service.get_list_member(request)
+        self.service.get_list_member(request)
+
+        tools.assert_equal(mock_elastic_search.return_value.exists.call_count, 1)
+        tools.assert_equal(membership.cache().stats()['hits'], 1)
+
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_list_member_not_found_is_cached(self, mock_elastic_search):
+        mock_elastic_search.return_value.exists.side_effect = iter([False, True])
+        request = models.Request(**self.member_data)
+
+        tools.assert_raises(LookupError, self.service.get_list_member, request)
+        tools.assert_raises(LookupError, self.service.get_list_member, request)
+
+        tools.assert_equal(mock_elastic_search.return_value.exists.call_count, 1)
+
+    @mock.patch.object(workers, 'ingestion_pool', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_list_member_cache_is_invalidated_when_list_changes(self, mock_elastic_search, mock_ingestion_pool):
+        mock_elastic_search.return_value.exists.side_effect = iter([False, True, False])
+        request = models.Request(**self.member_data)
+        tools.assert_raises(LookupError, self.service.get_list_member, request)
+
+        self.service.schedule_create_list(models.Request(**self.data))
+        self.service.get_list_member(request)
+        mock_ingestion_pool.return_value.submit.call_args[1]['callback']({})
+        tools.assert_raises(LookupError, self.service.get_list_member, request)
+
+        tools.assert_equal(mock_elastic_search.return_value.exists.call_count, 3)
+
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_get_member_lists(self, mock_elastic_search):
+        reloaded = generations.new_generation('reloaded')
+        staging = generations.new_generation('other')
+        mock_elastic_search.return_value.search.return_value = {'aggregations': {'types': {'buckets': [
+            {'key': 'reloaded', 'doc_count': 1}, {'key': staging, 'doc_count': 1}, {'key': 'id', 'doc_count': 1},
+            {'key': reloaded, 'doc_count': 1}, {'key': 'last', 'doc_count': 1}]}}}
+        request = models.Request(offset=1, limit=1, **self.member_data)
+
+        with mock.patch.object(elastic.generations, 'resolve_many', autospec=True) as mock_resolve_many:
+            mock_resolve_many.return_value = {'id': 'id', 'last': 'last', 'other': 'other', 'reloaded': reloaded}
+            response = self.service.get_member_lists(request)
+
+        tools.assert_equal(response, {'lists': ['last'], 'total': 3, 'offset': 1, 'limit': 1})
+        mock_resolve_many.assert_called_once_with(
+            mock_elastic_search.return_value, 'service', ['id', 'last', 'other', 'reloaded'])
+        mock_elastic_search.return_value.search.assert_called_once_with(
+            index='service', search_type="count",
+            body={"query": {"filtered": {"filter": {"ids": {"values": ['member_id']}}}},
+                  "aggs": {"types": {"terms": {"field": "_type", "size": 0}}}})
+
+    def test_get_stats(self):
+        configuration.data.MEMBERSHIP_BATCH_WINDOW_MILLISECONDS = 0
+        membership.cache().get('service', 'id', 'member_id')
+
+        response = self.service.get_stats(models.Request())
+
+        tools.assert_equal(response['pid'], os.getpid())
+        tools.assert_equal(response['connectionPools'], [])
+        tools.assert_equal(response['membershipCache']['misses'], 1)
+        tools.assert_equal(response['coalescedLookups']['coalesced'], 0)
+        tools.assert_is_none(response['batchedLookups'])
+        tools.assert_equal(response['memberFilters'], self.mock_store.return_value.stats.return_value)
+
+    @tools.raises(LookupError)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_get_member_lists_of_missing_service(self, mock_elastic_search):
+        mock_elastic_search.return_value.search.side_effect = base.NOT_FOUND_EXCEPTION
+        request = models.Request(**self.member_data)
+
+        self.service.get_member_lists(request)
+
+    @mock.patch.object(generations, 'resolve_many', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_evaluate_membership(self, mock_elastic_search, mock_resolve_many):
+        mock_resolve_many.return_value = {'a': 'a', 'b': 'b__1', 'c': 'c'}
+        mock_elastic_search.return_value.search.return_value = {'hits': {'hits': [
+            {'_type': 'a', '_id': '1'}, {'_type': 'b__1', '_id': '1'},
+            {'_type': 'a', '_id': '2'}, {'_type': 'b__1', '_id': '2'}, {'_type': 'c', '_id': '2'},
+            {'_type': 'a', '_id': '3'}]}}
+        request = models.Request(service='service', accountNumbers=['1', '2', '3'], allOf=['a'], anyOf=['b'],
+                                 noneOf=['c'])
+
+        response = self.service.evaluate_membership(request)
+
+        tools.assert_equal(response, {'matched': ['1'], 'notMatched': ['2', '3']})
+        mock_elastic_search.return_value.search.assert_called_once_with(
+            index='service', doc_type='a,b__1,c', body={"query": {"filtered": {"filter": {"ids": {
+                "values": ['1', '2', '3']}}}}}, size=9, _source=False)
+        tools.assert_false(membership.cache().get('service', 'c', '1'))
+
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_evaluate_membership_from_cache(self, mock_elastic_search):
+        membership.cache().put('service', 'a', '1', True, 0)
+        membership.cache().put('service', 'c', '1', True, 0)
+        request = models.Request(service='service', accountNumbers=['1'], allOf=['a'], noneOf=['c'])
+
+        response = self.service.evaluate_membership(request)
+
+        tools.assert_equal(response, {'matched': [], 'notMatched': ['1']})
+        tools.assert_equal(mock_elastic_search.return_value.search.call_count, 0)
+
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_lookup_list_members(self, mock_elastic_search):
+        membership.cache().put('service', 'id', '3', True, 0)
+        mock_elastic_search.return_value.mget.return_value = {'docs': [
+            {'_id': '1', 'found': True}, {'_id': '2', 'found': False}]}
+        request = models.Request(accountNumbers=['1', '2', '3', '1'], **self.data)
+
+        response = self.service.lookup_list_members(request)
+
+        tools.assert_equal(response, {'found': ['1', '3'], 'notFound': ['2']})
+        mock_elastic_search.return_value.mget.assert_called_once_with(
+            index='service', doc_type='id', body={'ids': ['1', '2']}, _source=False)
+        tools.assert_false(membership.cache().get('service', 'id', '2'))
+
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_lookup_list_members_all_cached(self, mock_elastic_search):
+        membership.cache().put('service', 'id', '1', False, 0)
+        request = models.Request(accountNumbers=['1'], **self.data)
+
+        response = self.service.lookup_list_members(request)
+
+        tools.assert_equal(response, {'found': [], 'notFound': ['1']})
+        tools.assert_equal(mock_elastic_search.return_value.mget.call_count, 0)
+
+    @tools.raises(app_exceptions.TooManyAccountsSpecifiedError)
+    def test_lookup_too_many_list_members(self):
+        configuration.data.MEMBERSHIP_LOOKUP_MAX_ACCOUNTS = 2
+        request = models.Request(accountNumbers=['1', '2', '3'], **self.data)
+
+        self.service.lookup_list_members(request)
+
     @tools.raises(LookupError)
     @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
     def test_list_member_not_found(self, mock_elastic_search):
@@ -272,33 +634,134 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         tools.assert_equal({}, response)
         mock_elastic_search.return_value.exists.assert_called_once_with(doc_type='id', index='service', id='member_id')
 
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_get_list_snapshot(self, mock_elastic_search):
+        snapshot = (mock.Mock(), 'etag')
+        self.mock_snapshot_store.return_value.get.return_value = snapshot
+        request = models.Request(format='bloom', **self.data)
+
+        tools.assert_equal(self.service.get_list_snapshot(request), snapshot)
+        self.mock_snapshot_store.return_value.get.assert_called_once_with('service', 'id', 'bloom')
+
+    @mock.patch.object(workers, 'ingestion_pool', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_get_list_snapshot_schedules_missing_snapshot(self, mock_elastic_search, mock_ingestion_pool):
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_elastic_search.return_value.indices.exists_type.return_value = True
+        self.mock_snapshot_store.return_value.get.return_value = None
+        self.mock_snapshot_store.return_value.claim_build.side_effect = iter([True, False])
+        request = models.Request(format='bloom', **self.data)
+
+        for _ in xrange(2):
+            tools.assert_raises(app_exceptions.SnapshotPendingError, self.service.get_list_snapshot, request)
+
+        mock_ingestion_pool.return_value.submit.assert_called_once_with(elastic._build_snapshots_job, 'service', 'id')
+        tools.assert_equal(self.mock_snapshot_store.return_value.build.call_count, 0)
+
+    @tools.raises(app_exceptions.WorkerPoolFullError)
+    @mock.patch.object(workers, 'ingestion_pool', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_get_list_snapshot_when_worker_pool_is_full(self, mock_elastic_search, mock_ingestion_pool):
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_elastic_search.return_value.indices.exists_type.return_value = True
+        self.mock_snapshot_store.return_value.get.return_value = None
+        self.mock_snapshot_store.return_value.claim_build.return_value = True
+        mock_ingestion_pool.return_value.submit.side_effect = app_exceptions.WorkerPoolFullError
+
+        try:
+            self.service.get_list_snapshot(models.Request(**self.data))
+        finally:
+            self.mock_snapshot_store.return_value.release_build.assert_called_once_with('service', 'id')
+
+    @tools.raises(LookupError)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_get_list_snapshot_of_missing_list(self, mock_elastic_search):
+        mock_elastic_search.return_value = mock.MagicMock()
+        self.mock_snapshot_store.return_value.get.return_value = None
+        mock_elastic_search.return_value.indices.exists_type.return_value = False
+
+        self.service.get_list_snapshot(models.Request(**self.data))
+
+    @tools.raises(app_exceptions.UnsupportedSnapshotFormatError)
+    def test_get_list_snapshot_unsupported_format(self):
+        self.service.get_list_snapshot(models.Request(format='csv', **self.data))
+
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_list_member_rejected_by_filter(self, mock_elastic_search):
+        self.mock_store.return_value.might_contain.return_value = False
+        request = models.Request(**self.member_data)
+
+        tools.assert_false(self.service.is_list_member(request.service, request.list_id, request.member_id))
+        self.mock_store.return_value.might_contain.assert_called_once_with('service', 'id', 'member_id')
+        tools.assert_equal(mock_elastic_search.return_value.exists.call_count, 0)
+
     @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
     @mock.patch.object(os, 'remove')
-    @mock.patch.object(helpers, 'bulk', autospec=True)
     @mock.patch.object(os.path, 'isfile', autospec=True)
     @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
-    def test_append_list(self, mock_elastic_search, mock_is_file, mock_bulk, mock_remove, mock_bulk_reader_get):
+    def test_append_list(self, mock_elastic_search, mock_is_file, mock_remove, mock_bulk_reader_get):
         mock_elastic_search.return_value = mock.MagicMock()
         request = models.Request(**self.data)
 
-        mock_csv_reader = mock.MagicMock(autospec=readers.CsvReader)
+        accounts = ["account_no_{}".format(account_number_index) for account_number_index in xrange(50)]
+        mock_csv_reader = mock.MagicMock(autospec=readers.MappedCsvReader)
         mock_csv_reader.is_empty.return_value = False
         mock_csv_reader.exceeds_allowed_row_count.return_value = False
-        mock_csv_reader.get_rows.return_value = [
-            "account_no_{}".format(account_number_index) for account_number_index in xrange(50)
-        ]
+        mock_csv_reader.get_rows.return_value = accounts
         mock_bulk_reader_get.get.return_value = mock_csv_reader
-        failed = ["account_no_{}".format(account_number_index) for account_number_index in xrange(49)]
-        mock_bulk.return_value = (1, failed)
-
-        mock_csv_reader.is_exceed_max_line_limit.return_value = False
+        failed = accounts[:49]
+        mock_elastic_search.return_value.bulk.return_value = {
+            'errors': True,
+            'items': [{'index': {'_id': account, 'status': 400}} for account in failed] +
+                     [{'index': {'_id': 'account_no_49', 'status': 201}}]
+        }
 
         result = self.service.modify_list_members(request)
 
         file_path = os.path.join(configuration.data.VOLUME_MAPPINGS_FILE_UPLOAD_TARGET, request.filePath)
         mock_remove.assert_called_once_with(file_path)
+        tools.assert_equal(1, mock_elastic_search.return_value.bulk.call_count)
         tools.assert_list_equal(failed, result['failed'])
         tools.assert_list_equal(['account_no_49'], result['success'])
+        mock_elastic_search.return_value.indices.refresh.assert_called_once_with(index='service')
+        self.mock_store.return_value.add.assert_called_once_with('service', 'id', accounts)
+
+    @mock.patch.object(workers, 'ingestion_pool', autospec=True)
+    @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
+    @mock.patch.object(os, 'remove')
+    @mock.patch.object(os.path, 'isfile', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_append_list_survives_member_filter_failure(self, mock_elastic_search, mock_is_file, mock_remove,
+                                                        mock_bulk_reader_get, mock_ingestion_pool):
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_elastic_search.return_value.bulk.return_value = {'errors': False, 'items': []}
+        mock_bulk_reader_get.get.return_value.exceeds_allowed_row_count.return_value = False
+        mock_bulk_reader_get.get.return_value.get_rows.return_value = [1234L]
+        self.mock_store.return_value.add.side_effect = IOError
+        request = models.Request(**self.data)
+
+        result = self.service.modify_list_members(request)
+
+        tools.assert_equal(result, {'success': [1234L], 'failed': []})
+        self.mock_store.return_value.discard.assert_called_once_with('service', 'id')
+        mock_ingestion_pool.return_value.submit.assert_any_call(elastic._rebuild_member_filter_job, 'service', 'id')
+
+    @mock.patch.object(time, 'sleep', autospec=True)
+    @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
+    @mock.patch.object(os, 'remove')
+    @mock.patch.object(os.path, 'isfile', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_append_list_reports_members_of_rejected_requests_as_failed(self, mock_elastic_search, mock_is_file,
+                                                                        mock_remove, mock_bulk_reader_get, mock_sleep):
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_elastic_search.return_value.bulk.side_effect = exceptions.TransportError(429, 'rejected', {})
+        mock_bulk_reader_get.get.return_value.exceeds_allowed_row_count.return_value = False
+        mock_bulk_reader_get.get.return_value.get_rows.return_value = ['account_no_0', 1234L]
+        request = models.Request(**self.data)
+
+        result = self.service.modify_list_members(request)
+
+        tools.assert_equal(result, {'success': [], 'failed': ['account_no_0', '1234']})
 
     @mock.patch.object(readers, 'BulkAccountsFileReaders', autospec=True)
     @mock.patch.object(os.path, 'isfile', autospec=True)
@@ -308,7 +771,7 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         mock_elastic_search.return_value = mock.MagicMock()
         request = models.Request(**self.data)
 
-        mock_csv_reader = mock.MagicMock(autospec=readers.CsvReader)
+        mock_csv_reader = mock.MagicMock(autospec=readers.MappedCsvReader)
         mock_csv_reader.is_empty.return_value = False
         mock_csv_reader.is_exceed_max_line_limit.return_value = True
         mock_bulk_reader_get.get.return_value = mock_csv_reader
@@ -321,13 +784,30 @@ class TestElasticSearchService(base.BaseTestElasticSearchService):
         request = models.Request(**self.data)
 
         mock_elastic_search.delete_by_query.return_value = base.DELETE_BY_QUERY_RESPONSE_BODY
-        mock_elastic_search.count.side_effect = base.NOT_FOUND_EXCEPTION
+        mock_elastic_search.count.side_effect = iter([{"count": 1}, base.NOT_FOUND_EXCEPTION])
 
         self.service.delete_list(request)
 
-        mock_elastic_search.count.assert_called_once_with(
+        mock_elastic_search.count.assert_called_with(
             body={'query': {'match_all': {}}}, doc_type='id', index='service')
 
+    @mock.patch.object(deletion, 'delete_in_slices', autospec=True)
+    @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
+    def test_delete_large_list_in_slices(self, mock_elastic_search, mock_delete_in_slices):
+        configuration.data.LIST_SLICED_DELETE_MIN_DOCUMENTS = 10
+        mock_elastic_search.return_value = mock.MagicMock()
+        mock_elastic_search = mock_elastic_search.return_value
+        mock_elastic_search.count.side_effect = iter([{"count": 10}, {"count": 0}])
+        mock_delete_in_slices.return_value = (10, 0)
+        request = models.Request(**self.data)
+
+        result = self.service.delete_list(request)
+
+        tools.assert_equal(result, {'deleted': 10, 'failed': 0, 'acknowledged': True})
+        mock_delete_in_slices.assert_called_once_with(mock_elastic_search, 'service', 'id', on_progress=mock.ANY)
+        tools.assert_equal(mock_elastic_search.delete_by_query.call_count, 0)
+        mock_elastic_search.indices.refresh.assert_called_once_with(index='service')
+
     @mock.patch.object(clients, 'ElasticSearchClient', autospec=True)
     @tools.raises(exceptions.TransportError)
     def test_count_raises_general_error(self, mock_elastic_search):
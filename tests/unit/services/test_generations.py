@@ -0,0 +1,165 @@
+import os
+import unittest
+
+import mock
+from elasticsearch import exceptions
+from nose import tools
+
+import configuration
+from app.services import bloom, clients, generations, snapshots
+
+NOT_FOUND = exceptions.NotFoundError(404, 'missing', {})
+CONFLICT = exceptions.ConflictError(409, 'conflict', {})
+
+
+class TestGenerations(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        generations.reset()
+        self.client = mock.MagicMock()
+        self.metadata = dict(index=configuration.data.LIST_METADATA_INDEX, doc_type='list_generation',
+                             id='service:id')
+
+    @staticmethod
+    def _record(doc_type, retired=(), version=2):
+        return {'_version': version, '_source': {
+            'service': 'service', 'list_id': 'id', 'doc_type': doc_type, 'retired': list(retired)}}
+
+    def test_resolve_list_that_was_never_reloaded(self):
+        self.client.get.side_effect = NOT_FOUND
+
+        tools.assert_equal(generations.resolve(self.client, 'service', 'id'), 'id')
+
+    def test_resolve_reloaded_list(self):
+        self.client.get.return_value = self._record('id__1')
+
+        tools.assert_equal(generations.resolve(self.client, 'service', 'id'), 'id__1')
+        self.client.get.assert_called_once_with(**self.metadata)
+
+    def test_resolve_is_cached_until_the_list_is_flipped(self):
+        self.client.get.side_effect = iter([self._record('id__1'), self._record('id__1'), self._record('id__2')])
+
+        tools.assert_equal(generations.resolve(self.client, 'service', 'id'), 'id__1')
+        tools.assert_equal(generations.resolve(self.client, 'service', 'id'), 'id__1')
+        tools.assert_equal(self.client.get.call_count, 1)
+        with generations.Reload(self.client, 'service', 'id'):
+            pass
+        tools.assert_equal(generations.resolve(self.client, 'service', 'id'), 'id__2')
+
+    def test_resolve_started_before_an_invalidation_is_not_cached(self):
+        def read(**kwargs):
+            generations.cache().invalidate('service', 'id')
+            return self._record('id__1')
+        self.client.get.side_effect = read
+
+        generations.resolve(self.client, 'service', 'id')
+        generations.resolve(self.client, 'service', 'id')
+
+        tools.assert_equal(self.client.get.call_count, 2)
+
+    def test_first_reload_creates_record(self):
+        self.client.get.side_effect = NOT_FOUND
+
+        with generations.Reload(self.client, 'service', 'id') as reload:
+            tools.assert_true(reload.staging.startswith('id__'))
+            tools.assert_equal(reload.current, 'id')
+            tools.assert_equal(self.client.create.call_count, 0)
+
+        self.client.create.assert_called_once_with(body={
+            'service': 'service', 'list_id': 'id', 'doc_type': reload.staging, 'retired': ['id']}, **self.metadata)
+
+    def test_reload_flips_record_with_its_version(self):
+        self.client.get.return_value = self._record('id__1', retired=['id'])
+
+        with generations.Reload(self.client, 'service', 'id') as reload:
+            tools.assert_equal(reload.current, 'id__1')
+
+        self.client.index.assert_called_once_with(body={
+            'service': 'service', 'list_id': 'id', 'doc_type': reload.staging, 'retired': ['id', 'id__1']},
+            version=2, **self.metadata)
+
+    def test_concurrent_flip_retires_staging_generation(self):
+        self.client.get.side_effect = iter([self._record('id__1'), self._record('id__2'), self._record('id__2')])
+        self.client.index.side_effect = iter([CONFLICT, {}])
+
+        with tools.assert_raises(exceptions.ConflictError):
+            with generations.Reload(self.client, 'service', 'id') as reload:
+                pass
+
+        tools.assert_equal(self.client.index.call_args[1]['body']['doc_type'], 'id__2')
+        tools.assert_equal(self.client.index.call_args[1]['body']['retired'], [reload.staging])
+
+    def test_flip_is_retried_when_only_retired_generations_changed(self):
+        self.client.get.side_effect = iter([self._record('id__1', retired=['id']), self._record('id__1', version=3)])
+        self.client.index.side_effect = iter([CONFLICT, {}])
+
+        with generations.Reload(self.client, 'service', 'id') as reload:
+            pass
+
+        tools.assert_equal(self.client.index.call_count, 2)
+        self.client.index.assert_called_with(body={
+            'service': 'service', 'list_id': 'id', 'doc_type': reload.staging, 'retired': ['id__1']},
+            version=3, **self.metadata)
+
+    def test_failed_reload_retires_staging_generation(self):
+        self.client.get.return_value = self._record('id__1')
+
+        with tools.assert_raises(ValueError):
+            with generations.Reload(self.client, 'service', 'id') as reload:
+                raise ValueError()
+
+        self.client.index.assert_called_once_with(body={
+            'service': 'service', 'list_id': 'id', 'doc_type': 'id__1', 'retired': [reload.staging]},
+            version=2, **self.metadata)
+
+    @mock.patch.object(snapshots, 'store', autospec=True)
+    @mock.patch.object(bloom, 'store', autospec=True)
+    @mock.patch.object(clients.mappings, 'invalidate', autospec=True)
+    def test_purge_deletes_retired_generations(self, mock_invalidate, mock_store, mock_snapshot_store):
+        self.client.get.return_value = self._record('id__2', retired=['id', 'id__1'])
+        self.client.indices.delete_mapping.side_effect = iter([NOT_FOUND, {}])
+
+        generations.purge(self.client, 'service', 'id')
+
+        self.client.indices.delete_mapping.assert_has_calls([
+            mock.call(index='service', doc_type='id'), mock.call(index='service', doc_type='id__1')])
+        mock_invalidate.assert_has_calls([mock.call('service', 'id'), mock.call('service', 'id__1')])
+        mock_store.return_value.discard.assert_has_calls([mock.call('service', 'id'), mock.call('service', 'id__1')])
+        mock_snapshot_store.return_value.discard.assert_has_calls(
+            [mock.call('service', 'id'), mock.call('service', 'id__1')])
+        self.client.index.assert_called_once_with(body={
+            'service': 'service', 'list_id': 'id', 'doc_type': 'id__2', 'retired': []}, version=2, **self.metadata)
+
+    def test_purge_without_retired_generations(self):
+        self.client.get.return_value = self._record('id__2')
+
+        generations.purge(self.client, 'service', 'id')
+
+        tools.assert_equal(self.client.indices.delete_mapping.call_count, 0)
+        tools.assert_equal(self.client.index.call_count, 0)
+
+    def test_resolve_many(self):
+        self.client.mget.return_value = {'docs': [
+            {'_id': 'service:id', 'found': True, '_source': {'doc_type': 'id__1'}},
+            {'_id': 'service:other', 'found': False}]}
+
+        tools.assert_equal(generations.resolve_many(self.client, 'service', ['id', 'other']),
+                           {'id': 'id__1', 'other': 'other'})
+        self.client.mget.assert_called_once_with(
+            index=configuration.data.LIST_METADATA_INDEX, doc_type='list_generation',
+            body={'ids': ['service:id', 'service:other']})
+
+    def test_resolve_many_only_fetches_lists_that_are_not_cached(self):
+        self.client.get.return_value = self._record('id__1')
+        self.client.mget.return_value = {'docs': [{'_id': 'service:other', 'found': False}]}
+        generations.resolve(self.client, 'service', 'id')
+
+        tools.assert_equal(generations.resolve_many(self.client, 'service', ['id', 'other']),
+                           {'id': 'id__1', 'other': 'other'})
+        self.client.mget.assert_called_once_with(
+            index=configuration.data.LIST_METADATA_INDEX, doc_type='list_generation', body={'ids': ['service:other']})
+
+    def test_list_id_of(self):
+        tools.assert_equal(generations.list_id_of(generations.new_generation('list__id')), 'list__id')
+        tools.assert_equal(generations.list_id_of('list__id'), 'list__id')
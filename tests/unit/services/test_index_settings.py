@@ -0,0 +1,137 @@
+import os
+import time
+import unittest
+
+import mock
+from elasticsearch import exceptions
+from nose import tools
+
+import configuration
+from app.services import index_settings
+
+SETTINGS = {'service': {'settings': {'index': {'number_of_replicas': '1', 'number_of_shards': '5'}}}}
+ORIGINAL = {'refresh_interval': '1s', 'number_of_replicas': '1'}
+
+
+class TestBulkLoadIndexSettings(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        self.client = mock.MagicMock()
+        self.client.indices.get_settings.return_value = SETTINGS
+        self.metadata = dict(index=configuration.data.LIST_METADATA_INDEX, doc_type='bulk_load', id='service')
+
+    def _record(self, *leases, **kwargs):
+        heartbeat = kwargs.get('heartbeat', time.time())
+        return {'_version': 3, '_source': {
+            'original': ORIGINAL, 'leases': [{'id': lease, 'heartbeat': heartbeat} for lease in leases]}}
+
+    def test_first_load_records_original_settings_and_tunes_index(self):
+        self.client.get.side_effect = exceptions.NotFoundError(404, 'missing', {})
+
+        index_settings._join(self.client, 'service', 'lease')
+
+        self.client.create.assert_called_once_with(
+            body={'original': ORIGINAL, 'leases': [{'id': 'lease', 'heartbeat': mock.ANY}]}, **self.metadata)
+        self.client.indices.put_settings.assert_called_once_with(
+            index='service', body={'index': {'refresh_interval': '-1'}})
+
+    def test_replicas_are_reduced_when_configured(self):
+        configuration.data.BULK_LOAD_NUMBER_OF_REPLICAS = 0
+        self.client.get.side_effect = exceptions.NotFoundError(404, 'missing', {})
+
+        index_settings._join(self.client, 'service', 'lease')
+
+        self.client.indices.put_settings.assert_called_once_with(
+            index='service', body={'index': {'refresh_interval': '-1', 'number_of_replicas': 0}})
+
+    def test_concurrent_load_joins_existing_record(self):
+        self.client.get.return_value = self._record('other')
+
+        index_settings._join(self.client, 'service', 'lease')
+
+        self.client.index.assert_called_once_with(body={'original': ORIGINAL, 'leases': [
+            {'id': 'other', 'heartbeat': mock.ANY}, {'id': 'lease', 'heartbeat': mock.ANY}]}, version=3,
+            **self.metadata)
+        tools.assert_equal(0, self.client.indices.put_settings.call_count)
+
+    def test_join_retries_on_conflict(self):
+        self.client.get.return_value = self._record('other')
+        self.client.index.side_effect = iter([exceptions.ConflictError(409, 'conflict', {}), {}])
+
+        index_settings._join(self.client, 'service', 'lease')
+
+        tools.assert_equal(2, self.client.index.call_count)
+
+    def test_last_load_restores_original_settings(self):
+        self.client.get.return_value = self._record('lease')
+
+        index_settings._leave(self.client, 'service', 'lease')
+
+        self.client.indices.put_settings.assert_called_once_with(index='service', body={'index': ORIGINAL})
+        self.client.delete.assert_called_once_with(version=3, **self.metadata)
+
+    def test_settings_are_kept_while_other_loads_run(self):
+        self.client.get.return_value = self._record('lease', 'other')
+
+        index_settings._leave(self.client, 'service', 'lease')
+
+        tools.assert_equal(0, self.client.indices.put_settings.call_count)
+        self.client.index.assert_called_once_with(
+            body={'original': ORIGINAL, 'leases': [{'id': 'other', 'heartbeat': mock.ANY}]}, version=3,
+            **self.metadata)
+
+    def test_settings_are_tuned_again_when_a_load_joins_during_restore(self):
+        self.client.get.side_effect = iter([self._record('lease'), self._record('other')])
+        self.client.delete.side_effect = exceptions.ConflictError(409, 'conflict', {})
+
+        index_settings._leave(self.client, 'service', 'lease')
+
+        self.client.indices.put_settings.assert_has_calls([
+            mock.call(index='service', body={'index': ORIGINAL}),
+            mock.call(index='service', body={'index': {'refresh_interval': '-1'}})])
+
+    def test_abandoned_loads_are_recovered(self):
+        expired = time.time() - configuration.data.BULK_LOAD_LEASE_SECONDS - 1
+        record = self._record('crashed', heartbeat=expired)
+        self.client.search.return_value = {'hits': {'hits': [dict(record, _id='service')]}}
+        self.client.get.return_value = record
+
+        index_settings.recover_abandoned_loads(self.client)
+
+        self.client.indices.put_settings.assert_called_once_with(index='service', body={'index': ORIGINAL})
+
+    def test_recovery_without_metadata_index(self):
+        self.client.search.side_effect = exceptions.NotFoundError(404, 'IndexMissingException', {})
+
+        index_settings.recover_abandoned_loads(self.client)
+
+        tools.assert_equal(0, self.client.indices.put_settings.call_count)
+
+    @mock.patch.object(index_settings, '_leave', autospec=True)
+    @mock.patch.object(index_settings, '_join', autospec=True)
+    def test_bulk_load_restores_settings_on_failure(self, mock_join, mock_leave):
+        self.client.search.return_value = {'hits': {'hits': []}}
+        bulk_load = index_settings.BulkLoad(self.client, 'service')
+
+        with tools.assert_raises(ValueError):
+            with bulk_load:
+                raise ValueError()
+
+        mock_join.assert_called_once_with(self.client, 'service', bulk_load.lease_id)
+        mock_leave.assert_called_once_with(self.client, 'service', bulk_load.lease_id)
+
+    @mock.patch.object(os.path, 'getsize', autospec=True)
+    def test_only_large_uploads_are_tuned(self, mock_getsize):
+        mock_getsize.return_value = configuration.data.BULK_LOAD_TUNING_MIN_FILE_BYTES
+        tools.assert_is_instance(
+            index_settings.bulk_load(self.client, 'service', 'file.csv'), index_settings.BulkLoad)
+
+        mock_getsize.return_value = configuration.data.BULK_LOAD_TUNING_MIN_FILE_BYTES - 1
+        tools.assert_is_instance(
+            index_settings.bulk_load(self.client, 'service', 'file.csv'), index_settings._NoTuning)
+
+        configuration.data.BULK_LOAD_TUNING_ENABLED = False
+        mock_getsize.return_value = configuration.data.BULK_LOAD_TUNING_MIN_FILE_BYTES
+        tools.assert_is_instance(
+            index_settings.bulk_load(self.client, 'service', 'file.csv'), index_settings._NoTuning)
@@ -0,0 +1,63 @@
+import os
+import unittest
+
+import mock
+from elasticsearch import exceptions
+from nose import tools
+
+import configuration
+from app import models
+from app.services import jobs
+
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        self.client = mock.MagicMock()
+        self.metadata = dict(index=configuration.data.LIST_METADATA_INDEX, doc_type='job')
+
+    def test_create_records_pending_job(self):
+        request = models.Request(service='service', list_id='id')
+
+        job = jobs.Job.create(self.client, jobs.DELETE_LIST, request)
+
+        tools.assert_equal(job.record['status'], jobs.PENDING)
+        tools.assert_equal((job.record['service'], job.record['listId']), ('service', 'id'))
+        self.client.create.assert_called_once_with(id=job.id, body=job.record, **self.metadata)
+
+    def test_job_lifecycle_is_saved(self):
+        job = jobs.Job(self.client, {'id': 'job', 'status': jobs.PENDING})
+
+        job.start()
+        job.report_progress(total=5, remaining=2)
+        job.succeed({'acknowledged': True})
+
+        tools.assert_equal(self.client.index.call_count, 3)
+        saved = self.client.index.call_args[1]['body']
+        tools.assert_equal(saved['status'], jobs.SUCCEEDED)
+        tools.assert_equal(saved['progress'], {'total': 5, 'remaining': 2})
+        tools.assert_equal(saved['result'], {'acknowledged': True})
+        tools.assert_in('updated', saved)
+
+    def test_failed_job_records_error(self):
+        job = jobs.Job(self.client, {'id': 'job', 'status': jobs.RUNNING})
+
+        job.fail('error')
+
+        self.client.index.assert_called_once_with(id='job', body=job.record, **self.metadata)
+        tools.assert_equal((job.record['status'], job.record['error']), (jobs.FAILED, 'error'))
+
+    def test_load(self):
+        self.client.get.return_value = {'_source': {'id': 'job', 'status': jobs.RUNNING}}
+
+        job = jobs.load(self.client, 'job')
+
+        tools.assert_equal(job.record, {'id': 'job', 'status': jobs.RUNNING})
+        self.client.get.assert_called_once_with(id='job', **self.metadata)
+
+    @tools.raises(LookupError)
+    def test_load_missing_job(self):
+        self.client.get.side_effect = exceptions.NotFoundError(404, 'missing', {})
+
+        jobs.load(self.client, 'job')
@@ -0,0 +1,202 @@
+import threading
+import unittest
+
+import mock
+from nose import tools
+
+from app.services import membership
+
+
+class TestMembershipCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = membership.MembershipCache(max_bytes=10 * 1024, ttl=60)
+
+    def test_found_and_not_found_results_are_cached(self):
+        self.cache.put('service', 'list', 'member', True, 0)
+        self.cache.put('service', 'list', 'other', False, 0)
+
+        tools.assert_true(self.cache.get('service', 'list', 'member'))
+        tools.assert_false(self.cache.get('service', 'list', 'other'))
+        tools.assert_is_none(self.cache.get('service', 'list', 'unknown'))
+        tools.assert_equal(self.cache.stats(), {
+            'entries': 2, 'bytes': 2 * membership.ENTRY_OVERHEAD_BYTES + 33, 'hits': 2, 'misses': 1, 'evictions': 0})
+
+    @mock.patch.object(membership.time, 'time', autospec=True)
+    def test_entries_expire(self, mock_time):
+        mock_time.return_value = 1000
+        self.cache.put('service', 'list', 'member', True, 0)
+
+        mock_time.return_value = 1061
+
+        tools.assert_is_none(self.cache.get('service', 'list', 'member'))
+        tools.assert_equal(self.cache.stats()['entries'], 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = membership.MembershipCache(max_bytes=3 * (membership.ENTRY_OVERHEAD_BYTES + 18), ttl=60)
+        for member_id in ('member1', 'member2', 'member3'):
+            cache.put('service', 'list', member_id, True, 0)
+        cache.get('service', 'list', 'member1')
+
+        cache.put('service', 'list', 'member4', True, 0)
+
+        tools.assert_is_none(cache.get('service', 'list', 'member2'))
+        tools.assert_true(cache.get('service', 'list', 'member1'))
+        tools.assert_equal(cache.stats()['evictions'], 1)
+
+    def test_invalidate_drops_the_members_of_a_list(self):
+        self.cache.put('service', 'list', 'member', True, 0)
+        self.cache.put('service', 'other', 'member', True, 0)
+
+        self.cache.invalidate('service', 'list')
+
+        tools.assert_is_none(self.cache.get('service', 'list', 'member'))
+        tools.assert_true(self.cache.get('service', 'other', 'member'))
+
+    def test_lookup_started_before_invalidation_is_not_cached(self):
+        version = self.cache.version('service', 'list')
+        self.cache.invalidate('service', 'list')
+
+        self.cache.put('service', 'list', 'member', True, version)
+
+        tools.assert_is_none(self.cache.get('service', 'list', 'member'))
+
+    def test_disabled_cache(self):
+        cache = membership.MembershipCache(max_bytes=0, ttl=60)
+
+        cache.put('service', 'list', 'member', True, 0)
+
+        tools.assert_is_none(cache.get('service', 'list', 'member'))
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = membership.SingleFlight(timeout=5)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def _slow(self, result):
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _run_concurrently(self, result, callers=3):
+        outcomes = []
+        function = mock.Mock(side_effect=self._slow)
+
+        def call():
+            try:
+                outcomes.append(self.flights.do('key', function, result))
+            except Exception as e:
+                outcomes.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        self.started.wait(5)
+        followers = [threading.Thread(target=call) for _ in xrange(callers - 1)]
+        for follower in followers:
+            follower.start()
+        while self.flights.stats()['coalesced'] < callers - 1:
+            pass
+        self.release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+        return function, outcomes
+
+    def test_concurrent_calls_share_one_result(self):
+        function, outcomes = self._run_concurrently(True)
+
+        tools.assert_equal(function.call_count, 1)
+        tools.assert_equal(outcomes, [True, True, True])
+        tools.assert_equal(self.flights.stats(), {'inFlight': 0, 'coalesced': 2, 'timeouts': 0})
+
+    def test_concurrent_calls_share_the_error(self):
+        error = ValueError()
+        function, outcomes = self._run_concurrently(error)
+
+        tools.assert_equal(function.call_count, 1)
+        tools.assert_equal(outcomes, [error, error, error])
+
+    def test_sequential_calls_are_not_coalesced(self):
+        function = mock.Mock(side_effect=iter([True, False]))
+
+        tools.assert_true(self.flights.do('key', function))
+        tools.assert_false(self.flights.do('key', function))
+        tools.assert_equal(function.call_count, 2)
+
+    def test_waiting_caller_times_out_and_calls_itself(self):
+        flights = membership.SingleFlight(timeout=0)
+        flights._flights['key'] = membership._Flight()
+
+        tools.assert_true(flights.do('key', mock.Mock(return_value=True)))
+        tools.assert_equal(flights.stats()['timeouts'], 1)
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def _submit_concurrently(self, batcher, keys):
+        outcomes = {}
+
+        def submit(key):
+            try:
+                outcomes[key] = batcher.submit(key)
+            except Exception as e:
+                outcomes[key] = e
+
+        threads = [threading.Thread(target=submit, args=(key,)) for key in keys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_lookups_within_the_window_are_fetched_together(self):
+        fetch = mock.Mock(side_effect=lambda keys: dict((key, key == 'a') for key in keys))
+        batcher = membership.MicroBatcher(fetch, window=0.5, max_size=3)
+
+        outcomes = self._submit_concurrently(batcher, ['a', 'b', 'c'])
+
+        tools.assert_equal(outcomes, {'a': True, 'b': False, 'c': False})
+        fetch.assert_called_once_with(mock.ANY)
+        tools.assert_equal(sorted(fetch.call_args[0][0]), ['a', 'b', 'c'])
+        tools.assert_equal(batcher.stats()['batches'], 1)
+        tools.assert_equal(batcher.stats()['maxBatchSize'], 3)
+
+    def test_full_batch_is_fetched_without_waiting_for_the_window(self):
+        fetch = mock.Mock(side_effect=lambda keys: dict((key, True) for key in keys))
+        batcher = membership.MicroBatcher(fetch, window=5, max_size=2)
+
+        self._submit_concurrently(batcher, ['a', 'b'])
+
+        tools.assert_less(batcher.stats()['maxQueueDelayMs'], 5000)
+        tools.assert_equal(fetch.call_count, 1)
+
+    def test_fetch_error_is_raised_to_every_caller(self):
+        error = ValueError()
+        batcher = membership.MicroBatcher(mock.Mock(side_effect=error), window=0.5, max_size=2)
+
+        outcomes = self._submit_concurrently(batcher, ['a', 'b'])
+
+        tools.assert_equal(outcomes, {'a': error, 'b': error})
+
+    def test_single_lookup_is_fetched_after_the_window(self):
+        fetch = mock.Mock(return_value={'a': True})
+        batcher = membership.MicroBatcher(fetch, window=0, max_size=100)
+
+        tools.assert_true(batcher.submit('a'))
+        fetch.assert_called_once_with(['a'])
+
+    @mock.patch.object(membership.clients, 'get_client', autospec=True)
+    def test_fetch_members(self, mock_get_client):
+        mock_get_client.return_value.mget.return_value = {'docs': [
+            {'_id': '1', 'found': True}, {'_id': '2', 'found': False}, {'_id': '3', 'error': 'IndexMissingException'}]}
+        keys = [('service', 'list', '1'), ('service', 'list', '2'), ('missing', 'list', '3')]
+
+        tools.assert_equal(membership._fetch_members(keys), dict(zip(keys, [True, False, False])))
+        mock_get_client.return_value.mget.assert_called_once_with(body={'docs': [
+            {'_index': 'service', '_type': 'list', '_id': '1'},
+            {'_index': 'service', '_type': 'list', '_id': '2'},
+            {'_index': 'missing', '_type': 'list', '_id': '3'}]}, _source=False)
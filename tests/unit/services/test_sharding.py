@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from nose import tools
+
+import configuration
+from app.services import readers, sharding
+
+
+class TestSharding(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        configuration.data.INGESTION_SHARD_COUNT = 4
+        configuration.data.INGESTION_SHARDING_MIN_FILE_BYTES = 10
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as descriptor:
+            descriptor.write(content)
+        return path
+
+    def test_byte_ranges_start_at_line_boundaries_and_cover_the_file(self):
+        content = ''.join('{}\n'.format(account) for account in xrange(1000, 1100))
+        file_path = self._write('accounts.csv', content)
+
+        ranges = sharding.byte_ranges(file_path, 4)
+
+        tools.assert_equal(len(ranges), 4)
+        tools.assert_equal(ranges[0][0], 0)
+        tools.assert_equal(ranges[-1][1], len(content))
+        for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+            tools.assert_equal(end, start)
+            tools.assert_equal(content[start - 1], '\n')
+
+    def test_byte_ranges_rows_are_read_exactly_once(self):
+        accounts = [str(account) for account in xrange(1000, 1100)]
+        file_path = self._write('accounts.csv', '\r\n'.join(accounts) + '\r\n')
+
+        rows = []
+        for start, end in sharding.byte_ranges(file_path, 3):
+            reader = readers.MappedCsvReader(file_path, start, end)
+            rows.extend(reader.get_rows())
+            reader.close()
+
+        tools.assert_equal(rows, accounts)
+
+    def test_byte_ranges_of_a_small_file_has_fewer_shards(self):
+        file_path = self._write('accounts.csv', '1234567890\n')
+
+        tools.assert_equal(sharding.byte_ranges(file_path, 4), [(0, 11)])
+
+    def test_should_shard_large_csv_file(self):
+        file_path = self._write('accounts.csv', '12345\n67890\n')
+
+        tools.assert_true(sharding.should_shard(file_path))
+
+    def test_should_not_shard_when_disabled(self):
+        configuration.data.INGESTION_SHARD_COUNT = 1
+        file_path = self._write('accounts.csv', '12345\n67890\n')
+
+        tools.assert_false(sharding.should_shard(file_path))
+
+    def test_should_not_shard_small_file(self):
+        file_path = self._write('accounts.csv', '1\n2\n')
+
+        tools.assert_false(sharding.should_shard(file_path))
+
+    def test_should_not_shard_excel_file(self):
+        file_path = self._write('accounts.xlsx', '12345\n67890\n')
+
+        tools.assert_false(sharding.should_shard(file_path))
+
+    def test_should_not_shard_file_with_carriage_return_line_endings(self):
+        file_path = self._write('accounts.csv', '12345\r67890\r')
+
+        tools.assert_false(sharding.should_shard(file_path))
+
+    def test_should_not_shard_missing_file(self):
+        tools.assert_false(sharding.should_shard(os.path.join(self.directory, 'missing.csv')))
+
+    @mock.patch.object(sharding.multiprocessing, 'Pool', autospec=True)
+    def test_index_shards(self, mock_pool):
+        file_path = self._write('accounts.csv', ''.join('{}\n'.format(account) for account in xrange(1000, 1100)))
+        dead_letter_path = file_path + '.failed'
+        self._write('accounts.csv.failed.0', '{"_id": "1000"}\n')
+        self._write('accounts.csv.failed.2', '{"_id": "1050"}\n')
+        mock_pool.return_value.map.return_value = [(24, 1), (25, 0), (24, 1), (25, 0)]
+
+        result = sharding.index_shards(
+            file_path, action='index', index='service', doc_type='id', dead_letter_path=dead_letter_path)
+
+        tools.assert_equal(result, (98, 2))
+        mock_pool.assert_called_once_with(4)
+        arguments = mock_pool.return_value.map.call_args[0][1]
+        tools.assert_equal([argument[-1] for argument in arguments],
+                           ['{}.{}'.format(dead_letter_path, shard) for shard in xrange(4)])
+        with open(dead_letter_path) as descriptor:
+            tools.assert_equal(descriptor.read(), '{"_id": "1000"}\n{"_id": "1050"}\n')
+        tools.assert_false(os.path.exists(dead_letter_path + '.0'))
+        tools.assert_false(os.path.exists(dead_letter_path + '.2'))
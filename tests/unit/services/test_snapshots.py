@@ -0,0 +1,87 @@
+import shutil
+import tempfile
+import unittest
+
+from nose import tools
+
+from app.services import bloom, snapshots
+
+
+class TestSnapshotStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = snapshots.SnapshotStore(self.directory, run_size=2, false_positive_rate=0.01)
+
+    def _read(self, snapshot_format):
+        snapshot, etag = self.store.get('service', 'list', snapshot_format)
+        with snapshot:
+            return snapshot.read(), etag
+
+    def test_type_without_snapshot(self):
+        tools.assert_is_none(self.store.get('service', 'list', snapshots.SORTED))
+
+    def test_sorted_snapshot(self):
+        self.store.build('service', 'list', iter([u'123', u'12', u'9', u'12', u'caf\xe9']))
+
+        data, etag = self._read(snapshots.SORTED)
+
+        header = snapshots.SORTED_HEADER.unpack(data[:snapshots.SORTED_HEADER.size])
+        tools.assert_equal(header, ('LLSS', snapshots.FORMAT_VERSION, 5, 4))
+        tools.assert_equal(data[snapshots.SORTED_HEADER.size:],
+                           '12\0\0\0' '123\0\0' '9\0\0\0\0' + u'caf\xe9'.encode('utf-8'))
+        tools.assert_equal(len(etag), 32)
+
+    def test_bloom_snapshot(self):
+        self.store.build('service', 'list', iter(['member', 'other']))
+
+        data, _ = self._read(snapshots.BLOOM)
+
+        magic, version, hash_count, bit_count, count = snapshots.BLOOM_HEADER.unpack(
+            data[:snapshots.BLOOM_HEADER.size])
+        tools.assert_equal((magic, version, count), ('LLSB', snapshots.FORMAT_VERSION, 2))
+        bloom_filter = bloom.BloomFilter(bit_count, hash_count, bytearray(data[snapshots.BLOOM_HEADER.size:]))
+        tools.assert_in('member', bloom_filter)
+        tools.assert_in('other', bloom_filter)
+
+    def test_rebuild_with_other_members_changes_etag(self):
+        self.store.build('service', 'list', iter(['member']))
+        _, etag = self._read(snapshots.SORTED)
+
+        self.store.build('service', 'list', iter(['member', 'other']))
+
+        tools.assert_not_equal(self._read(snapshots.SORTED)[1], etag)
+
+    def test_invalidate_removes_snapshots(self):
+        self.store.build('service', 'list', iter(['member']))
+
+        self.store.invalidate('service', 'list')
+
+        tools.assert_is_none(self.store.get('service', 'list', snapshots.SORTED))
+        tools.assert_is_none(self.store.get('service', 'list', snapshots.BLOOM))
+
+    def test_build_is_claimed_once(self):
+        tools.assert_true(self.store.claim_build('service', 'list'))
+        tools.assert_false(self.store.claim_build('service', 'list'))
+
+        self.store.build('service', 'list', iter(['member']))
+
+        tools.assert_true(self.store.claim_build('service', 'list'))
+
+    def test_claim_of_invalidated_version_or_expired_claim_is_ignored(self):
+        self.store.claim_build('service', 'list')
+        self.store.invalidate('service', 'list')
+        tools.assert_true(self.store.claim_build('service', 'list'))
+
+        self.store.build_timeout = 0
+        tools.assert_true(self.store.claim_build('service', 'list'))
+
+    def test_build_started_before_invalidation_is_dropped(self):
+        def members():
+            yield 'member'
+            self.store.invalidate('service', 'list')
+
+        self.store.build('service', 'list', members())
+
+        tools.assert_is_none(self.store.get('service', 'list', snapshots.SORTED))
@@ -0,0 +1,93 @@
+import os
+import unittest
+
+import mock
+from liblcp import context
+from nose import tools
+
+import configuration
+from app import exceptions
+from app.services import workers
+
+
+def job(value):
+    return value
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+
+    def setUp(self):
+        self.headers = {context.HEADERS_CORRELATION_ID: 'cid'}
+        self.pool = workers.WorkerPool(processes=2, max_pending=2)
+
+    @mock.patch.object(context, 'get_headers', autospec=True)
+    @mock.patch.object(workers, '_NonDaemonicPool', autospec=True)
+    def test_submit_schedules_job_with_request_headers(self, mock_pool, mock_get_headers):
+        mock_get_headers.return_value = self.headers
+
+        result = self.pool.submit(job, 'value')
+
+        mock_pool.assert_called_once_with(2, maxtasksperchild=None)
+        mock_pool.return_value.apply_async.assert_called_once_with(
+            workers._execute, (job, self.headers, 'value'), callback=None)
+        tools.assert_equal(mock_pool.return_value.apply_async.return_value, result)
+
+    @mock.patch.object(context, 'get_headers', autospec=True)
+    @mock.patch.object(workers, '_NonDaemonicPool', autospec=True)
+    def test_submit_rejects_jobs_when_full(self, mock_pool, mock_get_headers):
+        mock_pool.return_value.apply_async.return_value.ready.return_value = False
+        self.pool.submit(job, 1)
+        self.pool.submit(job, 2)
+
+        with tools.assert_raises(exceptions.WorkerPoolFullError):
+            self.pool.submit(job, 3)
+        tools.assert_equal(2, mock_pool.return_value.apply_async.call_count)
+
+    @mock.patch.object(context, 'get_headers', autospec=True)
+    @mock.patch.object(workers, '_NonDaemonicPool', autospec=True)
+    def test_finished_jobs_are_reaped(self, mock_pool, mock_get_headers):
+        mock_pool.return_value.apply_async.return_value.ready.return_value = False
+        self.pool.submit(job, 1)
+        self.pool.submit(job, 2)
+        tools.assert_equal(2, self.pool.pending_count)
+
+        mock_pool.return_value.apply_async.return_value.ready.return_value = True
+
+        tools.assert_equal(0, self.pool.pending_count)
+        self.pool.submit(job, 3)
+
+    @mock.patch.object(os, 'getpid', autospec=True)
+    @mock.patch.object(workers, '_NonDaemonicPool', autospec=True)
+    def test_pool_is_rebuilt_after_fork(self, mock_pool, mock_getpid):
+        mock_getpid.return_value = 1
+        self.pool.start()
+        mock_getpid.return_value = 2
+        self.pool.start()
+
+        tools.assert_equal(2, mock_pool.call_count)
+
+    @mock.patch.object(context, 'set_headers_getter', autospec=True)
+    def test_execute_installs_request_headers(self, mock_set_headers_getter):
+        tools.assert_equal('value', workers._execute(job, self.headers, 'value'))
+
+        headers_getter = mock_set_headers_getter.call_args[0][0]
+        tools.assert_equal('cid', headers_getter(context.HEADERS_CORRELATION_ID))
+
+    def test_ingestion_pool_is_configured(self):
+        workers._ingestion_pool = None
+
+        pool = workers.ingestion_pool()
+
+        tools.assert_equal(configuration.data.INGESTION_WORKER_COUNT, pool.processes)
+        tools.assert_equal(configuration.data.INGESTION_QUEUE_MAX_SIZE, pool.max_pending)
+        tools.assert_is(pool, workers.ingestion_pool())
+
+    def test_pool_workers_may_start_processes(self):
+        process = workers._NonDaemonicProcess()
+        process.daemon = True
+
+        tools.assert_false(process.daemon)
@@ -0,0 +1,108 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+import openpyxl
+from nose import tools
+
+import configuration
+from app.services import readers, xlsx
+
+
+class TestXlsxWorkbook(unittest.TestCase):
+
+    def setUp(self):
+        configuration.configure_from(os.path.join(configuration.CONFIGURATION_PATH, 'list_loading_service.cfg'))
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'id.xlsx')
+
+        workbook = openpyxl.Workbook()
+        values = workbook.active
+        values.title = 'values'
+        values['A1'] = u'header'
+        values['B1'] = 'second column'
+        values['A2'] = 12345
+        values['A3'] = 1.5
+        values['A4'] = datetime.datetime(2016, 7, 13)
+        values['A5'] = True
+        values['B6'] = 'no first column'
+        values['A8'] = '=SUM(B1:B2)'
+        values['A9'] = u'\xe9t\xe9 <&>'
+        values['A10'] = '0012345678901234'
+        accounts = workbook.create_sheet('accounts')
+        for row in xrange(1, 500):
+            accounts.cell(row=row, column=1, value='{:016d}'.format(row))
+            accounts.cell(row=row, column=2, value=row)
+        workbook.active = 1
+        workbook.save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _openpyxl_rows(self, sheet_name):
+        workbook = openpyxl.load_workbook(self.path, read_only=True)
+        return [row[0].value for row in workbook.get_sheet_by_name(sheet_name).rows]
+
+    def test_reads_sheets(self):
+        workbook = xlsx.Workbook(self.path)
+
+        tools.assert_equal(workbook.sheets.keys(), ['values', 'accounts'])
+        tools.assert_equal(workbook.active_sheet, 'accounts')
+
+    def test_first_column_matches_openpyxl(self):
+        workbook = xlsx.Workbook(self.path)
+
+        for sheet_name in ('values', 'accounts'):
+            tools.assert_equal(sum(workbook.first_column(sheet_name), []), self._openpyxl_rows(sheet_name))
+
+    def test_first_column_of_the_active_sheet(self):
+        workbook = xlsx.Workbook(self.path)
+
+        tools.assert_equal(sum(workbook.first_column(), []), self._openpyxl_rows('accounts'))
+
+    @mock.patch.object(xlsx, 'BLOCK_BYTES', 512)
+    def test_first_column_parsed_in_blocks(self):
+        workbook = xlsx.Workbook(self.path)
+
+        batches = list(workbook.first_column())
+
+        tools.assert_greater(len(batches), 1)
+        tools.assert_equal(sum(batches, []), self._openpyxl_rows('accounts'))
+
+    @mock.patch.object(xlsx, 'BLOCK_BYTES', 512)
+    def test_first_column_parsed_in_parallel(self):
+        workbook = xlsx.Workbook(self.path, process_count=2)
+
+        tools.assert_equal(sum(workbook.first_column(), []), self._openpyxl_rows('accounts'))
+
+    @mock.patch.object(xlsx.process_pool, 'Pool', autospec=True)
+    def test_small_sheets_are_not_parsed_in_parallel(self, mock_pool):
+        workbook = xlsx.Workbook(self.path, process_count=2, parallel_min_bytes=1024 * 1024)
+
+        tools.assert_equal(sum(workbook.first_column(), []), self._openpyxl_rows('accounts'))
+        tools.assert_false(mock_pool.called)
+
+    def test_reader_produces_the_same_rows_as_excel_reader(self):
+        tools.assert_equal(list(readers.XlsxReader(self.path).get_rows()),
+                           list(readers.ExcelReader(self.path).get_rows()))
+
+    def test_reader_reads_the_given_sheets(self):
+        reader = readers.XlsxReader(self.path, sheet_names=['values', 'accounts'])
+
+        tools.assert_equal(list(reader.get_rows()), self._openpyxl_rows('values') + self._openpyxl_rows('accounts'))
+        reader.close()
+
+    def test_reader_returns_if_exceeds_allowed_count(self):
+        reader = readers.XlsxReader(self.path)
+
+        tools.assert_true(reader.exceeds_allowed_row_count(max_limit_count=498))
+        tools.assert_false(reader.exceeds_allowed_row_count(max_limit_count=499))
+        tools.assert_equal(len(list(reader.get_rows())), 499)
+
+    def test_reader_reads_sample_file(self):
+        sample = os.path.join(os.path.dirname(__file__), '..', '..', 'samples', 'accounts_list.xlsx')
+
+        tools.assert_equal(list(readers.XlsxReader(sample).get_rows()), list(readers.ExcelReader(sample).get_rows()))